@@ -0,0 +1,897 @@
+import argparse
+import asyncio
+import bz2
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import http.server
+import io
+import json
+import lzma
+import mmap
+import multiprocessing
+import os
+import resource
+import struct
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import types
+import zipfile
+import zlib
+
+import stream_unzip as stream_unzip_module
+from stream_unzip import async_stream_unzip, deflate_index, http_range_chunks, parallel_stream_unzip, stream_unzip, unzip_from_deflate_index
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+
+def get_zip_bytes(method, contents):
+    file = io.BytesIO()
+    with zipfile.ZipFile(file, 'w', method) as zf:
+        zf.writestr('first.bin', contents)
+    return file.getvalue()
+
+
+def get_compressible_contents(size):
+    # Repetitive, but not so repetitive that the compressors make it trivially small
+    line = b''.join(b'%08d,some,text,that,repeats\n' % i for i in range(0, 4096))
+    return (line * (size // len(line) + 1))[:size]
+
+
+def split(zip_bytes, input_size):
+    # Split before running so the cost of splitting isn't counted
+    return [zip_bytes[i:i + input_size] for i in range(0, len(zip_bytes), input_size)]
+
+
+class _CountingDecompressor:
+    def __init__(self, dobj, counts):
+        self._dobj = dobj
+        self._counts = counts
+
+    def decompress(self, data, *args):
+        # A `bytes` instance that isn't one of the input chunks must have been copied from them
+        if type(data) is bytes and id(data) not in self._counts['input_ids']:
+            self._counts['copied'] += len(data)
+        uncompressed = self._dobj.decompress(data, *args)
+        # zlib copies input it didn't consume to unconsumed_tail, whether or not it's passed back in
+        if getattr(self._dobj, 'unconsumed_tail', None) and self._dobj.unconsumed_tail is not data:
+            self._counts['copied_to_tail'] += len(self._dobj.unconsumed_tail)
+        return uncompressed
+
+    def __getattr__(self, name):
+        return getattr(self._dobj, name)
+
+
+@contextlib.contextmanager
+def counting_copies_to_decompressors(input_chunks):
+    # Counts the bytes that are passed to zlib and bz2 as copies rather than as the input chunks
+    # themselves or views of them. Deflate goes through stream_unzip's _zlib, which is zlib-ng if
+    # it's installed, so that's what's patched, and bench_copies checks the patched decompressors
+    # were actually used
+    counts = {'copied': 0, 'copied_to_tail': 0, 'decompressors': 0, 'input_ids': set(id(chunk) for chunk in input_chunks)}
+    original_zlib = stream_unzip_module._zlib
+    original_bz2 = stream_unzip_module.bz2
+
+    def counting(get_dobj):
+        def _counting(*args, **kwargs):
+            counts['decompressors'] += 1
+            return _CountingDecompressor(get_dobj(*args, **kwargs), counts)
+        return _counting
+
+    stream_unzip_module._zlib = types.SimpleNamespace(**{
+        **vars(original_zlib),
+        'decompressobj': counting(original_zlib.decompressobj),
+    })
+    stream_unzip_module.bz2 = types.SimpleNamespace(**{
+        **vars(bz2),
+        'BZ2Decompressor': counting(bz2.BZ2Decompressor),
+    })
+    try:
+        yield counts
+    finally:
+        stream_unzip_module._zlib = original_zlib
+        stream_unzip_module.bz2 = original_bz2
+
+
+def unzip_all(input_chunks, **kwargs):
+    num_out = 0
+    for _, _, chunks in stream_unzip(input_chunks, **kwargs):
+        for chunk in chunks:
+            num_out += len(chunk)
+    return num_out
+
+
+def bench_copies(method, contents, input_size, chunk_size):
+    zip_bytes = get_zip_bytes(method, contents)
+    input_chunks = split(zip_bytes, input_size)
+
+    start = time.perf_counter()
+    num_out = unzip_all(input_chunks, chunk_size=chunk_size)
+    end = time.perf_counter()
+
+    with counting_copies_to_decompressors(input_chunks) as counts:
+        unzip_all(input_chunks, chunk_size=chunk_size)
+    if not counts['decompressors']:
+        raise RuntimeError('The decompressors were not patched to count copies')
+
+    return {
+        'input MB/s': round(len(zip_bytes) / (end - start) / 1_000_000, 1),
+        'output MB/s': round(num_out / (end - start) / 1_000_000, 1),
+        'bytes copied per input byte': round(counts['copied'] / len(zip_bytes), 3),
+        'bytes copied to unconsumed_tail per input byte': round(counts['copied_to_tail'] / len(zip_bytes), 3),
+    }
+
+
+def bench_skip(skip, contents_size, input_size, chunk_size):
+    # All but the last of 16 members are unwanted
+    file = io.BytesIO()
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(0, 16):
+            zf.writestr(f'{i}.bin', get_compressible_contents(contents_size // 16))
+    input_chunks = split(file.getvalue(), input_size)
+
+    start = time.perf_counter()
+    num_out = 0
+    for name, _, chunks in skip(input_chunks, chunk_size):
+        for chunk in chunks:
+            if name == b'15.bin':
+                num_out += len(chunk)
+    end = time.perf_counter()
+
+    return {
+        'seconds': round(end - start, 3),
+        'wanted output MB/s': round(num_out / (end - start) / 1_000_000, 1),
+    }
+
+
+def bench_parallel(unzip, contents_size, chunk_size):
+    # 16 members, each of which can be unzipped independently
+    file = io.BytesIO()
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(0, 16):
+            zf.writestr(f'{i}.bin', get_compressible_contents(contents_size // 16))
+    zip_bytes = file.getvalue()
+
+    start = time.perf_counter()
+    num_out = 0
+    for _, _, chunks in unzip(zip_bytes, chunk_size):
+        for chunk in chunks:
+            num_out += len(chunk)
+    end = time.perf_counter()
+
+    return {
+        'output MB/s': round(num_out / (end - start) / 1_000_000, 1),
+    }
+
+
+def bench_member_files(on_member, num_members, chunk_size):
+    # Many small members, so the per-member cost of on_member isn't hidden by decompressing
+    file = io.BytesIO()
+    with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for i in range(0, num_members):
+            zf.writestr(f'{i}.bin', get_compressible_contents(100))
+    zip_bytes = file.getvalue()
+
+    start = time.perf_counter()
+    for _, _, chunks in stream_unzip((zip_bytes,), chunk_size=chunk_size, on_member=on_member):
+        for chunk in chunks:
+            pass
+    end = time.perf_counter()
+
+    return {
+        'members/s': round(num_members / (end - start)),
+    }
+
+
+def bench_source(method, source, contents_size, chunk_size, **kwargs):
+    with tempfile.TemporaryFile() as f:
+        with zipfile.ZipFile(f, 'w', method) as zf:
+            zf.writestr('first.bin', get_compressible_contents(contents_size))
+        f.flush()
+        f.seek(0)
+
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        with source(f) as zip_source:
+            num_out = unzip_all(zip_source, chunk_size=chunk_size, **kwargs)
+        end_cpu = time.process_time()
+        end = time.perf_counter()
+
+    return {
+        'output MB/s': round(num_out / (end - start) / 1_000_000, 1),
+        'CPU seconds': round(end_cpu - start_cpu, 2),
+    }
+
+
+def bench_read_ahead(read_ahead_bytes, contents_size, input_size, chunk_size, source_mb_per_second):
+    # A source like a network stream, that takes time to deliver each chunk without using the CPU
+    zip_bytes = get_zip_bytes(zipfile.ZIP_DEFLATED, get_compressible_contents(contents_size))
+    input_chunks = split(zip_bytes, input_size)
+    seconds_per_chunk = input_size / (source_mb_per_second * 1_000_000)
+
+    def slow_input_chunks():
+        for chunk in input_chunks:
+            time.sleep(seconds_per_chunk)
+            yield chunk
+
+    max_buffered_bytes = 0
+    wait_seconds = 0.0
+
+    def observer(event, details):
+        nonlocal max_buffered_bytes, wait_seconds
+        if event == 'read_ahead':
+            max_buffered_bytes = max(max_buffered_bytes, details['buffered_bytes'])
+            wait_seconds += details['wait_seconds']
+
+    start = time.perf_counter()
+    num_out = unzip_all(slow_input_chunks(), chunk_size=chunk_size, read_ahead_bytes=read_ahead_bytes, observer=observer)
+    end = time.perf_counter()
+
+    return {
+        'output MB/s': round(num_out / (end - start) / 1_000_000, 1),
+        'seconds': round(end - start, 3),
+        'seconds waiting for read ahead': round(wait_seconds, 3),
+        'max bytes read ahead': max_buffered_bytes,
+    }
+
+
+def bench_http_range(max_connections, contents_size, range_size, connection_mb_per_second):
+    # A local server where each connection is limited to a rate, like a single TCP stream over a
+    # long distance, but there's no limit on the total rate
+    zip_bytes = get_zip_bytes(zipfile.ZIP_DEFLATED, get_compressible_contents(contents_size))
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            start, end = (int(value) for value in self.headers['Range'][len('bytes='):].split('-'))
+            end = min(end, len(zip_bytes) - 1)
+            time.sleep((end + 1 - start) / (connection_mb_per_second * 1_000_000))
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(zip_bytes)}')
+            self.send_header('Content-Length', str(end + 1 - start))
+            self.end_headers()
+            self.wfile.write(zip_bytes[start:end + 1])
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.start()
+    try:
+        url = f'http://127.0.0.1:{server.server_address[1]}/archive.zip'
+        start = time.perf_counter()
+        num_out = unzip_all(http_range_chunks(url, range_size=range_size, max_connections=max_connections))
+        end = time.perf_counter()
+    finally:
+        server.shutdown()
+        server.server_close()
+        server_thread.join()
+
+    return {
+        'input MB/s': round(len(zip_bytes) / (end - start) / 1_000_000, 1),
+        'output MB/s': round(num_out / (end - start) / 1_000_000, 1),
+    }
+
+
+def bench_deflate_index(spacing, contents_size, chunk_size):
+    # Reading the last KB of a member with an index, compared to unzipping all of it
+    zip_bytes = get_zip_bytes(zipfile.ZIP_DEFLATED, get_compressible_contents(contents_size))
+
+    start = time.perf_counter()
+    unzip_all(split(zip_bytes, chunk_size), chunk_size=chunk_size)
+    unzip_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = deflate_index(zip_bytes, b'first.bin', spacing=spacing, chunk_size=chunk_size)
+    index_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in unzip_from_deflate_index(zip_bytes, index, contents_size - 1000, chunk_size=chunk_size):
+        pass
+    tail_seconds = time.perf_counter() - start
+
+    return {
+        'unzip seconds': round(unzip_seconds, 3),
+        'index seconds': round(index_seconds, 3),
+        'index KB': round(len(index) / 1000, 1),
+        'last KB ms': round(tail_seconds * 1000, 2),
+    }
+
+
+def bench_crc32(crc32, contents_size, chunk_size):
+    # For stored members the CRC-32 is the only real CPU work, so the rate of unzipping them should
+    # be close to the rate of just reading the file
+    with tempfile.TemporaryFile() as f:
+        with zipfile.ZipFile(f, 'w', zipfile.ZIP_STORED) as zf:
+            zf.writestr('first.bin', get_compressible_contents(contents_size))
+        f.flush()
+
+        f.seek(0)
+        start = time.perf_counter()
+        num_read = sum(len(chunk) for chunk in iter(lambda: f.read(chunk_size), b''))
+        end = time.perf_counter()
+        read_seconds = end - start
+
+        f.seek(0)
+        original_crc32 = stream_unzip_module._crc32
+        stream_unzip_module._crc32 = crc32
+        try:
+            start = time.perf_counter()
+            num_out = unzip_all(iter(lambda: f.read(chunk_size), b''), chunk_size=chunk_size)
+            end = time.perf_counter()
+        finally:
+            stream_unzip_module._crc32 = original_crc32
+        unzip_seconds = end - start
+
+    return {
+        'read MB/s': round(num_read / read_seconds / 1_000_000, 1),
+        'output MB/s': round(num_out / unzip_seconds / 1_000_000, 1),
+    }
+
+
+def get_crc32_implementations():
+    implementations = [('zlib', zlib.crc32)]
+    try:
+        from zlib_ng import zlib_ng
+    except ImportError:
+        pass
+    else:
+        implementations.append(('zlib-ng', zlib_ng.crc32))
+    try:
+        from stream_unzip._zipcrypto import crc32
+    except ImportError:
+        pass
+    else:
+        implementations.append(('native', crc32))
+    return implementations
+
+
+async def thread_bridge_async_stream_unzip(chunks, **kwargs):
+    # How async_stream_unzip used to work, to compare against: every input chunk and every output
+    # item is passed between the event loop and a thread running the synchronous stream_unzip
+    loop = asyncio.get_running_loop()
+
+    async def to_async_iterable(sync_iterable):
+        done = object()
+        it = iter(sync_iterable)
+        while True:
+            value = await loop.run_in_executor(None, contextvars.copy_context().run, next, it, done)
+            if value is done:
+                break
+            yield value
+
+    def to_sync_iterable(async_iterable):
+        async_it = async_iterable.__aiter__()
+        while True:
+            try:
+                value = asyncio.run_coroutine_threadsafe(async_it.__anext__(), loop).result()
+            except StopAsyncIteration:
+                break
+            yield value
+
+    async for name, size, chunks in to_async_iterable(stream_unzip(to_sync_iterable(chunks), **kwargs)):
+        yield name, size, to_async_iterable(chunks)
+
+
+def bench_async(unzip, concurrency, contents_size, input_size, chunk_size):
+    zip_bytes = get_zip_bytes(zipfile.ZIP_DEFLATED, get_compressible_contents(contents_size))
+    input_chunks = split(zip_bytes, input_size)
+
+    async def async_input_chunks():
+        for chunk in input_chunks:
+            yield chunk
+            await asyncio.sleep(0)
+
+    async def unzip_one():
+        num_out = 0
+        async for _, _, chunks in unzip(async_input_chunks(), chunk_size=chunk_size):
+            async for chunk in chunks:
+                num_out += len(chunk)
+        return num_out
+
+    async def unzip_all_concurrently():
+        return sum(await asyncio.gather(*(unzip_one() for _ in range(0, concurrency))))
+
+    start = time.perf_counter()
+    start_cpu = time.process_time()
+    num_out = asyncio.run(unzip_all_concurrently())
+    end_cpu = time.process_time()
+    end = time.perf_counter()
+
+    return {
+        'output MB/s': round(num_out / (end - start) / 1_000_000, 1),
+        'CPU seconds': round(end_cpu - start_cpu, 2),
+    }
+
+
+def _get_crc_table():
+    table = []
+    for i in range(0, 256):
+        crc = i
+        for _ in range(0, 8):
+            crc = (crc >> 1) ^ 0xEDB88320 if crc & 1 else crc >> 1
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _get_crc_table()
+
+
+def zipcrypto_encrypt(password, data):
+    # Slow, but only used while building archives, which isn't timed
+    crc_table = _CRC_TABLE
+    key_0, key_1, key_2 = 305419896, 591751049, 878082192
+
+    def update_keys(byte):
+        nonlocal key_0, key_1, key_2
+        key_0 = (key_0 >> 8) ^ crc_table[(key_0 ^ byte) & 0xFF]
+        key_1 = ((key_1 + (key_0 & 0xFF)) * 134775813 + 1) & 0xFFFFFFFF
+        key_2 = (key_2 >> 8) ^ crc_table[(key_2 ^ (key_1 >> 24)) & 0xFF]
+
+    for byte in password:
+        update_keys(byte)
+
+    encrypted = bytearray(len(data))
+    for i, byte in enumerate(data):
+        k = key_2 | 2
+        encrypted[i] = byte ^ (((k * (k ^ 1)) >> 8) & 0xFF)
+        update_keys(byte)
+    return bytes(encrypted)
+
+
+def aes_encrypt(password, data, key_length):
+    from Crypto.Cipher import AES
+    from Crypto.Hash import HMAC, SHA1
+    from Crypto.Protocol.KDF import PBKDF2
+    from Crypto.Util import Counter
+
+    salt = os.urandom(key_length // 2)
+    keys = PBKDF2(password, salt, 2 * key_length + 2, 1000)
+    encrypted = AES.new(keys[:key_length], AES.MODE_CTR, counter=Counter.new(nbits=128, little_endian=True)).encrypt(data)
+    hmac = HMAC.new(keys[key_length:2 * key_length], encrypted, digestmod=SHA1).digest()[:10]
+    return salt + keys[-2:] + encrypted + hmac
+
+
+def compress(method, contents):
+    if method == 0:
+        return contents
+    if method == 8:
+        compress_obj = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        return compress_obj.compress(contents) + compress_obj.flush()
+    if method == 9:
+        # Neither Python nor zlib can write Deflate64. But a Deflate stream that has only literals,
+        # and so no back-references, is also a valid Deflate64 stream
+        compress_obj = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS, 9, zlib.Z_HUFFMAN_ONLY)
+        return compress_obj.compress(contents) + compress_obj.flush()
+    if method == 12:
+        return bz2.compress(contents)
+    if method == 14:
+        # The LZMA SDK version and properties size, then the properties: lc=3, lp=0 and pb=2 packed
+        # into one byte, then the dictionary size. Python always writes an end of stream marker
+        filters = [{'id': lzma.FILTER_LZMA1, 'lc': 3, 'lp': 0, 'pb': 2, 'dict_size': 8 * 1024 * 1024}]
+        return b'\x09\x14\x05\x00\x5d' + struct.pack('<I', 8 * 1024 * 1024) + lzma.compress(contents, lzma.FORMAT_RAW, filters=filters)
+    if method == 93:
+        return zstd.compress(contents)
+    if method == 95:
+        return lzma.compress(contents)
+    raise ValueError(method)
+
+
+METHODS = {
+    'stored': 0, 'deflate': 8, 'deflate64': 9, 'bzip2': 12, 'lzma': 14, 'xz': 95,
+    **({'zstd': 93} if zstd is not None else {}),
+}
+
+ENCRYPTIONS = {
+    'none': None,
+    'zipcrypto': ('zipcrypto',),
+    **{
+        f'ae{version}-{key_length * 8}': ('aes', version, key_length, strength)
+        for version in (1, 2)
+        for strength, key_length in ((1, 16), (2, 24), (3, 32))
+    },
+}
+
+
+def build_zip(files, method, encryption=None, password=b'password', zip64=False, data_descriptor=False):
+    # Python's zipfile module can't write Deflate64, bzip2 with a data descriptor, ZipCrypto, or
+    # AES, so this is a minimal ZIP writer that can write all the variations that stream-unzip
+    # can read. It only needs to be correct, not fast
+    local_header_struct = struct.Struct('<4sHHHHHIIIHH')
+    central_header_struct = struct.Struct('<4sHHHHHHIIIHHHHHII')
+    version = 45 if zip64 else 20
+    mod_time, mod_date = 0, 0x21
+
+    parts = []
+    central_directory = []
+    offset = 0
+
+    def append(part):
+        nonlocal offset
+        parts.append(part)
+        offset += len(part)
+
+    for name, contents in files:
+        local_header_offset = offset
+        crc_32 = zlib.crc32(contents)
+        data = compress(method, contents)
+        flags = (0x08 if data_descriptor else 0x00) | (0x02 if method == 14 else 0x00)
+        header_method = method
+        aes_extra = b''
+
+        if encryption is not None and encryption[0] == 'zipcrypto':
+            flags |= 0x01
+            check_byte = (mod_time >> 8) if data_descriptor else (crc_32 >> 24)
+            data = zipcrypto_encrypt(password, os.urandom(11) + bytes((check_byte,)) + data)
+        elif encryption is not None:
+            _, aes_version, key_length, strength = encryption
+            flags |= 0x01
+            header_method = 99
+            crc_32 = 0 if aes_version == 2 else crc_32
+            aes_extra = b'\x01\x99' + struct.pack('<HH2sBH', 7, aes_version, b'AE', strength, method)
+            data = aes_encrypt(password, data, key_length)
+
+        # With a data descriptor, the sizes in the local header are only needed for stored members
+        has_sizes = not data_descriptor or method == 0
+        header_crc_32 = 0 if data_descriptor else crc_32
+        header_sizes = (len(data), len(contents)) if has_sizes else (0, 0)
+        local_extra = (
+            struct.pack('<HHQQ', 0x0001, 16, header_sizes[1], header_sizes[0]) if zip64 else b''
+        ) + aes_extra
+        append(local_header_struct.pack(
+            b'PK\x03\x04', version, flags, header_method, mod_time, mod_date, header_crc_32,
+            *((0xFFFFFFFF, 0xFFFFFFFF) if zip64 else header_sizes),
+            len(name), len(local_extra),
+        ) + name + local_extra)
+        append(data)
+        if data_descriptor:
+            append(struct.pack('<4sIQQ' if zip64 else '<4sIII', b'PK\x07\x08', crc_32, len(data), len(contents)))
+
+        central_extra = (
+            struct.pack('<HHQQQ', 0x0001, 24, len(contents), len(data), local_header_offset) if zip64 else b''
+        ) + aes_extra
+        central_directory.append(central_header_struct.pack(
+            b'PK\x01\x02', version, version, flags, header_method, mod_time, mod_date, crc_32,
+            *((0xFFFFFFFF, 0xFFFFFFFF) if zip64 else (len(data), len(contents))),
+            len(name), len(central_extra), 0, 0, 0, 0,
+            0xFFFFFFFF if zip64 else local_header_offset,
+        ) + name + central_extra)
+
+    central_directory_offset = offset
+    for central_header in central_directory:
+        append(central_header)
+    central_directory_size = offset - central_directory_offset
+    num_members = len(central_directory)
+
+    if zip64 or num_members > 0xFFFF:
+        zip64_end_of_central_directory_offset = offset
+        append(struct.pack(
+            '<4sQHHIIQQQQ', b'PK\x06\x06', 44, version, version, 0, 0,
+            num_members, num_members, central_directory_size, central_directory_offset,
+        ))
+        append(struct.pack('<4sIQI', b'PK\x06\x07', 0, zip64_end_of_central_directory_offset, 1))
+        append(struct.pack('<4sHHHHIIH', b'PK\x05\x06', 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0))
+    else:
+        append(struct.pack(
+            '<4sHHHHIIH', b'PK\x05\x06', 0, 0, num_members, num_members,
+            central_directory_size, central_directory_offset, 0,
+        ))
+
+    return b''.join(parts)
+
+
+def unzip_all_async(input_chunks, **kwargs):
+    async def async_input_chunks():
+        for chunk in input_chunks:
+            yield chunk
+
+    async def unzip():
+        num_members = 0
+        num_out = 0
+        async for _, _, chunks in async_stream_unzip(async_input_chunks(), **kwargs):
+            num_members += 1
+            async for chunk in chunks:
+                num_out += len(chunk)
+        return num_members, num_out
+
+    return asyncio.run(unzip())
+
+
+def unzip_all_sync(input_chunks, **kwargs):
+    num_members = 0
+    num_out = 0
+    for _, _, chunks in stream_unzip(input_chunks, **kwargs):
+        num_members += 1
+        for chunk in chunks:
+            num_out += len(chunk)
+    return num_members, num_out
+
+
+IMPLEMENTATIONS = {
+    'stream_unzip': unzip_all_sync,
+    'async_stream_unzip': unzip_all_async,
+}
+
+
+@functools.lru_cache(maxsize=4)
+def get_suite_zip_bytes(method, encryption, zip64, data_descriptor, contents_size, num_members):
+    # Cached since the same archive is often unzipped with several implementations and input sizes
+    member_size = contents_size // num_members
+    contents = get_compressible_contents(member_size)
+    return build_zip(
+        ((b'%08d.bin' % i, contents) for i in range(0, num_members)),
+        METHODS[method], ENCRYPTIONS[encryption], zip64=zip64, data_descriptor=data_descriptor,
+    )
+
+
+def get_peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, but bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(max_rss / (1_000_000 if sys.platform == 'darwin' else 1_000), 1)
+
+
+def bench_case(implementation, method, encryption, zip64, data_descriptor, contents_size, num_members, input_size, chunk_size, repeats, track_allocations):
+    zip_bytes = get_suite_zip_bytes(method, encryption, zip64, data_descriptor, contents_size, num_members)
+    input_chunks = split(zip_bytes, input_size)
+    unzip = IMPLEMENTATIONS[implementation]
+    kwargs = {'chunk_size': chunk_size, 'password': b'password' if ENCRYPTIONS[encryption] else None}
+
+    # The fastest of several runs is the least affected by noise, which matters when comparing
+    # against a baseline
+    seconds = float('inf')
+    for _ in range(0, repeats):
+        start = time.perf_counter()
+        num_members_out, num_out = unzip(input_chunks, **kwargs)
+        end = time.perf_counter()
+        seconds = min(seconds, end - start)
+
+    results = {
+        'input MB/s': round(len(zip_bytes) / seconds / 1_000_000, 1),
+        'output MB/s': round(num_out / seconds / 1_000_000, 1),
+        'members/s': round(num_members_out / seconds),
+    }
+
+    if track_allocations:
+        # A separate run, since tracing allocations slows everything down
+        tracemalloc.start()
+        try:
+            unzip(input_chunks, **kwargs)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        results['peak allocated MB'] = round(peak / 1_000_000, 1)
+
+    results['peak RSS MB'] = get_peak_rss_mb()
+    return results
+
+
+def run_case(args, **kwargs):
+    # Peak RSS can only go up during the lifetime of a process, so it's only meaningful per case
+    # if each case is run in its own process
+    kwargs['repeats'] = args.repeats
+    kwargs['track_allocations'] = args.allocations
+    if not args.isolate:
+        results = bench_case(**kwargs)
+        del results['peak RSS MB']
+        return results
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn')) as executor:
+        return executor.submit(bench_case, **kwargs).result()
+
+
+def suite_cases(args, methods=tuple(METHODS), encryptions=tuple(ENCRYPTIONS), zip64s=(False, True), data_descriptors=(False, True),
+                implementations=tuple(IMPLEMENTATIONS), contents_sizes=None, num_members=(1,), input_sizes=None, chunk_sizes=None):
+    for implementation in implementations:
+        for method in methods:
+            for encryption in encryptions:
+                for zip64 in zip64s:
+                    for data_descriptor in data_descriptors:
+                        for contents_size in contents_sizes or (args.matrix_contents_size,):
+                            for num in num_members:
+                                for input_size in input_sizes or (65536,):
+                                    for chunk_size in chunk_sizes or (args.chunk_size,):
+                                        params = {
+                                            'implementation': implementation, 'method': method, 'encryption': encryption,
+                                            'zip64': zip64, 'data_descriptor': data_descriptor, 'contents_size': contents_size,
+                                            'num_members': num, 'input_size': input_size, 'chunk_size': chunk_size,
+                                        }
+                                        yield params, run_case(args, **params)
+
+
+def bench_input_sizes(args):
+    # From pathological 1 byte input chunks up to 64 MiB. Contents are scaled down for the small
+    # input sizes so each case takes a similar amount of time
+    for input_size in (1, 16, 256, 4096, 65536, 1024 * 1024, 16 * 1024 * 1024, 64 * 1024 * 1024):
+        yield from suite_cases(
+            args, methods=('stored', 'deflate'), encryptions=('none',), zip64s=(False,), data_descriptors=(False,),
+            contents_sizes=(min(args.contents_size, input_size * 16384),), input_sizes=(input_size,),
+        )
+
+
+def bench_chunk_sizes(args):
+    for chunk_size in (1024, 16384, 65536, 1024 * 1024, 16 * 1024 * 1024):
+        yield from suite_cases(
+            args, methods=('stored', 'deflate'), encryptions=('none',), zip64s=(False,), data_descriptors=(False,),
+            contents_sizes=(min(args.contents_size, chunk_size * 1024),), chunk_sizes=(chunk_size,),
+        )
+
+
+def bench_matrix(args):
+    # Every combination of compression, encryption, zip64 and data descriptor. Encryption is only
+    # run through stream_unzip, since async_stream_unzip decrypts in exactly the same way
+    yield from suite_cases(args, encryptions=('none',))
+    yield from suite_cases(args, implementations=('stream_unzip',), encryptions=tuple(e for e in ENCRYPTIONS if e != 'none'))
+
+
+def bench_methods(args):
+    # Each compression method on the same contents, for example to compare Zstandard and Deflate
+    yield from suite_cases(
+        args, implementations=('stream_unzip',), encryptions=('none',), zip64s=(False,), data_descriptors=(False,),
+        contents_sizes=(args.contents_size,),
+    )
+
+
+def bench_members(args):
+    # One huge member vs very many tiny members, which stresses per-member overhead
+    yield from suite_cases(
+        args, methods=('stored', 'deflate'), encryptions=('none',), zip64s=(False,), data_descriptors=(False, True),
+        contents_sizes=(args.contents_size,), num_members=(1,),
+    )
+    yield from suite_cases(
+        args, methods=('stored', 'deflate'), encryptions=('none',), zip64s=(False,), data_descriptors=(False, True),
+        contents_sizes=(args.num_tiny_members * 16,), num_members=(args.num_tiny_members,),
+    )
+
+
+def save_baseline(path, all_results):
+    with open(path, 'w') as f:
+        json.dump(all_results, f, indent=2)
+
+
+def compare_to_baseline(path, all_results, max_regression):
+    # Higher is better for rates, lower is better for everything else. Returns the number of
+    # results that are worse than the baseline by more than max_regression
+    with open(path) as f:
+        baseline = {
+            (result['benchmark'], json.dumps(result['params'], sort_keys=True)): result['results']
+            for result in json.load(f)
+        }
+
+    num_regressions = 0
+    for result in all_results:
+        baseline_results = baseline.get((result['benchmark'], json.dumps(result['params'], sort_keys=True)))
+        if baseline_results is None:
+            continue
+        for metric, value in result['results'].items():
+            baseline_value = baseline_results.get(metric)
+            if not baseline_value or value is None:
+                continue
+            higher_is_better = metric.endswith('/s')
+            change = (value - baseline_value) / baseline_value
+            regressed = change < -max_regression if higher_is_better else change > max_regression
+            if regressed:
+                num_regressions += 1
+                print('REGRESSION', result['benchmark'], result['params'], metric, baseline_value, '->', value, flush=True)
+
+    return num_regressions
+
+
+BENCHMARKS = {
+    'copies': lambda args: [
+        ({'method': method_name, 'contents': contents_name, 'input_size': input_size}, bench_copies(method, get_contents(args.contents_size), input_size, args.chunk_size))
+        for method_name, method in (('deflate', zipfile.ZIP_DEFLATED), ('bzip2', zipfile.ZIP_BZIP2))
+        for contents_name, get_contents in (('text', get_compressible_contents), ('zeros', bytes))
+        for input_size in args.input_sizes
+    ],
+    'skip': lambda args: [
+        ({'implementation': name, 'input_size': input_size}, bench_skip(skip, args.contents_size, input_size, args.chunk_size))
+        for input_size in args.input_sizes
+        for name, skip in (
+            ('drain', lambda input_chunks, chunk_size: stream_unzip(input_chunks, chunk_size=chunk_size)),
+            ('member_filter', lambda input_chunks, chunk_size: stream_unzip(input_chunks, chunk_size=chunk_size, member_filter=lambda name, size, compression: name == b'15.bin')),
+        )
+    ],
+    'parallel': lambda args: [
+        ({'implementation': name}, bench_parallel(unzip, args.contents_size, args.chunk_size))
+        for name, unzip in (
+            ('stream_unzip', lambda zip_bytes, chunk_size: stream_unzip((zip_bytes,), chunk_size=chunk_size)),
+            ('parallel_stream_unzip', lambda zip_bytes, chunk_size: parallel_stream_unzip(zip_bytes, chunk_size=chunk_size)),
+        )
+    ],
+    'member-files': lambda args: [
+        ({'on_member': name}, bench_member_files(on_member, 10000, args.chunk_size))
+        for name, on_member in (
+            ('none', None),
+            ('ignored', lambda member_file: None),
+            ('decoded', lambda member_file: (member_file.date_time, member_file.encryption)),
+        )
+    ],
+    'source': lambda args: [
+        ({'method': method_name, 'source': source_name}, bench_source(method, source, args.contents_size, args.chunk_size))
+        for method_name, method in (('deflate', zipfile.ZIP_DEFLATED), ('stored', zipfile.ZIP_STORED))
+        for source_name, source in (
+            ('iterable', lambda f: contextlib.nullcontext(iter(lambda: f.read(args.chunk_size), b''))),
+            ('readinto', lambda f: contextlib.nullcontext(f)),
+            ('mmap', lambda f: mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)),
+        )
+    ],
+    'pipelined': lambda args: [
+        ({'method': method_name, 'pipelined': pipelined}, bench_source(method, lambda f: contextlib.nullcontext(f), args.contents_size, args.chunk_size, pipelined=pipelined))
+        for method_name, method in (('deflate', zipfile.ZIP_DEFLATED), ('stored', zipfile.ZIP_STORED), ('bzip2', zipfile.ZIP_BZIP2))
+        for pipelined in (False, True)
+    ],
+    'read-ahead': lambda args: [
+        ({'read_ahead_bytes': read_ahead_bytes, 'source MB/s': source_mb_per_second}, bench_read_ahead(read_ahead_bytes, args.contents_size, 65536, args.chunk_size, source_mb_per_second))
+        for source_mb_per_second in (10, 100)
+        for read_ahead_bytes in (0, 4 * 1024 * 1024)
+    ],
+    'http-range': lambda args: [
+        ({'max_connections': max_connections, 'connection MB/s': 20}, bench_http_range(max_connections, args.contents_size, 262144, 20))
+        for max_connections in (1, 4, 16)
+    ],
+    'deflate-index': lambda args: [
+        ({'spacing': spacing}, bench_deflate_index(spacing, args.contents_size, args.chunk_size))
+        for spacing in (1024 * 1024, 8 * 1024 * 1024)
+    ],
+    'crc32': lambda args: [
+        ({'implementation': name}, bench_crc32(crc32, args.contents_size, args.chunk_size))
+        for name, crc32 in get_crc32_implementations()
+    ],
+    'async': lambda args: [
+        ({'implementation': name, 'concurrency': concurrency, 'input_size': 65536}, bench_async(unzip, concurrency, args.contents_size // concurrency, 65536, args.chunk_size))
+        for concurrency in (1, 200)
+        for name, unzip in (('native', async_stream_unzip), ('thread bridge', thread_bridge_async_stream_unzip))
+    ],
+    'matrix': bench_matrix,
+    'input-sizes': bench_input_sizes,
+    'chunk-sizes': bench_chunk_sizes,
+    'members': bench_members,
+    'methods': bench_methods,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks for stream-unzip')
+    parser.add_argument('benchmarks', nargs='*', metavar='benchmark', help='One or more of: ' + ', '.join(BENCHMARKS))
+    parser.add_argument('--contents-size', type=int, default=64 * 1024 * 1024)
+    parser.add_argument('--input-sizes', type=int, nargs='+', default=[65536, 8 * 1024 * 1024, 64 * 1024 * 1024])
+    parser.add_argument('--chunk-size', type=int, default=65536)
+    parser.add_argument('--matrix-contents-size', type=int, default=4 * 1024 * 1024)
+    parser.add_argument('--num-tiny-members', type=int, default=100_000)
+    parser.add_argument('--repeats', type=int, default=3, help='How many times each case is run, reporting the fastest')
+    parser.add_argument('--allocations', action='store_true', help='Also report the peak memory allocated by Python, in a separate traced run')
+    parser.add_argument('--isolate', action='store_true', help='Run each case in its own process so peak RSS can be reported')
+    parser.add_argument('--save-baseline', metavar='FILE', help='Save the results as JSON to compare later runs against')
+    parser.add_argument('--compare-baseline', metavar='FILE', help='Report, and exit with a non-zero code on, regressions against saved results')
+    parser.add_argument('--max-regression', type=float, default=0.1, help='The fraction a result can be worse than the baseline before it counts as a regression')
+    args = parser.parse_args()
+
+    unknown = set(args.benchmarks) - set(BENCHMARKS)
+    if unknown:
+        parser.error('unknown benchmarks: ' + ', '.join(sorted(unknown)))
+
+    all_results = []
+    for name in args.benchmarks or BENCHMARKS:
+        for params, results in BENCHMARKS[name](args):
+            print(name, params, results, flush=True)
+            all_results.append({'benchmark': name, 'params': params, 'results': results})
+
+    if args.save_baseline:
+        save_baseline(args.save_baseline, all_results)
+
+    if args.compare_baseline and compare_to_baseline(args.compare_baseline, all_results, args.max_regression):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,14 @@
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
 from struct import Struct
-from typing import Any, AsyncGenerator, AsyncIterable, Container, Generator, Iterable, NewType, Optional, Tuple
+from time import perf_counter
+from typing import IO, TYPE_CHECKING, Any, AsyncGenerator, AsyncIterable, Callable, Container, Dict, Generator, Iterable, NamedTuple, NewType, Optional, Tuple, Union, overload
 import asyncio
-import contextvars
 import bz2
+import mmap
+import os
+import queue
+import threading
 import zlib
 
 from Crypto.Cipher import AES
@@ -12,7 +18,44 @@ from Crypto.Protocol.KDF import PBKDF2
 
 from stream_inflate import stream_inflate64
 
+if TYPE_CHECKING:
+    # Only for type annotations, since typing.Literal is not available in Python 3.7
+    from typing_extensions import Literal
+
+# zlib-ng is a faster implementation of zlib's interface, and is used for Deflate if installed.
+# isal's is not used: for raw Deflate it buffers input internally and doesn't populate
+# unused_data, which is needed to find where each member ends
+try:
+    from zlib_ng import zlib_ng as _zlib
+except ImportError:
+    _zlib = zlib  # type: ignore [misc]
+
+try:
+    from compression import zstd as _zstd
+except ImportError:
+    try:
+        from backports import zstd as _zstd
+    except ImportError:
+        # Before Python 3.14, Zstandard member files need the backports.zstd package
+        _zstd = None
+
 from ._zipcrypto import zipcrypto_decryptor
+try:
+    from ._zipcrypto import aes_decryptor as _native_aes_decryptor
+except ImportError:
+    # The extension was built without the native AES decryptor
+    _native_aes_decryptor = None
+try:
+    from ._zipcrypto import deflate64_decompressor as _native_deflate64_decompressor
+except ImportError:
+    # The extension was built without the native Deflate64 decompressor
+    _native_deflate64_decompressor = None
+try:
+    from ._zipcrypto import crc32 as _crc32
+except ImportError:
+    # The extension was built without the native CRC-32, so zlib's is used. zlib-ng's, like the
+    # native one, uses carry-less multiplication instructions where the CPU has them
+    _crc32 = _zlib.crc32
 
 
 # Type is private to prevent users from inventing new values
@@ -28,14 +71,512 @@ AES_256: _Encryption = _Encryption(object())
 
 _ALL_ENCRYPTIONS = (NO_ENCRYPTION, ZIP_CRYPTO, AE_1, AE_2, AES_128, AES_192, AES_256)
 _DEFAULT_CHUNK_SIZE = 65536
+_DEFAULT_OFFLOAD_THRESHOLD = 262144
+_OFFLOAD_BATCH_SIZE = 16
+_MAX_CHUNKS_AHEAD_PER_MEMBER = 16
+_MAX_INPUT_CHUNKS_AHEAD = 4
+_MMAP_WINDOW_SIZE = 8388608
+_MAX_BZ2_BLOCKS_AHEAD = 2 * (os.cpu_count() or 1)
+_DEFAULT_RANGE_SIZE = 8388608
+_DEFAULT_MAX_CONNECTIONS = 8
+_DEFAULT_MAX_RANGE_BYTES_AHEAD = 67108864
+_DEFAULT_HTTP_TIMEOUT = 60.0
+_DEFAULT_DEFLATE_INDEX_SPACING = 8388608
+_DEFLATE_WINDOW_SIZE = 32768
+_DEFLATE_INDEX_READ_SIZE = 4096
+_DEFLATE_INDEX_SIGNATURE = b'SUDI'
+_DEFLATE_INDEX_HEADER_STRUCT = Struct('<4sQQQI')
+_DEFLATE_INDEX_POINT_STRUCT = Struct('<QQI')
+
+# Empty non-final Deflate blocks as (value, number of bits) fields, used to start zlib part way
+# through a byte. Huffman codes are packed starting from their most significant bit, so the 2 bit
+# codes 10 and 11 are the values 1 and 3. The fixed Huffman block is just its end of block code
+_EMPTY_FIXED_DEFLATE_BLOCK = ((0, 1), (1, 2), (0, 7))
+# The dynamic Huffman block has 257 literal/length codes, one distance code, and all 19 code length
+# codes, of which only 18 (a run of zeros), 0 and 1 are used. The literal/length code lengths are
+# two runs of 138 and 118 zeros and then 1 for the end of block code, and the distance code length
+# is 0
+_EMPTY_DYNAMIC_DEFLATE_BLOCK = (
+    (0, 1), (2, 2), (0, 5), (0, 5), (15, 4),
+    *((length, 3) for length in (0, 0, 1, 2, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 2, 0)),
+    (0, 1), (127, 7), (0, 1), (107, 7), (3, 2), (1, 2),
+    (0, 1),
+)
+
+# Compression method to function that returns the functions to decompress a member file, added to
+# by register_decompressor and removed from by unregister_decompressor
+_registered_decompressors: Dict[int, Callable[[int], Tuple[Callable[[Union[bytes, memoryview]], Iterable[bytes]], Callable[[], bool], Callable[[], int]]]] = {}
+
+# Yielded by the generators of the parser when they need another chunk of input
+_NEED_INPUT = object()
+
+
+class Checkpoint(NamedTuple):
+    # A point between member files that unzipping can be resumed from: the offset of the local
+    # header of the next member file, or of the central directory, and the number of member files
+    # before it, including ones not yielded because of member_filter
+    offset: int
+    member_index: int
+
+
+class MemberFile:
+    # The metadata of a member file from its local header, passed to on_member. It only holds what
+    # the parser has already worked out, and the fields that need decoding are decoded when they
+    # are accessed. The sizes and CRC-32 are None if they are only in the data descriptor after the
+    # data. Checkpoint(local_header_offset, member_index) resumes unzipping at this member file
+    __slots__ = (
+        'file_name', 'member_index', 'local_header_offset', 'data_offset', 'version', 'flags',
+        'compression', 'compressed_size', 'uncompressed_size', 'crc_32', 'is_zip64', 'extra',
+        '_compression_raw', '_mod_time', '_mod_date',
+    )
 
+    file_name: bytes
+    member_index: int
+    local_header_offset: int
+    data_offset: int
+    version: int
+    flags: int
+    compression: int
+    compressed_size: Optional[int]
+    uncompressed_size: Optional[int]
+    crc_32: Optional[int]
+    is_zip64: bool
+    extra: Dict[bytes, bytes]
+
+    def __init__(self, file_name: bytes, member_index: int, local_header_offset: int, data_offset: int, version: int, flags: int, compression: int, compressed_size: Optional[int], uncompressed_size: Optional[int], crc_32: Optional[int], is_zip64: bool, extra: Dict[bytes, bytes], compression_raw: int, mod_time: int, mod_date: int):
+        self.file_name = file_name
+        self.member_index = member_index
+        self.local_header_offset = local_header_offset
+        self.data_offset = data_offset
+        self.version = version
+        self.flags = flags
+        self.compression = compression
+        self.compressed_size = compressed_size
+        self.uncompressed_size = uncompressed_size
+        self.crc_32 = crc_32
+        self.is_zip64 = is_zip64
+        self.extra = extra
+        self._compression_raw = compression_raw
+        self._mod_time = mod_time
+        self._mod_date = mod_date
+
+    def __repr__(self) -> str:
+        return f'MemberFile(file_name={self.file_name!r}, member_index={self.member_index}, local_header_offset={self.local_header_offset})'
+
+    @property
+    def date_time(self) -> Tuple[int, int, int, int, int, int]:
+        # As in zipfile.ZipInfo, not validated, since some ZIPs have all zeros
+        return (
+            (self._mod_date >> 9) + 1980, (self._mod_date >> 5) & 0xF, self._mod_date & 0x1F,
+            self._mod_time >> 11, (self._mod_time >> 5) & 0x3F, (self._mod_time & 0x1F) * 2,
+        )
+
+    @property
+    def has_data_descriptor(self) -> bool:
+        return bool(self.flags & 0x08)
+
+    @property
+    def encryption(self) -> _Encryption:
+        return \
+            NO_ENCRYPTION if not self.flags & 0x01 else \
+            ZIP_CRYPTO if self._compression_raw != 99 else \
+            AE_2 if self.extra.get(b'\x01\x99', b'')[0:2] == b'\x02\x00' else \
+            AE_1
+
+    @property
+    def aes_key_strength(self) -> Optional[_Encryption]:
+        if not self.flags & 0x01 or self._compression_raw != 99:
+            return None
+        return {1: AES_128, 2: AES_192, 3: AES_256}.get(self.extra[b'\x01\x99'][4])
+
+
+@overload
 def stream_unzip(
-    zipfile_chunks: Iterable[bytes],
+    zipfile_chunks: Union[Iterable[bytes], bytes, bytearray, memoryview, mmap.mmap, IO[bytes]],
     password: Optional[bytes]=None,
     chunk_size: int=_DEFAULT_CHUNK_SIZE,
     allow_zip64: bool=True,
     allowed_encryption_mechanisms: Container[_Encryption]=_ALL_ENCRYPTIONS,
-) -> Generator[Tuple[bytes, int, Generator[bytes, Any, None]], Any, None]:
+    member_filter: Optional[Callable[[bytes, Optional[int], int], bool]]=None,
+    check_abandoned_members: bool=False,
+    observer: Optional[Callable[[str, Dict[str, Any]], None]]=None,
+    bz2_executor: Optional[Executor]=None,
+    pipelined: bool=False,
+    read_ahead_bytes: int=0,
+    checkpoint: Optional[Checkpoint]=None,
+    on_checkpoint: Optional[Callable[[Checkpoint], None]]=None,
+    max_members: Optional[int]=None,
+    end_offset: Optional[int]=None,
+    on_member: Optional[Callable[[MemberFile], None]]=None,
+    stored_as_views: 'Literal[False]'=False,
+) -> Generator[Tuple[bytes, int, Generator[bytes, Any, None]], Any, None]: ...
+
+
+@overload
+def stream_unzip(
+    zipfile_chunks: Union[Iterable[bytes], bytes, bytearray, memoryview, mmap.mmap, IO[bytes]],
+    password: Optional[bytes]=None,
+    chunk_size: int=_DEFAULT_CHUNK_SIZE,
+    allow_zip64: bool=True,
+    allowed_encryption_mechanisms: Container[_Encryption]=_ALL_ENCRYPTIONS,
+    member_filter: Optional[Callable[[bytes, Optional[int], int], bool]]=None,
+    check_abandoned_members: bool=False,
+    observer: Optional[Callable[[str, Dict[str, Any]], None]]=None,
+    bz2_executor: Optional[Executor]=None,
+    pipelined: bool=False,
+    read_ahead_bytes: int=0,
+    checkpoint: Optional[Checkpoint]=None,
+    on_checkpoint: Optional[Callable[[Checkpoint], None]]=None,
+    max_members: Optional[int]=None,
+    end_offset: Optional[int]=None,
+    on_member: Optional[Callable[[MemberFile], None]]=None,
+    *,
+    stored_as_views: bool,
+) -> Generator[Tuple[bytes, int, Generator[Union[bytes, memoryview], Any, None]], Any, None]: ...
+
+
+def stream_unzip(
+    zipfile_chunks: Union[Iterable[bytes], bytes, bytearray, memoryview, mmap.mmap, IO[bytes]],
+    password: Optional[bytes]=None,
+    chunk_size: int=_DEFAULT_CHUNK_SIZE,
+    allow_zip64: bool=True,
+    allowed_encryption_mechanisms: Container[_Encryption]=_ALL_ENCRYPTIONS,
+    member_filter: Optional[Callable[[bytes, Optional[int], int], bool]]=None,
+    check_abandoned_members: bool=False,
+    observer: Optional[Callable[[str, Dict[str, Any]], None]]=None,
+    bz2_executor: Optional[Executor]=None,
+    pipelined: bool=False,
+    read_ahead_bytes: int=0,
+    checkpoint: Optional[Checkpoint]=None,
+    on_checkpoint: Optional[Callable[[Checkpoint], None]]=None,
+    max_members: Optional[int]=None,
+    end_offset: Optional[int]=None,
+    on_member: Optional[Callable[[MemberFile], None]]=None,
+    stored_as_views: bool=False,
+) -> Generator[Tuple[bytes, int, Generator[Union[bytes, memoryview], Any, None]], Any, None]:
+    # If pipelined, reading the input, decrypting and decompressing, computing the CRC-32 of the
+    # output, and the consumer of the output each run on their own thread, with bounded queues
+    # between them. Decrypting stays on the same thread as decompressing, since it's the
+    # decompressor that finds the end of each member, and decrypting any further would go past it
+    #
+    # If read_ahead_bytes is positive, or if pipelined, the input is read on its own thread while
+    # the input before it is unzipped, up to read_ahead_bytes ahead
+    #
+    # If checkpoint is passed, zipfile_chunks must start at its offset rather than at the start of
+    # the ZIP. on_checkpoint is called at each point between member files, once everything before
+    # it has been unzipped and iterated
+    #
+    # Unzipping stops at the end of the ZIP, or earlier if max_members member files have
+    # been reached or a member file starts at or after end_offset. Together with checkpoint, this
+    # allows separate workers to each unzip a different range of member files of the same ZIP
+    #
+    # If on_member is passed, it's called with the MemberFile of each member file just before it's
+    # yielded
+    #
+    # If stored_as_views and zipfile_chunks is a buffer, the chunks of stored members are views
+    # into it rather than copies. Otherwise they would have to be copied anyway, since the buffers
+    # that file-like objects are read into are reused
+
+    member_end = object()
+    done = object()
+
+    def readinto(readable, buffer):
+        # A non-blocking stream returns None rather than a number of bytes if none are available
+        # yet, which mustn't be mistaken for the end of the file, since the member files would
+        # then be cut short
+        num = readable.readinto(buffer)
+        if num is None:
+            raise NonBlockingReadError('readinto returned None because no data was available yet, but zipfile_chunks must be a blocking file-like object')
+        return num
+
+    def yield_readinto(readable):
+        # Reads into a small pool of reused buffers rather than allocating a new bytes instance per
+        # chunk. Two is enough: a buffer is only read into again once get_byte_readers has moved
+        # past it, and by then everything that came from it has either been copied or passed on to
+        # a decompressor or decryptor, which keep their own copies of anything they need later
+        views = tuple(memoryview(bytearray(chunk_size)) for _ in range(0, 2))
+        i = 0
+
+        while True:
+            view = views[i]
+            num = readinto(readable, view)
+            if not num:
+                break
+            yield view[:num]
+            i = (i + 1) % len(views)
+
+    def yield_readinto_new(readable):
+        # When reading ahead there can be any number of chunks read but not yet parsed, so each is
+        # read into a new buffer. It's shrunk to what was read so that short reads, for example
+        # from a socket, don't each hold on to chunk_size bytes
+        while True:
+            buffer = bytearray(chunk_size)
+            num = readinto(readable, buffer)
+            if not num:
+                break
+            del buffer[num:]
+            yield buffer
+
+    def yield_windows(view):
+        # The buffer is passed to the parser in windows rather than all at once so that, if it's a
+        # file-backed mmap, the pages of windows the parser has moved past can be released. The
+        # window before the current one is kept, since the parser can still go back a little way
+        # into it. Pages released this way are read from the file again if they're accessed, so
+        # this is only done for read-only file-backed maps: for anonymous maps, or maps with
+        # ACCESS_COPY, it would lose writes made to them, and the two can't be told apart from
+        # other writable maps
+        madvise = None
+        if isinstance(zipfile_chunks, mmap.mmap) and hasattr(mmap, 'MADV_DONTNEED') and view.readonly:
+            try:
+                zipfile_chunks.size()
+            except OSError:
+                pass
+            else:
+                madvise = zipfile_chunks.madvise
+                madvise(mmap.MADV_SEQUENTIAL)
+
+        for offset in range(0, len(view), _MMAP_WINDOW_SIZE):
+            if madvise is not None and offset >= 2 * _MMAP_WINDOW_SIZE:
+                madvise(mmap.MADV_DONTNEED, offset - 2 * _MMAP_WINDOW_SIZE, _MMAP_WINDOW_SIZE)
+            yield view[offset:offset + _MMAP_WINDOW_SIZE]
+
+    def threaded(items, max_items_ahead):
+        # Iterates items on a thread of its own, which can get up to max_items_ahead items ahead.
+        # An exception is raised once the items before it have been yielded, and if iteration
+        # stops early the thread stops before its next item
+        item_queue = queue.Queue(maxsize=max_items_ahead)
+        is_cancelled = threading.Event()
+
+        def put(item, exception):
+            if not is_cancelled.is_set():
+                item_queue.put((item, exception))
+
+        def run():
+            try:
+                for item in items:
+                    if is_cancelled.is_set():
+                        return
+                    item_queue.put((item, None))
+            except Exception as e:
+                put(done, e)
+            else:
+                put(done, None)
+
+        threading.Thread(target=run, daemon=True).start()
+
+        try:
+            while True:
+                item, exception = item_queue.get()
+                if exception is not None:
+                    raise exception
+                if item is done:
+                    break
+                yield item
+        finally:
+            # Emptying the queue makes sure the thread isn't blocked putting an item
+            is_cancelled.set()
+            while True:
+                try:
+                    item_queue.get_nowait()
+                except queue.Empty:
+                    break
+
+    def read_ahead(chunks, max_bytes):
+        # Iterates chunks on a thread of its own, which gets ahead by up to max_bytes, or by one
+        # chunk if that's more. How many bytes and chunks were ahead, and how long the caller had
+        # to wait for each chunk, are passed to the observer
+        condition = threading.Condition()
+        chunk_queue = deque()
+        num_bytes = 0
+        exception = None
+        is_done = False
+        is_cancelled = False
+
+        def run():
+            nonlocal num_bytes, exception, is_done
+            try:
+                while True:
+                    with condition:
+                        while num_bytes >= max_bytes and not is_cancelled:
+                            condition.wait()
+                        if is_cancelled:
+                            return
+                    try:
+                        chunk = next(chunks)
+                    except StopIteration:
+                        break
+                    with condition:
+                        chunk_queue.append(chunk)
+                        num_bytes += len(chunk)
+                        condition.notify_all()
+            except Exception as e:
+                exception = e
+            with condition:
+                is_done = True
+                condition.notify_all()
+
+        threading.Thread(target=run, daemon=True).start()
+
+        try:
+            while True:
+                with condition:
+                    start = perf_counter()
+                    while not chunk_queue and not is_done:
+                        condition.wait()
+                    end = perf_counter()
+                    if not chunk_queue:
+                        break
+                    num_bytes_ahead = num_bytes
+                    num_chunks_ahead = len(chunk_queue)
+                    chunk = chunk_queue.popleft()
+                    num_bytes -= len(chunk)
+                    condition.notify_all()
+                if observer is not None:
+                    observer('read_ahead', {
+                        'buffered_bytes': num_bytes_ahead,
+                        'buffered_chunks': num_chunks_ahead,
+                        'wait_seconds': end - start,
+                    })
+                yield chunk
+            if exception is not None:
+                raise exception
+        finally:
+            with condition:
+                is_cancelled = True
+                condition.notify_all()
+
+    def flattened(members, checkpoints, member_files):
+        # So the members, their chunks, and the checkpoints between them can be passed through a
+        # single queue. The checkpoints and member files are reached by the parser in this thread,
+        # but are only passed to on_checkpoint and on_member in the thread iterating the members
+        for file_name, file_size, unzipped_chunks in members:
+            yield from checkpoints
+            checkpoints.clear()
+            yield file_name, file_size, member_files.pop() if member_files else None
+            yield from unzipped_chunks
+            yield member_end
+        yield from checkpoints
+
+    def unflattened(items):
+        is_member_end = False
+
+        def member_chunks():
+            nonlocal is_member_end
+            for item in items:
+                if item is member_end:
+                    is_member_end = True
+                    break
+                yield item
+
+        for item in items:
+            if isinstance(item, Checkpoint):
+                if on_checkpoint is not None:
+                    on_checkpoint(item)
+                continue
+
+            file_name, file_size, member_file = item
+            if member_file is not None:
+                on_member(member_file)
+            is_member_end = False
+            yield file_name, file_size, member_chunks()
+
+            # The decompressing thread is ahead of the chunks, so even if they are closed early the
+            # member has been or will be unzipped and checked to its end. The rest is discarded
+            if not is_member_end:
+                for item in items:
+                    if item is member_end:
+                        break
+
+    def pull():
+        try:
+            chunk = next(it)
+        except StopIteration:
+            push_eof()
+        else:
+            push(chunk)
+
+    def timed_consumer(chunks):
+        # Only the time that the chunks are with the consumer
+        for chunk in chunks:
+            start = perf_counter()
+            yield chunk
+            add_span('consumer', start, perf_counter())
+
+    try:
+        view = memoryview(zipfile_chunks).cast('B')  # type: ignore [arg-type]
+    except TypeError:
+        view = None
+
+    # A buffer passed in is already in memory, so isn't read ahead
+    max_bytes_ahead = \
+        0 if view is not None else \
+        read_ahead_bytes if read_ahead_bytes > 0 else \
+        _MAX_INPUT_CHUNKS_AHEAD * chunk_size if pipelined else \
+        0
+
+    it = \
+        yield_windows(view) if view is not None else \
+        yield_readinto_new(zipfile_chunks) if hasattr(zipfile_chunks, 'readinto') and max_bytes_ahead else \
+        yield_readinto(zipfile_chunks) if hasattr(zipfile_chunks, 'readinto') else \
+        iter(zipfile_chunks)  # type: ignore [arg-type]
+
+    if max_bytes_ahead:
+        it = read_ahead(it, max_bytes_ahead)
+
+    stored_as_views = stored_as_views and view is not None
+    crc32_executor = ThreadPoolExecutor(max_workers=1) if pipelined else None
+    checkpoints: 'list[Checkpoint]' = []
+    member_files: 'list[MemberFile]' = []
+    push, push_eof, members, add_span = _get_parser(
+        password, chunk_size, allow_zip64, allowed_encryption_mechanisms, member_filter, check_abandoned_members, stored_as_views, pull, observer, bz2_executor, crc32_executor,
+        checkpoint, checkpoints.append if pipelined and on_checkpoint is not None else on_checkpoint, max_members, end_offset,
+        member_files.append if pipelined and on_member is not None else on_member,
+    )
+
+    if pipelined:
+        members = unflattened(threaded(flattened(members, checkpoints, member_files), _MAX_CHUNKS_AHEAD_PER_MEMBER))
+
+    try:
+        for file_name, file_size, unzipped_chunks in members:
+            if observer is not None:
+                unzipped_chunks = timed_consumer(unzipped_chunks)
+            yield file_name, file_size, unzipped_chunks
+            for _ in unzipped_chunks:
+                raise UnfinishedIterationError()
+    finally:
+        if crc32_executor is not None:
+            crc32_executor.shutdown(wait=False)
+
+
+def _get_parser(password, chunk_size, allow_zip64, allowed_encryption_mechanisms, member_filter=None, check_abandoned_members=False, stored_as_views=False, pull=None, observer=None, bz2_executor=None, crc32_executor=None, checkpoint=None, on_checkpoint=None, max_members=None, end_offset=None, on_member=None):
+    # A push-style parser: a function to push a chunk of input, a function to signal the end of the
+    # input, and a generator of members. The generator of members and the generator of chunks of
+    # each member yield _NEED_INPUT when they can't proceed without more input, and the caller is
+    # expected to push more (or signal the end) before advancing them again. This means they can be
+    # driven by both synchronous and asynchronous sources of input without threads.
+    #
+    # If input is available synchronously, `pull` can be passed to push more input or signal the
+    # end whenever it's needed, and then _NEED_INPUT is never yielded. This avoids the cost of
+    # passing _NEED_INPUT up through all the generators, which is noticeable for small chunks
+    #
+    # Also returned is a function to record a span of time spent in a stage of unzipping, which the
+    # caller uses for the stages outside of the parser: waiting for input if it's not pulled, and
+    # waiting for the consumer of the chunks. These are passed to the observer, if there is one
+    #
+    # If bz2_executor is passed, the blocks of bzip2 members are decompressed in parallel on it.
+    # It's always used if passed, even if the blocks can't then run at the same time, in which case
+    # the search for the blocks is all overhead: whether that's worth it is up to the caller.
+    # If crc32_executor is passed, the CRC-32 of the output is computed on it, so it must have a
+    # single worker to compute it in order
+    #
+    # If checkpoint is passed, the input starts at its offset, and on_checkpoint is called with a
+    # checkpoint before each local header and before the central directory. The generator of
+    # members stops at one of these points once max_members have been reached since the start of
+    # the input, or once the offset is at or after end_offset, without reading any further
+    #
+    # If on_member is passed, it's called with a MemberFile just before each member is yielded.
+    # Nothing extra is kept or worked out for it otherwise
+
     local_file_header_signature = b'PK\x03\x04'
     local_file_header_struct = Struct('<H2sHHHIIIHH')
     zip64_compressed_size = 0xFFFFFFFF
@@ -52,38 +593,115 @@ def stream_unzip(
     dd_struct_64 = Struct('<0sIQQ4s')
     dd_struct_64_with_sig = Struct('<4sIQQ4s')
 
+    # The seconds spent in each stage for the current member and for the whole stream
+    member_name = None
+    member_seconds = {}
+    total_seconds = {}
+    totals = {'members': 0, 'compressed_bytes': 0, 'uncompressed_bytes': 0}
+
+    def observe_span(stage, start, end):
+        observer('span', {
+            'stage': stage,
+            'name': member_name,
+            'start': start,
+            'end': end,
+            'thread_id': threading.get_ident(),
+        })
+
+    def add_span(stage, start, end):
+        member_seconds[stage] = member_seconds.get(stage, 0.0) + (end - start)
+        total_seconds[stage] = total_seconds.get(stage, 0.0) + (end - start)
+        observe_span(stage, start, end)
+
+    def timed(func, stage):
+        # Without an observer the function is returned as-is, so timing costs nothing
+        if observer is None:
+            return func
+
+        def _timed(*args):
+            start = perf_counter()
+            try:
+                return func(*args)
+            finally:
+                add_span(stage, start, perf_counter())
+
+        return _timed
+
+    def timed_generator(func, stage):
+        # As timed, but for a generator function, excluding the time its values are yielded
+        if observer is None:
+            return func
+
+        def _timed(*args):
+            start = perf_counter()
+            for value in func(*args):
+                add_span(stage, start, perf_counter())
+                yield value
+                start = perf_counter()
+            add_span(stage, start, perf_counter())
+
+        return _timed
+
+    if pull is not None:
+        pull = timed(pull, 'source')
+
     def next_or_truncated_error(it):
         try:
             return next(it)
         except StopIteration:
             raise TruncatedDataError from None
 
-    def get_byte_readers(iterable):
-        # Return functions to return/"replace" bytes from/to the iterable
-        # - _yield_all: yields chunks as they come up (often for a "body")
+    def get_byte_readers():
+        # Return functions to push bytes into the stream, and to return/"replace" bytes from/to it
+        # - _push: adds a chunk to the end of the stream
+        # - _push_eof: marks the end of the stream
+        # - _yield_all: yields memoryviews of chunks as they come up (often for a "body")
         # - _get_num: returns a single `bytes` of a given length
+        # - _skip_num: moves past a given number of bytes without doing anything with them
         # - _return_num_unused: puts a number of "unused" bytes "back", to be retrieved by a yield/get call
         # - _return_bytes_unused: return a bytes instance "back" into the stream, to be retrieved later
         # - _get_offset_from_start: get the zero-indexed offset from the start of the stream
+        #
+        # The memoryviews yielded are views into the pushed chunks, so nothing is copied until
+        # something really needs a `bytes` instance. The generators yield _NEED_INPUT when the
+        # pushed chunks have all been consumed
 
-        chunk = b''
+        chunk = memoryview(b'')
         offset = 0
-        offset_from_start = 0
+        offset_from_start = checkpoint.offset if checkpoint is not None else 0
         queue = list()  # Will typically have at most 1 element, so a list is fine
-        it = iter(iterable)
+        pushed = list()  # Will have at most 1 element, since input is only pushed when asked for
+        is_eof = False
+
+        def _push(new_chunk):
+            pushed.append(memoryview(new_chunk))
+
+        def _push_eof():
+            nonlocal is_eof
+            is_eof = True
 
         def _next():
-            try:
+            # Returns None if more input needs to be pushed
+            if queue:
                 return queue.pop(0)
-            except IndexError:
-                return (next_or_truncated_error(it), 0)
+            if not pushed and not is_eof and pull is not None:
+                pull()
+            if pushed:
+                return (pushed.pop(0), 0)
+            if is_eof:
+                raise TruncatedDataError
+            return None
 
         def _yield_num(num):
             nonlocal chunk, offset, offset_from_start
 
             while num:
                 if offset == len(chunk):
-                    chunk, offset = _next()
+                    chunk_and_offset = _next()
+                    while chunk_and_offset is None:
+                        yield _NEED_INPUT
+                        chunk_and_offset = _next()
+                    chunk, offset = chunk_and_offset
                 to_yield = min(num, len(chunk) - offset, chunk_size)
                 offset = offset + to_yield
                 num -= to_yield
@@ -97,7 +715,19 @@ def stream_unzip(
                 pass
 
         def _get_num(num):
-            return b''.join(_yield_num(num))
+            # Each piece is copied as it's yielded, before the next chunk is fetched
+            pieces = []
+            for piece in _yield_num(num):
+                if piece is _NEED_INPUT:
+                    yield piece
+                else:
+                    pieces.append(bytes(piece))
+            return b''.join(pieces)
+
+        def _skip_num(num):
+            for piece in _yield_num(num):
+                if piece is _NEED_INPUT:
+                    yield piece
 
         def _return_num_unused(num_unused):
             nonlocal offset, offset_from_start
@@ -107,14 +737,14 @@ def stream_unzip(
         def _return_bytes_unused(bytes_unused):
             nonlocal chunk, offset, offset_from_start
             queue.insert(0, (chunk, offset))
-            chunk = bytes_unused
+            chunk = memoryview(bytes_unused)
             offset = 0
             offset_from_start -= len(bytes_unused)
 
         def _get_offset_from_start():
             return offset_from_start
 
-        return _yield_all, _get_num, _return_num_unused, _return_bytes_unused, _get_offset_from_start
+        return _push, _push_eof, _yield_all, _get_num, _skip_num, _return_num_unused, _return_bytes_unused, _get_offset_from_start
 
     def get_decompressor_none(num_bytes):
         num_decompressed = 0
@@ -125,7 +755,7 @@ def stream_unzip(
             to_yield = min(len(compressed_chunk), num_bytes - num_decompressed)
             num_decompressed += to_yield
             num_unused = len(compressed_chunk) - to_yield
-            yield compressed_chunk[:to_yield]
+            yield compressed_chunk[:to_yield] if stored_as_views else bytes(compressed_chunk[:to_yield])
 
         def _is_done():
             return num_decompressed == num_bytes
@@ -136,69 +766,415 @@ def stream_unzip(
         return _decompress, _is_done, _num_unused
 
     def get_decompressor_deflate():
-        dobj = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+        # When zlib stops because it has output chunk_size bytes, it copies the input it hasn't
+        # consumed to unconsumed_tail. For highly compressible data that's most of the input, again
+        # and again. So instead of passing unconsumed_tail back, slices of the input are passed
+        # that are adjusted to be about as much as makes chunk_size bytes of output, and so
+        # little is left over to be copied
+        dobj = _zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+        input_size = chunk_size
+        num_unfed = 0
+
+        def _decompress(compressed_chunk):
+            nonlocal input_size, num_unfed
+            compressed_chunk = memoryview(compressed_chunk)
+            offset = 0
+
+            while offset < len(compressed_chunk) and not dobj.eof:
+                to_feed = compressed_chunk[offset:offset + input_size]
+                try:
+                    uncompressed_chunk = dobj.decompress(to_feed, chunk_size)
+                except _zlib.error as e:
+                    raise DeflateError() from e
+                num_consumed = len(to_feed) - len(dobj.unconsumed_tail)
+                offset += len(to_feed) if dobj.eof else num_consumed
+                input_size = \
+                    max(num_consumed + num_consumed // 8, 64) if dobj.unconsumed_tail else \
+                    min(input_size * 2, chunk_size)
+                if uncompressed_chunk:
+                    yield uncompressed_chunk
+
+            num_unfed = len(compressed_chunk) - offset
+
+        def _is_done():
+            return dobj.eof
+
+        def _num_unused():
+            return len(dobj.unused_data) + num_unfed
+
+        return _decompress, _is_done, _num_unused
+
+    def get_decompressor_deflate64():
+        if _native_deflate64_decompressor is None:
+            return get_decompressor_deflate64_python()
+
+        # The native decompressor copies its input to an internal buffer, so it's passed at most
+        # chunk_size bytes at a time to not copy much more than is needed to reach the end of
+        # the member
+        dobj = _native_deflate64_decompressor()
+        num_unfed = 0
 
         def _decompress_single(compressed_chunk):
             try:
                 return dobj.decompress(compressed_chunk, chunk_size)
-            except zlib.error as e:
+            except ValueError as e:
                 raise DeflateError() from e
 
         def _decompress(compressed_chunk):
-            uncompressed_chunk = _decompress_single(compressed_chunk)
-            if uncompressed_chunk:
-                yield uncompressed_chunk
+            nonlocal num_unfed
+            compressed_chunk = memoryview(compressed_chunk)
+            offset = 0
 
-            while dobj.unconsumed_tail and not dobj.eof:
-                uncompressed_chunk = _decompress_single(dobj.unconsumed_tail)
+            while offset < len(compressed_chunk) and not dobj.eof:
+                to_feed = compressed_chunk[offset:offset + chunk_size]
+                offset += len(to_feed)
+                uncompressed_chunk = _decompress_single(to_feed)
                 if uncompressed_chunk:
                     yield uncompressed_chunk
 
+                while not dobj.eof and not dobj.needs_input:
+                    uncompressed_chunk = _decompress_single(b'')
+                    if not uncompressed_chunk:
+                        break
+                    yield uncompressed_chunk
+
+            num_unfed = len(compressed_chunk) - offset
+
         def _is_done():
             return dobj.eof
 
         def _num_unused():
-            return len(dobj.unused_data)
+            return len(dobj.unused_data) + num_unfed
 
         return _decompress, _is_done, _num_unused
 
-    def get_decompressor_deflate64():
+    def get_decompressor_deflate64_python():
         uncompressed_chunks, is_done, num_bytes_unconsumed = stream_inflate64()
 
         def _decompress(compressed_chunk):
-            yield from uncompressed_chunks((compressed_chunk,))
+            # stream_inflate64 can yield slices of its input and holds on to it between calls, so
+            # it's given its own copy rather than a view into the input
+            yield from uncompressed_chunks((bytes(compressed_chunk),))
 
         return _decompress, is_done, num_bytes_unconsumed
 
     def get_decompressor_bz2():
-        dobj = bz2.BZ2Decompressor()
+        if bz2_executor is not None:
+            return get_decompressor_bz2_parallel()
+
+        return get_decompressor_buffered(bz2.BZ2Decompressor(), OSError, BZ2Error)
+
+    def get_decompressor_lzma(num_bytes):
+        # LZMA data in a ZIP starts with the version of the LZMA SDK that made it and the length of
+        # the LZMA properties, two bytes each, then the properties. It only ends with an end of
+        # stream marker if bit 1 of the flags is set, and otherwise num_bytes is the number of
+        # bytes including this header
+        lzma = _import_lzma(14)
+        header = bytearray()
+        decompressor = None
+
+        def get_lzma_decompressor(properties):
+            # The properties are the lc, lp and pb parameters packed into one byte, then the
+            # dictionary size
+            params, dict_size = Struct('<BI').unpack(properties)
+            if params >= 9 * 5 * 5:
+                raise LZMAError()
+            return lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[{
+                'id': lzma.FILTER_LZMA1,
+                'dict_size': dict_size,
+                'lc': params % 9,
+                'lp': params // 9 % 5,
+                'pb': params // 9 // 5,
+            }])
+
+        def _decompress(compressed_chunk):
+            nonlocal decompressor
+            compressed_chunk = memoryview(compressed_chunk)
+
+            while decompressor is None and len(compressed_chunk):
+                num_header_bytes = 4 if len(header) < 4 else 4 + unsigned_short.unpack(header[2:4])[0]
+                num_needed = num_header_bytes - len(header)
+                header.extend(compressed_chunk[:num_needed])
+                compressed_chunk = compressed_chunk[num_needed:]
+                if len(header) == 4 and unsigned_short.unpack(header[2:4])[0] != 5:
+                    raise LZMAError()
+                if len(header) == 9:
+                    decompressor = get_decompressor_buffered(
+                        get_lzma_decompressor(header[4:]), lzma.LZMAError, LZMAError,
+                        None if num_bytes is None else num_bytes - len(header),
+                    )
+
+            if decompressor is not None and len(compressed_chunk):
+                yield from decompressor[0](compressed_chunk)
+
+        def _is_done():
+            return decompressor is not None and decompressor[1]()
+
+        def _num_unused():
+            return decompressor[2]()
+
+        return _decompress, _is_done, _num_unused
+
+    def get_decompressor_zstd():
+        return get_decompressor_buffered(_zstd.ZstdDecompressor(), _zstd.ZstdError, ZstdError)
+
+    def get_decompressor_xz():
+        lzma = _import_lzma(95)
+        return get_decompressor_buffered(lzma.LZMADecompressor(lzma.FORMAT_XZ), lzma.LZMAError, LZMAError)
+
+    def get_decompressor_buffered(dobj, errors, exception_type, num_bytes=None):
+        # For decompressors with the interface of bz2.BZ2Decompressor, which copy input they haven't
+        # consumed to an internal buffer that is used up before any more is passed in. As for
+        # deflate, the input is passed in slices adjusted so that not much is left over to be
+        # copied. If num_bytes is passed, the compressed data ends after that many bytes rather
+        # than at an end of stream marker
+        input_size = chunk_size
+        num_unfed = 0
+        num_remaining = num_bytes
 
         def _decompress_single(compressed_chunk):
             try:
                 return dobj.decompress(compressed_chunk, chunk_size)
-            except OSError as e:
-                raise BZ2Error() from e
+            except errors as e:
+                raise exception_type() from e
 
         def _decompress(compressed_chunk):
-            uncompressed_chunk = _decompress_single(compressed_chunk)
-            if uncompressed_chunk:
-                yield uncompressed_chunk
+            nonlocal input_size, num_unfed, num_remaining
+            compressed_chunk = memoryview(compressed_chunk)
+            end = len(compressed_chunk) if num_remaining is None else min(len(compressed_chunk), num_remaining)
+            offset = 0
+
+            while offset < end and not _is_done():
+                to_feed = compressed_chunk[offset:min(offset + input_size, end)]
+                offset += len(to_feed)
+                if num_remaining is not None:
+                    num_remaining -= len(to_feed)
+                uncompressed_chunk = _decompress_single(to_feed)
+                input_size = \
+                    max(input_size // 2, 64) if not dobj.needs_input else \
+                    min(input_size * 2, chunk_size)
+                if uncompressed_chunk:
+                    yield uncompressed_chunk
+
+                while not dobj.eof and not dobj.needs_input:
+                    uncompressed_chunk = _decompress_single(b'')
+                    if not uncompressed_chunk:
+                        break
+                    yield uncompressed_chunk
+
+            num_unfed = len(compressed_chunk) - offset
+
+        def _is_done():
+            return dobj.eof or num_remaining == 0
+
+        def _num_unused():
+            return len(dobj.unused_data) + num_unfed
 
-            while not dobj.eof:
-                uncompressed_chunk = _decompress_single(b'')
-                if not uncompressed_chunk:
+        return _decompress, _is_done, _num_unused
+
+    def get_decompressor_bz2_parallel():
+        # bzip2 data is a header, then blocks that are each compressed independently and start with
+        # a 48-bit magic number, and then another magic number and the CRC of all the blocks. The
+        # magic numbers are not byte aligned. The blocks are found by searching for the magic
+        # numbers, and each is decompressed on bz2_executor as a bzip2 stream of its own, which
+        # releases the GIL. The output is yielded in order, and only a limited number of blocks are
+        # decompressed ahead of the one whose output is being yielded.
+        #
+        # The magic numbers can appear by chance inside a block. A block split by one fails to
+        # decompress, and is tried again joined to the part after it. Two chance magic numbers in
+        # the same block are so unlikely that a block that fails after being joined is corrupt
+        block_magic = 0x314159265359
+        end_magic = 0x177245385090
+
+        def get_needles(magic):
+            # For each bit offset into a byte that a magic number can start at, the bytes that it
+            # fully covers and the number of bytes they are after the byte it starts in
+            for shift in range(0, 8):
+                num_bytes = (shift + 48 + 7) // 8
+                window = (magic << (num_bytes * 8 - shift - 48)).to_bytes(num_bytes, 'big')
+                needle_offset = 0 if shift == 0 else 1
+                yield window[needle_offset:(shift + 48) // 8], needle_offset, shift, magic
+
+        needles = tuple(needle for magic in (block_magic, end_magic) for needle in get_needles(magic))
+
+        header = b''
+        max_block_bits = 0
+        pending = bytearray()
+        block_start = None
+        scan_from = 32
+        candidates = []
+        in_flight = deque()
+        held = None
+        combined_crc = 0
+        end_offset = None
+        num_unfed = 0
+
+        def get_bits(start, end):
+            first = start // 8
+            last = (end + 7) // 8
+            return (int.from_bytes(pending[first:last], 'big') >> (last * 8 - end)) & ((1 << (end - start)) - 1)
+
+        def scan():
+            # Finds the positions in bits of the magic numbers that start at or after scan_from
+            nonlocal scan_from
+            num_bits = len(pending) * 8
+            found = []
+            for needle, needle_offset, shift, magic in needles:
+                index = pending.find(needle, scan_from // 8 + needle_offset)
+                while index != -1:
+                    position = (index - needle_offset) * 8 + shift
+                    if position + 48 > num_bits:
+                        break
+                    if position >= scan_from and get_bits(position, position + 48) == magic:
+                        found.append((position, magic))
+                    index = pending.find(needle, index + 1)
+            candidates.extend(sorted(found))
+            scan_from = max(scan_from, num_bits - 47)
+
+        def decompress_block(value, num_bits, crc):
+            # Runs on bz2_executor. The stream's CRC of its blocks is the block's CRC
+            num_padding_bits = -(num_bits + 80) % 8
+            value = (((value << 48 | end_magic) << 32) | crc) << num_padding_bits
+            return bz2.decompress(header + value.to_bytes((num_bits + 80 + num_padding_bits) // 8, 'big'))
+
+        def rotate_crc(crc):
+            return ((crc << 1) | (crc >> 31)) & 0xFFFFFFFF
+
+        def submit(value, num_bits, is_joined):
+            if num_bits > max_block_bits:
+                raise BZ2Error()
+            crc = (value >> (num_bits - 80)) & 0xFFFFFFFF
+            return bz2_executor.submit(decompress_block, value, num_bits, crc), value, num_bits, crc, is_joined
+
+        def submit_block(end):
+            nonlocal block_start, held
+            value = get_bits(block_start, end)
+            num_bits = end - block_start
+            is_joined = held is not None
+            if held is not None:
+                held_value, held_num_bits, _ = held
+                value = (held_value << num_bits) | value
+                num_bits += held_num_bits
+                held = None
+            in_flight.append(submit(value, num_bits, is_joined))
+            block_start = end
+
+        def yield_decompressed(wait):
+            nonlocal held, combined_crc
+            while in_flight and (wait or len(in_flight) >= _MAX_BZ2_BLOCKS_AHEAD or in_flight[0][0].done()):
+                future, value, num_bits, crc, is_joined = in_flight.popleft()
+                try:
+                    uncompressed = future.result()
+                except (OSError, ValueError, EOFError) as e:
+                    if is_joined:
+                        raise BZ2Error() from e
+                    if in_flight:
+                        next_future, next_value, next_num_bits, _, _ = in_flight.popleft()
+                        next_future.cancel()
+                        in_flight.appendleft(submit((value << next_num_bits) | next_value, num_bits + next_num_bits, True))
+                    else:
+                        held = (value, num_bits, crc)
+                    continue
+
+                combined_crc = rotate_crc(combined_crc) ^ crc
+                for i in range(0, len(uncompressed), chunk_size):
+                    yield uncompressed[i:i + chunk_size]
+
+        def process():
+            nonlocal header, max_block_bits, block_start, scan_from, end_offset
+            if not header:
+                if len(pending) < 4:
+                    return
+                if pending[:3] != b'BZh' or not b'1' <= pending[3:4] <= b'9':
+                    raise BZ2Error()
+                header = bytes(pending[:4])
+                # More than twice the most that a block can be before it's compressed
+                max_block_bits = int(header[3:4]) * 100000 * 8 * 2
+
+            scan()
+            while candidates:
+                position, magic = candidates[0]
+                if block_start is not None and position < block_start + 80:
+                    del candidates[0]
+                    continue
+                if magic == end_magic and len(pending) * 8 < position + 80:
                     break
-                yield uncompressed_chunk
+                del candidates[0]
+
+                if block_start is None:
+                    if position != 32:
+                        raise BZ2Error()
+                    block_start = position
+                else:
+                    submit_block(position)
+
+                if magic == end_magic:
+                    yield from yield_decompressed(wait=True)
+                    stream_crc = get_bits(position + 48, position + 80)
+                    # If the last block failed, this is either a chance magic number that split
+                    # it, or the real end and the block is corrupt, in which case the stream's CRC
+                    # would include the block's CRC
+                    if held is not None and stream_crc == rotate_crc(combined_crc) ^ held[2]:
+                        raise BZ2Error()
+                    if held is None:
+                        if stream_crc != combined_crc:
+                            raise BZ2Error()
+                        end_offset = (position + 80 + 7) // 8
+                        return
+
+            start = 32 if block_start is None else block_start
+            if len(pending) * 8 - start + (held[1] if held is not None else 0) > max_block_bits:
+                raise BZ2Error()
+
+            # The input before the current block isn't needed any more
+            num_consumed = start // 8 if block_start is not None else 0
+            del pending[:num_consumed]
+            if block_start is not None:
+                block_start -= num_consumed * 8
+            scan_from -= num_consumed * 8
+            candidates[:] = [(position - num_consumed * 8, magic) for position, magic in candidates]
+
+        def _decompress(compressed_chunk):
+            nonlocal num_unfed
+            compressed_chunk = memoryview(compressed_chunk)
+            offset = 0
+
+            while offset < len(compressed_chunk) and end_offset is None:
+                to_feed = compressed_chunk[offset:offset + chunk_size]
+                offset += len(to_feed)
+                pending.extend(to_feed)
+                yield from process()
+                yield from yield_decompressed(wait=False)
+
+            num_unfed = len(compressed_chunk) - offset
 
         def _is_done():
-            return dobj.eof
+            return end_offset is not None
 
         def _num_unused():
-            return len(dobj.unused_data)
+            return len(pending) - end_offset + num_unfed
 
         return _decompress, _is_done, _num_unused
 
-    def yield_file(yield_all, get_num, return_num_unused, return_bytes_unused, get_offset_from_start):
+    # Each is called with the number of bytes of compressed data if its end can't be found without
+    # knowing it, and otherwise None. Registered decompressors take precedence over built-in ones
+    registered_decompressors = dict(_registered_decompressors)
+    decompressors = {
+        0: get_decompressor_none,
+        8: lambda num_bytes: get_decompressor_deflate(),
+        9: lambda num_bytes: get_decompressor_deflate64(),
+        12: lambda num_bytes: get_decompressor_bz2(),
+        14: get_decompressor_lzma,
+        **({93: lambda num_bytes: get_decompressor_zstd()} if _zstd is not None else {}),
+        95: lambda num_bytes: get_decompressor_xz(),
+        **{
+            compression: (lambda get_decompressor: lambda num_bytes: get_decompressor(chunk_size))(get_decompressor)
+            for compression, get_decompressor in registered_decompressors.items()
+        },
+    }
+
+    def yield_file(yield_all, get_num, skip_num, return_num_unused, return_bytes_unused, get_offset_from_start, local_header_offset, member_index):
+        nonlocal member_name
 
         def get_flag_bits(flags):
             for b in flags:
@@ -232,9 +1208,9 @@ def stream_unzip(
             return value
 
         def decrypt_weak_decompress(chunks, decompress, is_done, num_unused):
-            decrypt = zipcrypto_decryptor(password)
+            decrypt = timed(zipcrypto_decryptor(password), 'decrypt')
 
-            encryption_header = decrypt(get_num(12))
+            encryption_header = decrypt((yield from get_num(12)))
             check_password_byte = \
                 (mod_time >> 8) if has_data_descriptor else \
                 (crc_32_expected >> 24)
@@ -243,57 +1219,85 @@ def stream_unzip(
                 raise IncorrectZipCryptoPasswordError()
 
             while not is_done():
-                yield from decompress(decrypt(next_or_truncated_error(chunks)))
+                chunk = next_or_truncated_error(chunks)
+                if chunk is _NEED_INPUT:
+                    yield chunk
+                    continue
+                yield from decompress(decrypt(chunk))
 
             return_num_unused(num_unused())
 
         def decrypt_aes_decompress(chunks, decompress, is_done, num_unused, key_length, salt_length):
-            salt = get_num(salt_length)
-            password_verification_length = 2
-
-            keys = PBKDF2(password, salt, 2 * key_length + password_verification_length, 1000)
-            if keys[-password_verification_length:] != get_num(password_verification_length):
+            salt = yield from get_num(salt_length)
+            password_verification, decrypt, hmac_digest = timed(_get_aes_decryptor, 'decrypt')(password, salt, key_length)
+            decrypt = timed(decrypt, 'decrypt')
+            hmac_digest = timed(hmac_digest, 'decrypt')
+            if password_verification != (yield from get_num(len(password_verification))):
                 raise IncorrectAESPasswordError()
 
-            decrypter = AES.new(
-                keys[:key_length], AES.MODE_CTR,
-                counter=Counter.new(nbits=128, little_endian=True)
-            )
-            hmac = HMAC.new(keys[key_length:key_length*2], digestmod=SHA1)
-
+            chunk = b''
             while not is_done():
                 chunk = next_or_truncated_error(chunks)
-                yield from decompress(decrypter.decrypt(chunk))
-                hmac.update(chunk[:len(chunk) - num_unused()])
+                if chunk is _NEED_INPUT:
+                    yield chunk
+                    continue
+                yield from decompress(decrypt(chunk))
 
+            # The digest must be computed before reading any further, since the last chunk can be a
+            # view into a buffer that's read into again
+            hmac_digest_actual = hmac_digest(chunk, num_unused())[:10]
             return_num_unused(num_unused())
 
-            if get_num(10) != hmac.digest()[:10]:
+            if (yield from get_num(10)) != hmac_digest_actual:
                 raise HMACIntegrityError()
 
         def decrypt_none_decompress(chunks, decompress, is_done, num_unused):
             while not is_done():
-                yield from decompress(next_or_truncated_error(chunks))
+                chunk = next_or_truncated_error(chunks)
+                if chunk is _NEED_INPUT:
+                    yield chunk
+                    continue
+                yield from decompress(chunk)
 
             return_num_unused(num_unused())
 
         def read_data_and_count_and_crc32(chunks):
             offset_1 = None
             offset_2 = None
-            crc_32_actual = zlib.crc32(b'')
+            crc_32_actual = 0
+            crc32 = timed(_crc32, 'crc32')
             l = 0
 
+            pending = deque()
+
+            def update_crc_32(chunk):
+                nonlocal crc_32_actual
+                crc_32_actual = crc32(chunk, crc_32_actual)
+
             def _iter():
-                nonlocal offset_1, offset_2, crc_32_actual, l
+                nonlocal offset_1, offset_2, l
 
                 offset_1 = get_offset_from_start()
                 for chunk in chunks:
-                    crc_32_actual = zlib.crc32(chunk, crc_32_actual)
+                    if chunk is _NEED_INPUT:
+                        yield chunk
+                        continue
+                    if crc32_executor is None:
+                        update_crc_32(chunk)
+                    else:
+                        pending.append(crc32_executor.submit(update_crc_32, chunk))
+                        if len(pending) > _MAX_CHUNKS_AHEAD_PER_MEMBER:
+                            pending.popleft().result()
                     l += len(chunk)
                     yield chunk
                 offset_2 = get_offset_from_start()
 
-            return _iter(), lambda: offset_2 - offset_1, lambda: crc_32_actual, lambda: l
+            def get_crc_32():
+                while pending:
+                    pending.popleft().result()
+                return crc_32_actual
+
+            return _iter(), lambda: offset_2 - offset_1, get_crc_32, lambda: l
 
         def checked_from_local_header(chunks, is_aes_2_encrypted, get_crc_32, get_compressed_size, get_uncompressed_size):
             yield from chunks
@@ -336,7 +1340,8 @@ def stream_unzip(
                 (dd_struct_32, b''),
             ) if not must_treat_as_zip64 else ())
 
-            dd = get_num(checks[0][0].size)
+            dd = yield from get_num(checks[0][0].size)
+            start = perf_counter()
 
             for dd_struct, expected_signature in checks:
                 signature_dd, crc_32_dd, compressed_size_dd, uncompressed_size_dd, next_signature = dd_struct.unpack(dd[:dd_struct.size])
@@ -367,10 +1372,30 @@ def stream_unzip(
             if not best_matches[4]:
                 raise UnexpectedSignatureError(next_signature)
 
+            if observer is not None:
+                add_span('data_descriptor', start, perf_counter())
+
             return_bytes_unused(dd[dd_struct.size - 4:])  # 4 is the length of next signature we have already taken
 
+        def observe_member_end(compressed_bytes, uncompressed_bytes):
+            nonlocal member_name
+            totals['members'] += 1
+            totals['compressed_bytes'] += compressed_bytes
+            totals['uncompressed_bytes'] += uncompressed_bytes
+            observer('member_end', {
+                'name': file_name,
+                'compressed_bytes': compressed_bytes,
+                'uncompressed_bytes': uncompressed_bytes,
+                'seconds': dict(member_seconds),
+            })
+            member_name = None
+
+        member_name = None
+        member_seconds.clear()
+        header_start = perf_counter()
+
         version, flags, compression_raw, mod_time, mod_date, crc_32_expected, compressed_size_raw, uncompressed_size_raw, file_name_len, extra_field_len = \
-            local_file_header_struct.unpack(get_num(local_file_header_struct.size))
+            local_file_header_struct.unpack((yield from get_num(local_file_header_struct.size)))
 
         flag_bits = tuple(get_flag_bits(flags))
         if (
@@ -381,14 +1406,78 @@ def stream_unzip(
         ):
             raise UnsupportedFlagsError(flag_bits)
 
-        file_name = get_num(file_name_len)
-        extra = dict(parse_extra(get_num(extra_field_len)))
+        file_name = yield from get_num(file_name_len)
+        extra = dict(parse_extra((yield from get_num(extra_field_len))))
 
         is_weak_encrypted = flag_bits[0] and compression_raw != 99
         is_aes_encrypted = flag_bits[0] and compression_raw == 99
         aes_extra = get_extra_value(extra, is_aes_encrypted, aes_extra_signature, MissingAESExtraError, 7, TruncatedAESExtraError)
         is_aes_2_encrypted = is_aes_encrypted and aes_extra[0:2] == b'\x02\x00'
 
+        compression = \
+            unsigned_short.unpack(aes_extra[5:7])[0] if is_aes_encrypted else \
+            compression_raw
+
+        has_data_descriptor = flag_bits[3]
+        # Whether the end of the compressed data can be found without knowing its size, which
+        # registered decompressors must be able to do
+        has_end_marker = \
+            True if compression in registered_decompressors else \
+            compression in (8, 9, 12, 93, 95) or (compression == 14 and flag_bits[1])
+        might_be_zip64 = compressed_size_raw == zip64_compressed_size and uncompressed_size_raw == zip64_compressed_size 
+        zip64_extra = get_extra_value(extra, might_be_zip64, zip64_size_signature, False, 16, TruncatedZip64ExtraError)
+        is_sure_zip64 = bool(zip64_extra)
+
+        if not allow_zip64 and is_sure_zip64:
+            raise UnsupportedZip64Error()
+
+        compressed_size = \
+            None if has_data_descriptor and has_end_marker else \
+            unsigned_long_long.unpack(zip64_extra[8:16])[0] if is_sure_zip64 else \
+            compressed_size_raw
+
+        uncompressed_size = \
+            None if has_data_descriptor and has_end_marker else \
+            unsigned_long_long.unpack(zip64_extra[:8])[0] if is_sure_zip64 else \
+            uncompressed_size_raw
+
+        # We can't stream-unzip non-compressed member files, or LZMA member files without an end of
+        # stream marker, unless we know their size in the local header, which isn't usually the
+        # case if we have a data descriptor. However, some ZIP archivers write the size in the local
+        # header even if a data descriptor is used, so if we have a non-zero value, we _should_ be
+        # able to use it, and so only need to fail if we have a zero size.
+        if has_data_descriptor and not has_end_marker and compression in decompressors and compressed_size == 0:
+            raise NotStreamUnzippable(file_name)
+
+        is_wanted = member_filter is None or member_filter(file_name, uncompressed_size, compression)
+
+        if observer is not None:
+            member_name = file_name
+            # Only a span and not a stage in the seconds, since it includes waiting for input
+            observe_span('header', header_start, perf_counter())
+            observer('member_start', {
+                'name': file_name,
+                'compression': compression,
+                'encryption': \
+                    AE_2 if is_aes_2_encrypted else \
+                    AE_1 if is_aes_encrypted else \
+                    ZIP_CRYPTO if is_weak_encrypted else \
+                    NO_ENCRYPTION,
+                'compressed_size': compressed_size,
+                'uncompressed_size': uncompressed_size,
+                'has_data_descriptor': bool(has_data_descriptor),
+                'is_zip64': is_sure_zip64,
+                'is_wanted': is_wanted,
+            })
+
+        # If the compressed size is known from the local header, an unwanted member is skipped over
+        # without being decrypted or decompressed. This also means its integrity isn't checked
+        if not is_wanted and not has_data_descriptor:
+            yield from skip_num(compressed_size)
+            if observer is not None:
+                observe_member_end(compressed_size, 0)
+            return None
+
         if is_weak_encrypted and password is None:
             raise MissingZipCryptoPasswordError()
 
@@ -421,49 +1510,29 @@ def stream_unzip(
             if aes_mechanism not in allowed_encryption_mechanisms:
                 raise aes_mechanism_not_allowed_exception()
 
-        compression = \
-            unsigned_short.unpack(aes_extra[5:7])[0] if is_aes_encrypted else \
-            compression_raw
-
-        if compression not in (0, 8, 9, 12):
-            raise UnsupportedCompressionTypeError(compression)
-
-        has_data_descriptor = flag_bits[3]
-        might_be_zip64 = compressed_size_raw == zip64_compressed_size and uncompressed_size_raw == zip64_compressed_size 
-        zip64_extra = get_extra_value(extra, might_be_zip64, zip64_size_signature, False, 16, TruncatedZip64ExtraError)
-        is_sure_zip64 = bool(zip64_extra)
-
-        if not allow_zip64 and is_sure_zip64:
-            raise UnsupportedZip64Error()
-
-        compressed_size = \
-            None if has_data_descriptor and compression in (8, 9, 12) else \
-            unsigned_long_long.unpack(zip64_extra[8:16])[0] if is_sure_zip64 else \
-            compressed_size_raw
+        try:
+            get_decompressor = decompressors[compression]
+        except KeyError:
+            raise UnsupportedCompressionTypeError(compression) from None
 
-        uncompressed_size = \
-            None if has_data_descriptor and compression in (8, 9, 12) else \
-            unsigned_long_long.unpack(zip64_extra[:8])[0] if is_sure_zip64 else \
-            uncompressed_size_raw
+        num_encryption_bytes = \
+            12 if is_weak_encrypted else \
+            aes_salt_length + 12 if is_aes_encrypted else \
+            0
 
-        # We can't stream-unzip non-compressed member files unless we know their size in the local
-        # header, which isn't usually the case if we have a data descriptor. However, some ZIP
-        # archivers write the size in the local header even if a data descriptor is used, so if we
-        # have a non-zero value, we _should_ be able to use it, and so only need to fail if we have
-        # a zero size.
-        if has_data_descriptor and compression == 0 and compressed_size == 0:
-            raise NotStreamUnzippable(file_name)
+        decompress, is_done, num_unused = get_decompressor(
+            None if has_end_marker else \
+            uncompressed_size if compression == 0 else \
+            compressed_size - num_encryption_bytes
+        )
+        decompress = timed_generator(decompress, 'decompress')
 
-        decompressor = \
-            get_decompressor_none(uncompressed_size) if compression == 0 else \
-            get_decompressor_deflate() if compression == 8 else \
-            get_decompressor_deflate64() if compression == 9 else \
-            get_decompressor_bz2()
+        data_offset = get_offset_from_start()
 
         decompressed_bytes = \
-            decrypt_weak_decompress(yield_all(), *decompressor) if is_weak_encrypted else \
-            decrypt_aes_decompress(yield_all(), *decompressor, aes_key_length, aes_salt_length) if is_aes_encrypted else \
-            decrypt_none_decompress(yield_all(), *decompressor)
+            decrypt_weak_decompress(yield_all(), decompress, is_done, num_unused) if is_weak_encrypted else \
+            decrypt_aes_decompress(yield_all(), decompress, is_done, num_unused, aes_key_length, aes_salt_length) if is_aes_encrypted else \
+            decrypt_none_decompress(yield_all(), decompress, is_done, num_unused)
 
         counted_decompressed_bytes, get_compressed_size, get_crc_32_actual, get_uncompressed_size = read_data_and_count_and_crc32(decompressed_bytes)
 
@@ -471,26 +1540,136 @@ def stream_unzip(
             checked_from_data_descriptor(counted_decompressed_bytes, is_sure_zip64, is_aes_2_encrypted, get_crc_32_actual, get_compressed_size, get_uncompressed_size) if has_data_descriptor else \
             checked_from_local_header(counted_decompressed_bytes, is_aes_2_encrypted, get_crc_32_actual, get_compressed_size, get_uncompressed_size)
             
-        return file_name, uncompressed_size, checked_bytes
+        def member_chunks():
+            # Not `yield from`, so closing this generator early doesn't close checked_bytes, and
+            # the rest of the member can still be decompressed by fast_forward
+            for chunk in checked_bytes:
+                yield chunk
+
+        def fast_forward():
+            # Moves past whatever is left of the member if its chunks were not fully iterated. If
+            # the compressed size is known from the local header this is done by byte count, but
+            # otherwise the only way to find the end is to decompress the rest, discarding it
+            if has_data_descriptor or check_abandoned_members:
+                for chunk in checked_bytes:
+                    if chunk is _NEED_INPUT:
+                        yield chunk
+            else:
+                checked_bytes.close()
+                num_remaining = compressed_size - (get_offset_from_start() - data_offset)
+                if num_remaining >= 0:
+                    yield from skip_num(num_remaining)
+                else:
+                    return_num_unused(-num_remaining)
 
-    def all():
-        yield_all, get_num, return_num_unused, return_bytes_unused, get_offset_from_start = get_byte_readers(zipfile_chunks)
+            if observer is not None:
+                observe_member_end(compressed_size if compressed_size is not None else get_compressed_size(), get_uncompressed_size())
+
+        if not is_wanted:
+            yield from fast_forward()
+            return None
+
+        member_file = \
+            MemberFile(
+                file_name, member_index, local_header_offset, data_offset, version, unsigned_short.unpack(flags)[0], compression,
+                compressed_size, uncompressed_size, None if has_data_descriptor else crc_32_expected,
+                is_sure_zip64, extra, compression_raw, mod_time, mod_date,
+            ) if on_member is not None else \
+            None
+
+        return file_name, uncompressed_size, member_chunks(), fast_forward, member_file
+
+    def observe_stream_end():
+        observer('stream_end', {
+            **totals,
+            'input_bytes': get_offset_from_start(),
+            'seconds': dict(total_seconds),
+        })
 
+    def all():
+        member_index = checkpoint.member_index if checkpoint is not None else 0
+        num_members = 0
         while True:
-            signature = get_num(len(local_file_header_signature))
+            local_header_offset = get_offset_from_start()
+            if on_checkpoint is not None:
+                on_checkpoint(Checkpoint(local_header_offset, member_index))
+            if (max_members is not None and num_members >= max_members) or (end_offset is not None and local_header_offset >= end_offset):
+                if observer is not None:
+                    observe_stream_end()
+                break
+            signature = yield from get_num(len(local_file_header_signature))
             if signature == local_file_header_signature:
-                yield yield_file(yield_all, get_num, return_num_unused, return_bytes_unused, get_offset_from_start)
+                member = yield from yield_file(yield_all, get_num, skip_num, return_num_unused, return_bytes_unused, get_offset_from_start, local_header_offset, member_index)
+                member_index += 1
+                num_members += 1
+                if member is not None:
+                    file_name, file_size, unzipped_chunks, fast_forward, member_file = member
+                    if member_file is not None:
+                        on_member(member_file)
+                    yield file_name, file_size, unzipped_chunks
+                    yield from fast_forward()
             elif signature in (central_directory_signature, end_of_central_directory_signature):
-                for _ in yield_all():
-                    pass
+                for chunk in yield_all():
+                    if chunk is _NEED_INPUT:
+                        yield chunk
+                if observer is not None:
+                    observe_stream_end()
                 break
             else:
                 raise UnexpectedSignatureError(signature)
 
-    for file_name, file_size, unzipped_chunks in all():
-        yield file_name, file_size, unzipped_chunks
-        for _ in unzipped_chunks:
-            raise UnfinishedIterationError()
+    push, push_eof, yield_all, get_num, skip_num, return_num_unused, return_bytes_unused, get_offset_from_start = get_byte_readers()
+
+    return push, push_eof, all(), add_span
+
+
+def _import_lzma(compression):
+    # Python can be built without the lzma module, so it's only imported once a member file needs
+    # it, and without it LZMA and XZ are unsupported in the same way as Zstandard without zstd
+    try:
+        import lzma
+    except ImportError:
+        raise UnsupportedCompressionTypeError(compression) from None
+    return lzma
+
+
+def _get_aes_decryptor(password, salt, key_length):
+    # Returns the password verification value, a function that decrypts a chunk and updates the
+    # HMAC with it, and a function that returns the HMAC given the last chunk and the number of
+    # bytes at its end that are not part of the member. The last chunk is only read again, not
+    # kept, so it must be called before the buffer the last chunk is a view into is reused
+    if _native_aes_decryptor is not None:
+        decryptor = _native_aes_decryptor(password, salt, key_length)
+        return decryptor.password_verification, decryptor, decryptor.hmac_digest
+
+    return _get_python_aes_decryptor(password, salt, key_length)
+
+
+def _get_python_aes_decryptor(password, salt, key_length):
+    # The same as _get_aes_decryptor, for when the extension was built without the native AES
+    # decryptor, and to check the native one against
+    keys = PBKDF2(password, salt, 2 * key_length + 2, 1000)
+    decrypter = AES.new(
+        keys[:key_length], AES.MODE_CTR,
+        counter=Counter.new(nbits=128, little_endian=True)
+    )
+    hmac = HMAC.new(keys[key_length:key_length*2], digestmod=SHA1)
+    hmac_before_last_chunk = hmac.copy()
+
+    def decrypt(chunk):
+        nonlocal hmac_before_last_chunk
+        hmac_before_last_chunk = hmac.copy()
+        hmac.update(chunk)
+        return decrypter.decrypt(chunk)
+
+    def hmac_digest(last_chunk, num_unused):
+        nonlocal hmac
+        if num_unused:
+            hmac = hmac_before_last_chunk
+            hmac.update(last_chunk[:len(last_chunk) - num_unused])
+        return hmac.digest()
+
+    return keys[key_length*2:], decrypt, hmac_digest
 
 
 async def async_stream_unzip(
@@ -499,35 +1678,80 @@ async def async_stream_unzip(
     chunk_size: int=_DEFAULT_CHUNK_SIZE,
     allow_zip64: bool=True,
     allowed_encryption_mechanisms: Container[_Encryption]=_ALL_ENCRYPTIONS,
+    member_filter: Optional[Callable[[bytes, Optional[int], int], bool]]=None,
+    check_abandoned_members: bool=False,
+    executor: Optional[Executor]=None,
+    offload_threshold: int=_DEFAULT_OFFLOAD_THRESHOLD,
+    observer: Optional[Callable[[str, Dict[str, Any]], None]]=None,
+    bz2_executor: Optional[Executor]=None,
+    checkpoint: Optional[Checkpoint]=None,
+    on_checkpoint: Optional[Callable[[Checkpoint], None]]=None,
+    max_members: Optional[int]=None,
+    end_offset: Optional[int]=None,
+    on_member: Optional[Callable[[MemberFile], None]]=None,
 ) -> AsyncGenerator[Tuple[bytes, int, AsyncGenerator[bytes, None]], None]:
-    async def to_async_iterable(sync_iterable):
-        # asyncio.to_thread is not available until Python 3.9, and StopIteration doesn't get
-        # propagated by run_in_executor, so we use a sentinel to detect the end of the iterable
-        done = object()
-        it = iter(sync_iterable)
-        get_args = lambda: (contextvars.copy_context().run, next, it, done)
-
+    # The parser is fed input directly from the event loop as it asks for it, and is advanced on
+    # the event loop too unless the chunk of input it's working through is big enough to hold the
+    # event loop up. Then it's advanced in a thread, in batches to reduce the number of handoffs
+
+    def advance(items, max_items):
+        # Returns the next items up to when the parser needs input, the end, or max_items, with
+        # any exception deferred so that the items before it are not lost
+        batch = []
+        try:
+            for item in items:
+                if item is _NEED_INPUT:
+                    return batch, _NEED_INPUT, None
+                batch.append(item)
+                if len(batch) == max_items:
+                    return batch, None, None
+        except Exception as e:
+            return batch, None, e
+        return batch, StopAsyncIteration, None
+
+    async def feed():
+        nonlocal num_pushed
+        # The built-in anext function is not available until Python 3.10
+        start = perf_counter()
+        try:
+            chunk = await async_it.__anext__()
+        except StopAsyncIteration:
+            push_eof()
+            num_pushed = 0
+        else:
+            push(chunk)
+            num_pushed = len(chunk)
+        finally:
+            if observer is not None:
+                add_span('source', start, perf_counter())
+
+    async def timed_consumer(chunks):
+        try:
+            async for chunk in chunks:
+                start = perf_counter()
+                yield chunk
+                add_span('consumer', start, perf_counter())
+        finally:
+            await chunks.aclose()
+
+    async def driven(items, max_items_in_thread):
         while True:
-            if trio is not None:
-                value = await trio.to_thread.run_sync(*get_args())
+            if num_pushed < offload_threshold:
+                batch, state, exception = advance(items, 1)
+            elif trio is not None:
+                batch, state, exception = await trio.to_thread.run_sync(advance, items, max_items_in_thread)
             else:
-                value = await loop.run_in_executor(None, *get_args())
-            if value is done:
-                break
-            yield value
+                batch, state, exception = await loop.run_in_executor(executor, advance, items, max_items_in_thread)
 
-    def to_sync_iterable(async_iterable):
-        # The built-in aiter and anext functions are not available until Python 3.10
-        async_it = async_iterable.__aiter__()
-        while True:
-            try:
-                if trio is not None:
-                    value = trio.from_thread.run(async_it.__anext__)
-                else:
-                    value = asyncio.run_coroutine_threadsafe(async_it.__anext__(), loop).result()
-            except StopAsyncIteration:
+            for item in batch:
+                yield item
+
+            if exception is not None:
+                raise exception
+            if state is StopAsyncIteration:
                 break
-            yield value
+            if state is _NEED_INPUT:
+                await feed()
 
     # A slightly complex dance to both find the asyncio event loop and to work out if we're not in
     # asyncio event loop and instead in trio
@@ -541,16 +1765,695 @@ async def async_stream_unzip(
     if loop is None:
         import trio  # type: ignore [no-redef, assignment]
 
-    unzipped_chunks = stream_unzip(
-        zipfile_chunks=to_sync_iterable(chunks),
-        password=password,
-        chunk_size=chunk_size,
-        allow_zip64=allow_zip64,
-        allowed_encryption_mechanisms=allowed_encryption_mechanisms,
+    async_it = chunks.__aiter__()
+    num_pushed = 0
+    push, push_eof, members, add_span = _get_parser(
+        password, chunk_size, allow_zip64, allowed_encryption_mechanisms, member_filter, check_abandoned_members,
+        observer=observer, bz2_executor=bz2_executor, checkpoint=checkpoint, on_checkpoint=on_checkpoint,
+        max_members=max_members, end_offset=end_offset, on_member=on_member,
+    )
+
+    # Members are yielded one at a time since the parser must not move past a member before its
+    # chunks have been iterated
+    async for name, size, unzipped_chunks in driven(members, 1):
+        unzipped_chunks = driven(unzipped_chunks, _OFFLOAD_BATCH_SIZE)
+        if observer is not None:
+            unzipped_chunks = timed_consumer(unzipped_chunks)
+        yield name, size, unzipped_chunks
+        async for _ in unzipped_chunks:
+            raise UnfinishedIterationError()
+
+
+def parallel_stream_unzip(
+    zipfile: Union[bytes, bytearray, memoryview, mmap.mmap, IO[bytes]],
+    password: Optional[bytes]=None,
+    chunk_size: int=_DEFAULT_CHUNK_SIZE,
+    allow_zip64: bool=True,
+    allowed_encryption_mechanisms: Container[_Encryption]=_ALL_ENCRYPTIONS,
+    member_filter: Optional[Callable[[bytes, Optional[int], int], bool]]=None,
+    executor: Optional[Executor]=None,
+    ordered: bool=True,
+    on_member: Optional[Callable[[MemberFile], None]]=None,
+) -> Generator[Tuple[bytes, int, Generator[bytes, Any, None]], Any, None]:
+    # Unlike stream_unzip, the ZIP must be seekable: the central directory at the end is read
+    # first to find where each member starts, and then each member is unzipped by stream_unzip in
+    # its own thread. The decompressors and decryptors release the GIL, so this uses multiple cores.
+    #
+    # The output of each member is passed back through a bounded queue, so threads working on
+    # members other than the one being iterated block once they are far enough ahead. If not
+    # ordered, members are yielded in the order their threads start producing output. The thread
+    # of the member being iterated has always started, so it can always make progress
+
+    done = object()
+
+    def unzip_member(read_range, size, local_header_offset, member_index, put):
+        # Runs in a thread. The input isn't limited to the member, since stream_unzip only reads
+        # as far as it needs to, which for members with a data descriptor can be a bit past the end.
+        # The checkpoint is so the offsets in the MemberFile are from the start of the ZIP
+        def yield_chunks():
+            for offset in range(local_header_offset, size, chunk_size):
+                yield read_range(offset, min(chunk_size, size - offset))
+
+        member_files: 'list[MemberFile]' = []
+
+        try:
+            for file_name, file_size, unzipped_chunks in stream_unzip(
+                yield_chunks(), password, chunk_size, allow_zip64, allowed_encryption_mechanisms,
+                checkpoint=Checkpoint(local_header_offset, member_index),
+                on_member=member_files.append if on_member is not None else None,
+            ):
+                if not put((file_name, file_size, member_files.pop() if member_files else None)):
+                    return
+                for chunk in unzipped_chunks:
+                    if not put(chunk):
+                        return
+                break
+            else:
+                raise TruncatedDataError()
+        except Exception as e:
+            put(e)
+        else:
+            put(done)
+
+    def get_put(member_queue, is_cancelled, started_queue):
+        is_started = False
+
+        def put(item):
+            # Returns False once the member has been abandoned, and the thread should stop
+            nonlocal is_started
+            if is_cancelled.is_set():
+                return False
+            member_queue.put(item)
+            if not is_started:
+                is_started = True
+                started_queue.put((member_queue, is_cancelled))
+            return True
+        return put
+
+    def cancel(member_queue, is_cancelled):
+        # Setting is_cancelled stops the thread at its next put, and emptying the queue makes
+        # sure it's not blocked in the current one
+        is_cancelled.set()
+        while True:
+            try:
+                member_queue.get_nowait()
+            except queue.Empty:
+                break
+
+    def get(member_queue):
+        item = member_queue.get()
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    def member_chunks(member_queue):
+        while True:
+            item = get(member_queue)
+            if item is done:
+                break
+            yield item
+
+    read_range, size = _get_read_range(zipfile)
+    members, _ = _get_members(read_range, size)
+
+    owns_executor = executor is None
+    pool = ThreadPoolExecutor() if executor is None else executor
+    queues_and_cancellations = []
+    started_queue: 'queue.Queue[Any]' = queue.Queue()
+    futures = []
+
+    try:
+        for member_index, (file_name, file_size, compression, local_header_offset, _, _, _) in enumerate(members):
+            if member_filter is not None and not member_filter(file_name, file_size, compression):
+                continue
+            member_queue: 'queue.Queue[Any]' = queue.Queue(maxsize=_MAX_CHUNKS_AHEAD_PER_MEMBER)
+            is_cancelled = threading.Event()
+            queues_and_cancellations.append((member_queue, is_cancelled))
+            futures.append(pool.submit(unzip_member, read_range, size, local_header_offset, member_index, get_put(member_queue, is_cancelled, started_queue)))
+
+        in_order = \
+            queues_and_cancellations if ordered else \
+            (started_queue.get() for _ in queues_and_cancellations)
+
+        for member_queue, is_cancelled in in_order:
+            file_name, file_size, member_file = get(member_queue)
+            if on_member is not None:
+                on_member(member_file)
+            unzipped_chunks = member_chunks(member_queue)
+            yield file_name, file_size, unzipped_chunks
+            for _ in unzipped_chunks:
+                raise UnfinishedIterationError()
+            cancel(member_queue, is_cancelled)
+    finally:
+        for member_queue, is_cancelled in queues_and_cancellations:
+            cancel(member_queue, is_cancelled)
+        for future in futures:
+            future.cancel()
+        if owns_executor:
+            pool.shutdown(wait=True)
+
+
+def _get_read_range(zipfile):
+    # Returns a function that reads a range of the ZIP, safe to call from multiple threads at
+    # once, and the size of the ZIP
+    try:
+        view = memoryview(zipfile)  # type: ignore [arg-type]
+    except TypeError:
+        pass
+    else:
+        return (lambda offset, length: view[offset:offset + length]), len(view)
+
+    try:
+        fileno = zipfile.fileno()  # type: ignore [union-attr]
+    except (AttributeError, OSError):
+        fileno = None
+
+    if fileno is not None and hasattr(os, 'pread'):
+        return (lambda offset, length: os.pread(fileno, length, offset)), os.fstat(fileno).st_size
+
+    lock = threading.Lock()
+
+    def read_range(offset, length):
+        with lock:
+            zipfile.seek(offset)  # type: ignore [union-attr]
+            return zipfile.read(length)  # type: ignore [union-attr]
+
+    with lock:
+        size = zipfile.seek(0, os.SEEK_END)  # type: ignore [union-attr]
+
+    return read_range, size
+
+
+def _get_members(read_range, size):
+    # Returns the file name, uncompressed size, compression method, offset of the local header,
+    # flags, compressed size and CRC-32 of each member, in the order of the central directory, and
+    # the offset of the central directory
+    end_of_central_directory_signature = b'PK\x05\x06'
+    end_of_central_directory_struct = Struct('<4sHHHHIIH')
+    zip64_end_of_central_directory_locator_signature = b'PK\x06\x07'
+    zip64_end_of_central_directory_locator_struct = Struct('<4sIQI')
+    zip64_end_of_central_directory_signature = b'PK\x06\x06'
+    zip64_end_of_central_directory_struct = Struct('<4sQHHIIQQQQ')
+    central_directory_signature = b'PK\x01\x02'
+    central_directory_header_struct = Struct('<4sHHHHHHIIIHHHHHII')
+    zip64_size_signature = b'\x01\x00'
+    aes_extra_signature = b'\x01\x99'
+    zip64_value = 0xFFFFFFFF
+    unsigned_short = Struct('<H')
+    unsigned_long_long = Struct('<Q')
+
+    def parse_extra(extra):
+        extra_offset = 0
+        while extra_offset <= len(extra) - 4:
+            extra_signature = extra[extra_offset:extra_offset+2]
+            extra_offset += 2
+            extra_data_size, = unsigned_short.unpack(extra[extra_offset:extra_offset+2])
+            extra_offset += 2
+            extra_data = extra[extra_offset:extra_offset+extra_data_size]
+            extra_offset += extra_data_size
+            yield (extra_signature, extra_data)
+
+    tail_offset = max(0, size - end_of_central_directory_struct.size - 0xFFFF)
+    tail = bytes(read_range(tail_offset, size - tail_offset))
+    end_of_central_directory_index = tail.rfind(end_of_central_directory_signature)
+    if end_of_central_directory_index == -1 or len(tail) - end_of_central_directory_index < end_of_central_directory_struct.size:
+        raise MissingEndOfCentralDirectoryError()
+
+    _, _, _, _, num_members, central_directory_size, central_directory_offset, _ = \
+        end_of_central_directory_struct.unpack_from(tail, end_of_central_directory_index)
+
+    locator_index = end_of_central_directory_index - zip64_end_of_central_directory_locator_struct.size
+    if locator_index >= 0 and tail[locator_index:locator_index+4] == zip64_end_of_central_directory_locator_signature:
+        _, _, zip64_end_of_central_directory_offset, _ = \
+            zip64_end_of_central_directory_locator_struct.unpack_from(tail, locator_index)
+        signature, _, _, _, _, _, _, num_members, central_directory_size, central_directory_offset = \
+            zip64_end_of_central_directory_struct.unpack(bytes(read_range(zip64_end_of_central_directory_offset, zip64_end_of_central_directory_struct.size)))
+        if signature != zip64_end_of_central_directory_signature:
+            raise UnexpectedSignatureError(signature)
+
+    central_directory = bytes(read_range(central_directory_offset, central_directory_size))
+    if len(central_directory) != central_directory_size:
+        raise TruncatedDataError()
+
+    members = []
+    offset = 0
+    for _ in range(0, num_members):
+        try:
+            signature, _, _, flags, compression, _, _, crc_32, compressed_size, uncompressed_size, file_name_len, extra_field_len, file_comment_len, _, _, _, local_header_offset = \
+                central_directory_header_struct.unpack_from(central_directory, offset)
+        except Exception:
+            raise TruncatedDataError() from None
+        if signature != central_directory_signature:
+            raise UnexpectedSignatureError(signature)
+        offset += central_directory_header_struct.size
+        file_name = central_directory[offset:offset+file_name_len]
+        offset += file_name_len
+        extra = dict(parse_extra(central_directory[offset:offset+extra_field_len]))
+        offset += extra_field_len + file_comment_len
+
+        # In the central directory, the ZIP64 extra only has the values that don't fit in the
+        # header, in this order
+        zip64_extra = extra.get(zip64_size_signature, b'')
+        zip64_extra_offset = 0
+        if uncompressed_size == zip64_value and len(zip64_extra) >= zip64_extra_offset + 8:
+            uncompressed_size, = unsigned_long_long.unpack_from(zip64_extra, zip64_extra_offset)
+            zip64_extra_offset += 8
+        if compressed_size == zip64_value and len(zip64_extra) >= zip64_extra_offset + 8:
+            compressed_size, = unsigned_long_long.unpack_from(zip64_extra, zip64_extra_offset)
+            zip64_extra_offset += 8
+        if local_header_offset == zip64_value and len(zip64_extra) >= zip64_extra_offset + 8:
+            local_header_offset, = unsigned_long_long.unpack_from(zip64_extra, zip64_extra_offset)
+
+        aes_extra = extra.get(aes_extra_signature, b'')
+        if flags & 1 and compression == 99 and len(aes_extra) >= 7:
+            compression, = unsigned_short.unpack(aes_extra[5:7])
+
+        members.append((file_name, uncompressed_size, compression, local_header_offset, flags, compressed_size, crc_32))
+
+    return members, central_directory_offset
+
+
+def deflate_index(
+    zipfile: Union[bytes, bytearray, memoryview, mmap.mmap, IO[bytes]],
+    file_name: bytes,
+    spacing: int=_DEFAULT_DEFLATE_INDEX_SPACING,
+    chunk_size: int=_DEFAULT_CHUNK_SIZE,
+) -> bytes:
+    # Returns an index of a Deflate-compressed member file of a seekable ZIP, that
+    # unzip_from_deflate_index uses to start unzipping it part way through. As in zlib's zran
+    # example, the index has an access point at the start of a Deflate block at least every spacing
+    # bytes of uncompressed data, with the 32KiB of uncompressed data before it that the block can
+    # refer back to.
+    #
+    # zlib doesn't say where blocks start, so the member file is decompressed a block at a time,
+    # each started at its first bit and with its final bit set so that zlib stops at its end. zlib
+    # then says which byte the block ends in, but not which bit. To find out which, the last byte
+    # is decompressed again with its later bits changed: changing the last bit of the end of block
+    # code always changes what the block decompresses to, but changing the bits after it doesn't
+    local_header_signature = b'PK\x03\x04'
+    local_header_struct = Struct('<4s22sHH')
+
+    read_range, size = _get_read_range(zipfile)
+    members, _ = _get_members(read_range, size)
+    try:
+        _, uncompressed_size, compression, local_header_offset, flags, compressed_size, expected_crc_32 = next(
+            member for member in members if member[0] == file_name
+        )
+    except StopIteration:
+        raise MissingMemberFileError(file_name) from None
+    if compression != 8:
+        raise UnsupportedCompressionTypeError(compression)
+    if flags & 1:
+        raise UnsupportedFlagsError(flags)
+
+    signature, _, file_name_len, extra_field_len = \
+        local_header_struct.unpack(bytes(read_range(local_header_offset, local_header_struct.size)))
+    if signature != local_header_signature:
+        raise UnexpectedSignatureError(signature)
+    data_offset = local_header_offset + local_header_struct.size + file_name_len + extra_field_len
+    data_end = data_offset + compressed_size
+
+    def decompress_block(bit_offset, window):
+        # Returns whether the block that starts at bit_offset of the compressed data is final, the
+        # bit offset of its end, and its uncompressed bytes
+        first_byte = read_range(data_offset + bit_offset // 8, 1)[0]
+        dobj, head = _get_deflate_decompressobj(window, first_byte, bit_offset % 8, True)
+        piece_end = data_offset + bit_offset // 8 + 1
+        to_feed = b''
+        uncompressed_chunks = []
+
+        # The decompressobj is copied before each piece of input is passed to it, so that the last
+        # byte can be decompressed again on its own
+        while not dobj.eof:
+            if not to_feed and piece_end < data_end:
+                piece = head + read_range(piece_end, min(_DEFLATE_INDEX_READ_SIZE, data_end - piece_end))
+                piece_end += len(piece) - len(head)
+                head = b''
+                dobj_before_piece = dobj.copy()
+                to_feed = piece
+            try:
+                uncompressed_chunk = dobj.decompress(to_feed, chunk_size)
+            except _zlib.error as e:
+                raise DeflateError() from e
+            if not to_feed and not uncompressed_chunk and not dobj.eof:
+                raise TruncatedDataError()
+            to_feed = dobj.unconsumed_tail
+            uncompressed_chunks.append(uncompressed_chunk)
+
+        num_last_bytes = len(dobj.unused_data) + 1
+        last_byte = piece[-num_last_bytes]
+        dobj_before_piece.decompress(piece[:-num_last_bytes])
+        expected = dobj_before_piece.copy().decompress(bytes((last_byte,)))
+
+        def ends_within(num_bits):
+            for later_bits in (0x00, 0xFF):
+                dobj_last_byte = dobj_before_piece.copy()
+                try:
+                    uncompressed = dobj_last_byte.decompress(bytes(((last_byte & ~(0xFF << num_bits)) | (later_bits & (0xFF << num_bits)),)))
+                except _zlib.error:
+                    return False
+                if not dobj_last_byte.eof or uncompressed != expected:
+                    return False
+            return True
+
+        num_bits = next(num_bits for num_bits in range(1, 9) if ends_within(num_bits))
+        return \
+            first_byte >> (bit_offset % 8) & 1, \
+            8 * (piece_end - num_last_bytes - data_offset) + num_bits, \
+            uncompressed_chunks
+
+    points: 'list[Tuple[int, int, bytes]]' = []
+    bit_offset = 0
+    window = b''
+    uncompressed_offset = 0
+    crc_32 = 0
+    is_final = False
+
+    while not is_final:
+        if not points or uncompressed_offset - points[-1][1] >= spacing:
+            points.append((bit_offset, uncompressed_offset, _zlib.compress(window)))
+        is_final, bit_offset, uncompressed_chunks = decompress_block(bit_offset, window)
+        for uncompressed_chunk in uncompressed_chunks:
+            crc_32 = _crc32(uncompressed_chunk, crc_32)
+            uncompressed_offset += len(uncompressed_chunk)
+        window = (window + b''.join(uncompressed_chunks))[-_DEFLATE_WINDOW_SIZE:]
+
+    if crc_32 != expected_crc_32:
+        raise CRC32IntegrityError()
+    if uncompressed_offset != uncompressed_size:
+        raise UncompressedSizeIntegrityError()
+
+    return b''.join((
+        _DEFLATE_INDEX_HEADER_STRUCT.pack(_DEFLATE_INDEX_SIGNATURE, data_offset, compressed_size, uncompressed_size, len(points)),
+        *(
+            _DEFLATE_INDEX_POINT_STRUCT.pack(bit_offset, point_offset, len(window)) + window
+            for bit_offset, point_offset, window in points
+        ),
+    ))
+
+
+def unzip_from_deflate_index(
+    zipfile: Union[bytes, bytearray, memoryview, mmap.mmap, IO[bytes]],
+    index: bytes,
+    offset: int=0,
+    chunk_size: int=_DEFAULT_CHUNK_SIZE,
+) -> Generator[bytes, Any, None]:
+    # Yields the uncompressed bytes of the member file that index was returned for by
+    # deflate_index, from offset to the end. Decompression starts at the last access point at or
+    # before offset, so at most about spacing bytes are decompressed before the first yielded byte.
+    # The integrity of the member file isn't checked, since its CRC-32 covers all of it
+    read_range, _ = _get_read_range(zipfile)
+    signature, data_offset, compressed_size, uncompressed_size, num_points = \
+        _DEFLATE_INDEX_HEADER_STRUCT.unpack_from(index)
+    if signature != _DEFLATE_INDEX_SIGNATURE:
+        raise UnexpectedSignatureError(signature)
+    if offset >= uncompressed_size:
+        return
+
+    bit_offset, block_start, window = 0, 0, b''
+    point_offset = _DEFLATE_INDEX_HEADER_STRUCT.size
+    for _ in range(0, num_points):
+        point_bit_offset, point_block_start, window_size = _DEFLATE_INDEX_POINT_STRUCT.unpack_from(index, point_offset)
+        point_offset += _DEFLATE_INDEX_POINT_STRUCT.size
+        if point_block_start > offset:
+            break
+        bit_offset, block_start, window = point_bit_offset, point_block_start, index[point_offset:point_offset + window_size]
+        point_offset += window_size
+
+    input_offset = data_offset + bit_offset // 8
+    data_end = data_offset + compressed_size
+    dobj, to_feed = _get_deflate_decompressobj(_zlib.decompress(window), read_range(input_offset, 1)[0], bit_offset % 8, False)
+    input_offset += 1
+    num_to_skip = offset - block_start
+
+    while not dobj.eof:
+        if not to_feed and input_offset < data_end:
+            to_feed = read_range(input_offset, min(chunk_size, data_end - input_offset))
+            input_offset += len(to_feed)
+        try:
+            uncompressed_chunk = dobj.decompress(to_feed, chunk_size)
+        except _zlib.error as e:  # type: ignore [misc]
+            raise DeflateError() from e
+        if not to_feed and not uncompressed_chunk and not dobj.eof:
+            raise TruncatedDataError()
+        to_feed = dobj.unconsumed_tail
+        if num_to_skip:
+            num_skipped = min(num_to_skip, len(uncompressed_chunk))
+            uncompressed_chunk = uncompressed_chunk[num_skipped:]
+            num_to_skip -= num_skipped
+        if uncompressed_chunk:
+            yield uncompressed_chunk
+
+
+def _get_deflate_decompressobj(window, first_byte, bit_offset, is_final):
+    # Returns a raw Deflate decompressobj that has window as the data before a block that starts at
+    # bit_offset of first_byte, and the bytes to pass it before the compressed data after
+    # first_byte. zlib can only start at the start of a byte, so these are empty blocks that take
+    # up bit_offset bits more than a whole number of bytes, and then first_byte with its first
+    # bit_offset bits replaced by their last bits. The fixed Huffman block is 10 bits and the
+    # dynamic Huffman block 95, so between them they can take up any number of bits modulo 8. If
+    # is_final is True, the final bit of the block is set so that zlib stops at its end
+    fields = next(
+        fields
+        for fields in (
+            _EMPTY_DYNAMIC_DEFLATE_BLOCK * num_dynamic + _EMPTY_FIXED_DEFLATE_BLOCK * num_fixed
+            for num_dynamic in (0, 1)
+            for num_fixed in range(0, 4)
+        )
+        if sum(num_bits for _, num_bits in fields) % 8 == bit_offset
     )
+    value = 0
+    num_bits = 0
+    for field_value, field_num_bits in fields:
+        value |= field_value << num_bits
+        num_bits += field_num_bits
+    num_bytes = num_bits // 8
+    first_byte = (first_byte & (0xFF << bit_offset) & 0xFF) | (value >> (8 * num_bytes)) | (int(is_final) << bit_offset)
+
+    return \
+        _zlib.decompressobj(wbits=-zlib.MAX_WBITS, zdict=window), \
+        value.to_bytes(num_bytes + 1, 'little')[:num_bytes] + bytes((first_byte,))
+
+
+def http_range_chunks(
+    url: str,
+    headers: Optional[Dict[str, str]]=None,
+    range_size: int=_DEFAULT_RANGE_SIZE,
+    max_connections: int=_DEFAULT_MAX_CONNECTIONS,
+    max_bytes_ahead: int=_DEFAULT_MAX_RANGE_BYTES_AHEAD,
+    executor: Optional[Executor]=None,
+    offset: int=0,
+    timeout: Optional[float]=_DEFAULT_HTTP_TIMEOUT,
+) -> Generator[bytes, None, None]:
+    # Yields the bytes of a URL in order from offset, one range at a time, for passing to
+    # stream_unzip. Ranges are requested over several connections at once, but only as many as fit
+    # in max_bytes_ahead are requested before the first of them has been yielded. If the server
+    # doesn't support range requests, the whole of the URL is read over a single connection instead
+    #
+    # The timeout is passed to urlopen, so it applies to connecting and to each read from the
+    # connection. Without one, a stalled request would block a worker, and so the iteration, forever
+    #
+    # urllib.request is only imported here, since importing it takes a while and most callers of
+    # stream_unzip don't need it
+    import urllib.request
+
+    def get_request(offset, length):
+        return urllib.request.Request(url, headers={
+            **(headers or {}),
+            'Range': 'bytes={}-{}'.format(offset, offset + length - 1),
+            # Compression would change what the byte ranges refer to
+            'Accept-Encoding': 'identity',
+        })
+
+    def read_range(response, offset, length):
+        # Returns the bytes of the range, and the size of the whole of the URL. The size can be *
+        # if the server doesn't know it, but it's needed to know which ranges to request
+        content_range = response.headers.get('Content-Range', '')
+        if response.status != 206 or not content_range.startswith('bytes {}-'.format(offset)):
+            raise RangeRequestError(response.status, content_range)
+        try:
+            size = int(content_range.rpartition('/')[2])
+        except ValueError:
+            raise RangeRequestError(response.status, content_range) from None
+        data = response.read()
+        if len(data) != min(length, size - offset):
+            raise RangeRequestError(response.status, content_range)
+        return data, size
+
+    def fetch_range(offset, length):
+        with urllib.request.urlopen(get_request(offset, length), timeout=timeout) as response:
+            return read_range(response, offset, length)[0]
+
+    with urllib.request.urlopen(get_request(offset, range_size), timeout=timeout) as response:
+        if response.status == 200:
+            num_to_skip = offset
+            while num_to_skip:
+                num_skipped = len(response.read(min(num_to_skip, range_size)))
+                if not num_skipped:
+                    return
+                num_to_skip -= num_skipped
+            yield from iter(lambda: response.read(range_size), b'')
+            return
+        first_range, size = read_range(response, offset, range_size)
+
+    yield first_range
+    del first_range
+
+    num_ranges_ahead = max(1, min(max_connections, max_bytes_ahead // range_size))
+    offsets = iter(range(offset + range_size, size, range_size))
+    futures: 'deque[Any]' = deque()
+    owns_executor = executor is None
+    pool = ThreadPoolExecutor(max_workers=max_connections) if executor is None else executor
+
+    try:
+        for range_offset in offsets:
+            futures.append(pool.submit(fetch_range, range_offset, min(range_size, size - range_offset)))
+            if len(futures) == num_ranges_ahead:
+                break
+
+        while futures:
+            data = futures.popleft().result()
+            for range_offset in offsets:
+                futures.append(pool.submit(fetch_range, range_offset, min(range_size, size - range_offset)))
+                break
+            yield data
+            del data
+    finally:
+        for future in futures:
+            future.cancel()
+        if owns_executor:
+            pool.shutdown(wait=False)
+
+
+async def async_http_range_chunks(
+    url: str,
+    headers: Optional[Dict[str, str]]=None,
+    range_size: int=_DEFAULT_RANGE_SIZE,
+    max_connections: int=_DEFAULT_MAX_CONNECTIONS,
+    max_bytes_ahead: int=_DEFAULT_MAX_RANGE_BYTES_AHEAD,
+    executor: Optional[Executor]=None,
+    offset: int=0,
+    timeout: Optional[float]=_DEFAULT_HTTP_TIMEOUT,
+) -> AsyncGenerator[bytes, None]:
+    # As http_range_chunks, for passing to async_stream_unzip. The ranges are still fetched in
+    # threads, and the event loop waits on a thread for each range in turn
+    done = object()
+    trio = None
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        import trio  # type: ignore [no-redef]
 
-    async for name, size, chunks in to_async_iterable(unzipped_chunks):
-        yield name, size, to_async_iterable(chunks)
+    chunks = http_range_chunks(url, headers, range_size, max_connections, max_bytes_ahead, executor, offset, timeout)
+    is_in_thread = False
+    try:
+        while True:
+            is_in_thread = True
+            if trio is not None:
+                chunk = await trio.to_thread.run_sync(next, chunks, done)
+            else:
+                chunk = await loop.run_in_executor(None, next, chunks, done)
+            is_in_thread = False
+            if chunk is done:
+                break
+            yield chunk  # type: ignore [misc]
+    finally:
+        # If cancelled while waiting for a range, the generator is still running in the thread,
+        # and is closed once it's garbage collected
+        if not is_in_thread:
+            chunks.close()
+
+
+def chrome_trace_observer(file: IO[str]) -> Callable[[str, Dict[str, Any]], None]:
+    # Returns an observer that writes a span for each stage and each member as Chrome trace events
+    # in the JSON array format, which both chrome://tracing and Perfetto can open. The array is
+    # closed at the end of the stream, but both can also open it if unzipping stops before then
+    import json
+
+    pid = os.getpid()
+    thread_ids = set()
+    encryption_names = {NO_ENCRYPTION: 'none', ZIP_CRYPTO: 'zipcrypto', AE_1: 'ae-1', AE_2: 'ae-2'}
+    member_id = 0
+    is_first = True
+    is_closed = False
+
+    def write(event):
+        nonlocal is_first
+        file.write(('[\n' if is_first else ',\n') + json.dumps(event))
+        is_first = False
+
+    def microseconds(seconds):
+        return round(seconds * 1000000, 3)
+
+    def decoded(name):
+        return name.decode('utf-8', 'replace') if name is not None else None
+
+    def observer(event, details):
+        nonlocal member_id, is_closed
+        if is_closed:
+            return
+
+        # The observer is called from the thread the event happened in, which under
+        # async_stream_unzip can be a thread of the executor
+        thread_id = threading.get_ident()
+        if thread_id not in thread_ids:
+            thread_ids.add(thread_id)
+            write({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': thread_id, 'args': {'name': threading.current_thread().name}})
+
+        if event == 'span':
+            write({
+                'name': details['stage'], 'cat': 'stage', 'ph': 'X', 'pid': pid, 'tid': details['thread_id'],
+                'ts': microseconds(details['start']), 'dur': microseconds(details['end'] - details['start']),
+                'args': {'member': decoded(details['name'])},
+            })
+        elif event == 'member_start':
+            member_id += 1
+            write({
+                'name': decoded(details['name']), 'cat': 'member', 'ph': 'b', 'id': member_id, 'pid': pid, 'tid': thread_id,
+                'ts': microseconds(perf_counter()),
+                'args': {**details, 'name': decoded(details['name']), 'encryption': encryption_names[details['encryption']]},
+            })
+        elif event == 'member_end':
+            write({
+                'name': decoded(details['name']), 'cat': 'member', 'ph': 'e', 'id': member_id, 'pid': pid, 'tid': thread_id,
+                'ts': microseconds(perf_counter()),
+                'args': {**details, 'name': decoded(details['name'])},
+            })
+        elif event == 'read_ahead':
+            write({
+                'name': 'read_ahead', 'ph': 'C', 'pid': pid, 'tid': thread_id,
+                'ts': microseconds(perf_counter()),
+                'args': {'buffered_bytes': details['buffered_bytes']},
+            })
+        elif event == 'stream_end':
+            write({
+                'name': 'stream_end', 'cat': 'stream', 'ph': 'i', 's': 'p', 'pid': pid, 'tid': thread_id,
+                'ts': microseconds(perf_counter()),
+                'args': details,
+            })
+            file.write('\n]\n')
+            is_closed = True
+
+    return observer
+
+
+def register_decompressor(
+    compression: int,
+    get_decompressor: Callable[[int], Tuple[Callable[[Union[bytes, memoryview]], Iterable[bytes]], Callable[[], bool], Callable[[], int]]],
+) -> None:
+    # Called with chunk_size for each member file compressed with the method. Of the functions it
+    # returns, the first is called with each chunk of compressed data and yields the decompressed
+    # bytes, the second returns whether the end of the compressed data has been reached, and the
+    # third the number of bytes at the end of the last chunk that are after the end. The registry is
+    # for the whole process, and a registered decompressor replaces any built-in one for the method.
+    # Chunks can be views into buffers that are reused for later input, so they must not be kept
+    _registered_decompressors[compression] = get_decompressor
+
+
+def unregister_decompressor(compression: int) -> None:
+    # Removes the decompressor registered for the method, if there is one, so any built-in one is
+    # used again
+    _registered_decompressors.pop(compression, None)
 
 
 class UnzipError(Exception):
@@ -562,6 +2465,12 @@ class InvalidOperationError(UnzipError):
 class UnfinishedIterationError(InvalidOperationError):
     pass
 
+class NonBlockingReadError(InvalidOperationError):
+    pass
+
+class RangeRequestError(UnzipError):
+    pass
+
 class UnzipValueError(UnzipError, ValueError):
     pass
 
@@ -577,6 +2486,12 @@ class DeflateError(UncompressError):
 class BZ2Error(UncompressError):
     pass
 
+class LZMAError(UncompressError):
+    pass
+
+class ZstdError(UncompressError):
+    pass
+
 class UnsupportedFeatureError(DataError):
     pass
 
@@ -598,6 +2513,12 @@ class TruncatedDataError(DataError):
 class UnexpectedSignatureError(DataError):
     pass
 
+class MissingEndOfCentralDirectoryError(DataError):
+    pass
+
+class MissingMemberFileError(DataError):
+    pass
+
 class MissingExtraError(DataError):
     pass
 
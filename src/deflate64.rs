@@ -0,0 +1,398 @@
+// A streaming Deflate64 inflater. Deflate64 is Deflate with a 64 KiB rather than 32 KiB window,
+// two more distance codes to reach into it, and length code 285 taking 16 extra bits rather than
+// meaning a length of 258.
+//
+// Input is appended to a buffer, and decoding stops either when the output limit is reached, or
+// when the buffer runs out part way through a symbol or block header. In that case the read
+// position goes back to the start of the symbol or header, and decoding resumes from there once
+// more input is available. Symbols are short and headers a few hundred bytes at most, so little
+// is ever decoded twice.
+
+const WINDOW_SIZE: usize = 65536;
+const WINDOW_MASK: usize = WINDOW_SIZE - 1;
+const MAX_CODE_LENGTH: usize = 15;
+const END_OF_BLOCK: u16 = 256;
+
+const LENGTH_BASES: [u16; 29] = [
+    3, 4, 5, 6, 7, 8, 9, 10, 11, 13, 15, 17, 19, 23, 27, 31, 35, 43, 51, 59, 67, 83, 99, 115, 131,
+    163, 195, 227, 3,
+];
+const LENGTH_EXTRA_BITS: [u8; 29] = [
+    0, 0, 0, 0, 0, 0, 0, 0, 1, 1, 1, 1, 2, 2, 2, 2, 3, 3, 3, 3, 4, 4, 4, 4, 5, 5, 5, 5, 16,
+];
+const DISTANCE_BASES: [u32; 32] = [
+    1, 2, 3, 4, 5, 7, 9, 13, 17, 25, 33, 49, 65, 97, 129, 193, 257, 385, 513, 769, 1025, 1537,
+    2049, 3073, 4097, 6145, 8193, 12289, 16385, 24577, 32769, 49153,
+];
+const DISTANCE_EXTRA_BITS: [u8; 32] = [
+    0, 0, 0, 0, 1, 1, 2, 2, 3, 3, 4, 4, 5, 5, 6, 6, 7, 7, 8, 8, 9, 9, 10, 10, 11, 11, 12, 12, 13,
+    13, 14, 14,
+];
+const CODE_LENGTH_ORDER: [usize; 19] = [16, 17, 18, 0, 8, 7, 9, 6, 10, 5, 11, 4, 12, 3, 13, 2, 14, 1, 15];
+
+#[derive(Debug, PartialEq)]
+pub enum Status {
+    NeedsInput,
+    OutputFull,
+    Done,
+}
+
+// A canonical Huffman code as a table indexed by the next max_length bits of input, each entry
+// being the symbol in the low 12 bits and its code length in the high 4. Deflate packs codes
+// starting from their most significant bit, so the table is indexed by the bit-reversed codes
+struct Huffman {
+    table: Vec<u16>,
+    max_length: u32,
+}
+
+impl Huffman {
+    fn new(lengths: &[u8]) -> Result<Self, &'static str> {
+        let mut counts = [0u16; MAX_CODE_LENGTH + 1];
+        for &length in lengths {
+            counts[length as usize] += 1;
+        }
+        counts[0] = 0;
+        let max_length = (1..=MAX_CODE_LENGTH).rev().find(|&l| counts[l] != 0).unwrap_or(0);
+
+        // The number of codes still available at each length must never go negative
+        let mut num_left = 1i32;
+        for length in 1..=MAX_CODE_LENGTH {
+            num_left = (num_left << 1) - counts[length] as i32;
+            if num_left < 0 {
+                return Err("invalid Huffman code lengths");
+            }
+        }
+
+        let mut next_code = [0u32; MAX_CODE_LENGTH + 1];
+        let mut code = 0u32;
+        for length in 1..=MAX_CODE_LENGTH {
+            code = (code + counts[length - 1] as u32) << 1;
+            next_code[length] = code;
+        }
+
+        // Entries left as zero are codes that aren't used, which are only valid in incomplete
+        // codes, and are reported as errors if reached
+        let mut table = vec![0u16; 1 << max_length];
+        for (symbol, &length) in lengths.iter().enumerate() {
+            if length == 0 {
+                continue;
+            }
+            let length = length as usize;
+            let code = next_code[length];
+            next_code[length] += 1;
+            let reversed = (code.reverse_bits() >> (32 - length)) as usize;
+            let entry = (symbol as u16) | ((length as u16) << 12);
+            let mut index = reversed;
+            while index < table.len() {
+                table[index] = entry;
+                index += 1 << length;
+            }
+        }
+
+        Ok(Huffman { table, max_length: max_length as u32 })
+    }
+}
+
+enum State {
+    BlockHeader,
+    Stored { remaining: usize },
+    Codes,
+    Done,
+}
+
+pub struct Inflater {
+    input: Vec<u8>,
+    bit_pos: usize,
+    window: Vec<u8>,
+    window_pos: usize,
+    num_output: u64,
+    state: State,
+    is_final_block: bool,
+    literal_lengths: Huffman,
+    distances: Huffman,
+    copy_length: usize,
+    copy_distance: usize,
+}
+
+impl Inflater {
+    pub fn new() -> Self {
+        Inflater {
+            input: Vec::new(),
+            bit_pos: 0,
+            window: vec![0u8; WINDOW_SIZE],
+            window_pos: 0,
+            num_output: 0,
+            state: State::BlockHeader,
+            is_final_block: false,
+            literal_lengths: Huffman { table: Vec::new(), max_length: 0 },
+            distances: Huffman { table: Vec::new(), max_length: 0 },
+            copy_length: 0,
+            copy_distance: 0,
+        }
+    }
+
+    pub fn is_done(&self) -> bool {
+        matches!(self.state, State::Done)
+    }
+
+    // The input after the end of the Deflate64 stream, which is only known once it's done
+    pub fn unused_data(&self) -> &[u8] {
+        if self.is_done() {
+            &self.input[(self.bit_pos + 7) / 8..]
+        } else {
+            &[]
+        }
+    }
+
+    pub fn push(&mut self, data: &[u8]) {
+        // Whole bytes that have been consumed are removed, but only once they're at least half of
+        // the buffer, so the cost of moving what's left is proportional to what's been consumed
+        let num_consumed = self.bit_pos / 8;
+        if num_consumed > 0 && num_consumed * 2 >= self.input.len() {
+            self.input.drain(..num_consumed);
+            self.bit_pos -= num_consumed * 8;
+        }
+        self.input.extend_from_slice(data);
+    }
+
+    fn num_bits_available(&self) -> usize {
+        self.input.len() * 8 - self.bit_pos
+    }
+
+    // The next 32 bits of input, least significant first, padded with zeros past its end
+    #[inline(always)]
+    fn peek_32(&self) -> u32 {
+        let byte_pos = self.bit_pos / 8;
+        let mut bytes = [0u8; 8];
+        let available = self.input.len().saturating_sub(byte_pos).min(8);
+        bytes[..available].copy_from_slice(&self.input[byte_pos..byte_pos + available]);
+        (u64::from_le_bytes(bytes) >> (self.bit_pos % 8)) as u32
+    }
+
+    #[inline(always)]
+    fn read_bits(&mut self, num_bits: u32) -> Option<u32> {
+        if self.num_bits_available() < num_bits as usize {
+            return None;
+        }
+        let bits = if num_bits == 0 { 0 } else { self.peek_32() & (u32::MAX >> (32 - num_bits)) };
+        self.bit_pos += num_bits as usize;
+        Some(bits)
+    }
+
+    #[inline(always)]
+    fn read_symbol(&mut self, huffman_is_distances: bool) -> Result<Option<u16>, &'static str> {
+        let huffman = if huffman_is_distances { &self.distances } else { &self.literal_lengths };
+        if huffman.max_length == 0 {
+            return Err("invalid Huffman code");
+        }
+        let entry = huffman.table[(self.peek_32() & ((1 << huffman.max_length) - 1)) as usize];
+        let length = (entry >> 12) as usize;
+        if length == 0 {
+            // Could be the zero padding past the end of the input that doesn't match a code
+            if self.num_bits_available() < huffman.max_length as usize {
+                return Ok(None);
+            }
+            return Err("invalid Huffman code");
+        }
+        if self.num_bits_available() < length {
+            return Ok(None);
+        }
+        self.bit_pos += length;
+        Ok(Some(entry & 0x0FFF))
+    }
+
+    #[inline(always)]
+    fn output_byte(&mut self, byte: u8, out: &mut Vec<u8>) {
+        self.window[self.window_pos] = byte;
+        self.window_pos = (self.window_pos + 1) & WINDOW_MASK;
+        out.push(byte);
+    }
+
+    fn read_block_header(&mut self) -> Result<Option<State>, &'static str> {
+        let is_final_block = match self.read_bits(1) { Some(bit) => bit == 1, None => return Ok(None) };
+        let block_type = match self.read_bits(2) { Some(bits) => bits, None => return Ok(None) };
+
+        let state = match block_type {
+            0 => {
+                self.bit_pos = (self.bit_pos + 7) / 8 * 8;
+                let length = match self.read_bits(16) { Some(bits) => bits, None => return Ok(None) };
+                let length_complement = match self.read_bits(16) { Some(bits) => bits, None => return Ok(None) };
+                if length != !length_complement & 0xFFFF {
+                    return Err("invalid stored block lengths");
+                }
+                State::Stored { remaining: length as usize }
+            }
+            1 => {
+                let mut lengths = [0u8; 288 + 32];
+                lengths[..144].fill(8);
+                lengths[144..256].fill(9);
+                lengths[256..280].fill(7);
+                lengths[280..288].fill(8);
+                lengths[288..].fill(5);
+                self.literal_lengths = Huffman::new(&lengths[..288])?;
+                self.distances = Huffman::new(&lengths[288..])?;
+                State::Codes
+            }
+            2 => {
+                let num_literal_lengths = match self.read_bits(5) { Some(bits) => bits as usize + 257, None => return Ok(None) };
+                let num_distances = match self.read_bits(5) { Some(bits) => bits as usize + 1, None => return Ok(None) };
+                let num_code_lengths = match self.read_bits(4) { Some(bits) => bits as usize + 4, None => return Ok(None) };
+
+                let mut code_length_lengths = [0u8; 19];
+                for &i in &CODE_LENGTH_ORDER[..num_code_lengths] {
+                    code_length_lengths[i] = match self.read_bits(3) { Some(bits) => bits as u8, None => return Ok(None) };
+                }
+                // Temporarily the literal/length code, since read_symbol reads from it
+                self.literal_lengths = Huffman::new(&code_length_lengths)?;
+
+                let mut lengths = [0u8; 288 + 32];
+                let num_lengths = num_literal_lengths + num_distances;
+                let mut i = 0;
+                while i < num_lengths {
+                    let symbol = match self.read_symbol(false)? { Some(symbol) => symbol, None => return Ok(None) };
+                    let (value, repeat) = match symbol {
+                        0..=15 => (symbol as u8, 1),
+                        16 => {
+                            if i == 0 {
+                                return Err("invalid code length repeat");
+                            }
+                            match self.read_bits(2) { Some(bits) => (lengths[i - 1], bits as usize + 3), None => return Ok(None) }
+                        }
+                        17 => match self.read_bits(3) { Some(bits) => (0, bits as usize + 3), None => return Ok(None) },
+                        _ => match self.read_bits(7) { Some(bits) => (0, bits as usize + 11), None => return Ok(None) },
+                    };
+                    if i + repeat > num_lengths {
+                        return Err("invalid code length repeat");
+                    }
+                    lengths[i..i + repeat].fill(value);
+                    i += repeat;
+                }
+
+                if lengths[END_OF_BLOCK as usize] == 0 {
+                    return Err("missing end-of-block code");
+                }
+                self.literal_lengths = Huffman::new(&lengths[..num_literal_lengths])?;
+                self.distances = Huffman::new(&lengths[num_literal_lengths..num_lengths])?;
+                State::Codes
+            }
+            _ => return Err("invalid block type"),
+        };
+
+        self.is_final_block = is_final_block;
+        Ok(Some(state))
+    }
+
+    // Decodes until there is no more input, the output has max_length bytes, or the end of the
+    // stream is reached. The output is appended to `out`
+    pub fn inflate(&mut self, out: &mut Vec<u8>, max_length: usize) -> Result<Status, &'static str> {
+        let limit = out.len().saturating_add(max_length);
+
+        loop {
+            match self.state {
+                State::Done => return Ok(Status::Done),
+                State::BlockHeader => {
+                    let start = self.bit_pos;
+                    match self.read_block_header() {
+                        Ok(Some(state)) => self.state = state,
+                        Ok(None) => {
+                            self.bit_pos = start;
+                            return Ok(Status::NeedsInput);
+                        }
+                        Err(e) => return Err(e),
+                    }
+                }
+                State::Stored { remaining } => {
+                    if remaining == 0 {
+                        self.state = if self.is_final_block { State::Done } else { State::BlockHeader };
+                        continue;
+                    }
+                    if out.len() >= limit {
+                        return Ok(Status::OutputFull);
+                    }
+                    let byte_pos = self.bit_pos / 8;
+                    let num = remaining.min(self.input.len() - byte_pos).min(limit - out.len());
+                    if num == 0 {
+                        return Ok(Status::NeedsInput);
+                    }
+                    for i in byte_pos..byte_pos + num {
+                        let byte = self.input[i];
+                        self.output_byte(byte, out);
+                    }
+                    self.bit_pos += num * 8;
+                    self.num_output += num as u64;
+                    self.state = State::Stored { remaining: remaining - num };
+                }
+                State::Codes => {
+                    while self.copy_length > 0 {
+                        if out.len() >= limit {
+                            return Ok(Status::OutputFull);
+                        }
+                        let num = self.copy_length.min(limit - out.len());
+                        for _ in 0..num {
+                            let byte = self.window[(self.window_pos.wrapping_sub(self.copy_distance)) & WINDOW_MASK];
+                            self.output_byte(byte, out);
+                        }
+                        self.copy_length -= num;
+                        self.num_output += num as u64;
+                    }
+
+                    if out.len() >= limit {
+                        return Ok(Status::OutputFull);
+                    }
+
+                    let start = self.bit_pos;
+                    let symbol = match self.read_symbol(false)? {
+                        Some(symbol) => symbol,
+                        None => return Ok(Status::NeedsInput),
+                    };
+
+                    if symbol < END_OF_BLOCK {
+                        self.output_byte(symbol as u8, out);
+                        self.num_output += 1;
+                        continue;
+                    }
+                    if symbol == END_OF_BLOCK {
+                        self.state = if self.is_final_block { State::Done } else { State::BlockHeader };
+                        continue;
+                    }
+
+                    let length_index = (symbol - 257) as usize;
+                    if length_index >= LENGTH_BASES.len() {
+                        return Err("invalid length code");
+                    }
+                    let length_extra = match self.read_bits(LENGTH_EXTRA_BITS[length_index] as u32) {
+                        Some(bits) => bits,
+                        None => {
+                            self.bit_pos = start;
+                            return Ok(Status::NeedsInput);
+                        }
+                    };
+                    let distance_index = match self.read_symbol(true)? {
+                        Some(symbol) => symbol as usize,
+                        None => {
+                            self.bit_pos = start;
+                            return Ok(Status::NeedsInput);
+                        }
+                    };
+                    if distance_index >= DISTANCE_BASES.len() {
+                        return Err("invalid distance code");
+                    }
+                    let distance_extra = match self.read_bits(DISTANCE_EXTRA_BITS[distance_index] as u32) {
+                        Some(bits) => bits,
+                        None => {
+                            self.bit_pos = start;
+                            return Ok(Status::NeedsInput);
+                        }
+                    };
+
+                    let distance = (DISTANCE_BASES[distance_index] + distance_extra) as usize;
+                    if distance as u64 > self.num_output {
+                        return Err("invalid distance too far back");
+                    }
+                    self.copy_length = LENGTH_BASES[length_index] as usize + length_extra as usize;
+                    self.copy_distance = distance;
+                }
+            }
+        }
+    }
+}
@@ -1,12 +1,54 @@
+use aes::{Aes128, Aes192, Aes256};
+use ctr::cipher::{KeyIvInit, StreamCipher};
+use ctr::Ctr128LE;
+use hmac::{Hmac, Mac};
+use pyo3::buffer::PyBuffer;
+use pyo3::exceptions::PyValueError;
 use pyo3::prelude::*;
 use pyo3::types::PyBytes;
-use crc32_v2::crc32;
+
+mod deflate64;
 
 // ZipCrypto key initialization vector and constants
 const ZIPCRYPTO_KEY_0: u32 = 0x12345678;
 const ZIPCRYPTO_KEY_1: u32 = 0x23456789;
 const ZIPCRYPTO_KEY_2: u32 = 0x34567890;
 
+// WinZip AES key derivation and password verification constants
+const AES_PBKDF2_ITERATIONS: u32 = 1000;
+const AES_PASSWORD_VERIFICATION_LENGTH: usize = 2;
+
+// AES-CTR and HMAC-SHA1 are applied to this many bytes at a time, so each block of ciphertext is
+// still in cache when it's read the second time
+const AES_BLOCK_LEN_FOR_ONE_PASS: usize = 4096;
+
+// Chunks smaller than this are decrypted without releasing the GIL, since for them the cost of
+// releasing and reacquiring it would be more than the cost of decrypting
+const MIN_LEN_TO_RELEASE_GIL: usize = 4096;
+
+// The table for the byte-at-a-time CRC-32 that ZipCrypto uses to update its keys, computed at
+// compile time
+const CRC_TABLE: [u32; 256] = {
+    let mut table = [0u32; 256];
+    let mut i = 0;
+    while i < 256 {
+        let mut crc = i as u32;
+        let mut j = 0;
+        while j < 8 {
+            crc = if crc & 1 != 0 { 0xEDB88320 ^ (crc >> 1) } else { crc >> 1 };
+            j += 1;
+        }
+        table[i] = crc;
+        i += 1;
+    }
+    table
+};
+
+#[inline(always)]
+fn crc32_update(crc: u32, byte: u8) -> u32 {
+    CRC_TABLE[((crc ^ byte as u32) & 0xFF) as usize] ^ (crc >> 8)
+}
+
 #[derive(Clone)]
 struct ZipCrypto {
     key_0: u32,
@@ -32,7 +74,7 @@ impl ZipCrypto {
 
     #[inline(always)]
     fn update_keys(&mut self, byte: u8) {
-        self.key_0 = !crc32(!self.key_0, &[byte]);
+        self.key_0 = crc32_update(self.key_0, byte);
 
         self.key_1 = self
             .key_1
@@ -40,8 +82,7 @@ impl ZipCrypto {
             .wrapping_mul(134775813)
             .wrapping_add(1);
 
-        let temp_byte = (self.key_1 >> 24) as u8;
-        self.key_2 = !crc32(!self.key_2, &[temp_byte]);
+        self.key_2 = crc32_update(self.key_2, (self.key_1 >> 24) as u8);
     }
 
     #[inline(always)]
@@ -54,9 +95,22 @@ impl ZipCrypto {
     }
 
     #[inline(always)]
-    fn decrypt_chunk(&mut self, chunk: &[u8]) -> Vec<u8> {
-        chunk.iter().map(|&b| self.decrypt_byte(b)).collect()
+    fn decrypt_chunk_into(&mut self, chunk: &[u8], out: &mut [u8]) {
+        for (o, &b) in out.iter_mut().zip(chunk) {
+            *o = self.decrypt_byte(b);
+        }
+    }
+}
+
+// Returns a slice of the bytes of a buffer without copying them. The slice is only valid while the
+// buffer is alive, and its contents are only stable if nothing else writes to the underlying object
+// while it's in use, which is the same contract as for any other code that releases the GIL while
+// using a buffer, for example hashlib
+fn buffer_as_slice<'a>(buffer: &'a PyBuffer<u8>) -> PyResult<&'a [u8]> {
+    if !buffer.is_c_contiguous() {
+        return Err(PyValueError::new_err("buffer must be contiguous"));
     }
+    Ok(unsafe { std::slice::from_raw_parts(buffer.buf_ptr() as *const u8, buffer.len_bytes()) })
 }
 
 #[pyclass(name = "zipcrypto_decryptor")]
@@ -64,6 +118,17 @@ struct StreamUnzipZipCryptoDecryptor {
     zipcrypto: ZipCrypto,
 }
 
+impl StreamUnzipZipCryptoDecryptor {
+    fn decrypt_slice_into(&mut self, py: Python<'_>, chunk: &[u8], out: &mut [u8]) {
+        let zipcrypto = &mut self.zipcrypto;
+        if chunk.len() >= MIN_LEN_TO_RELEASE_GIL {
+            py.detach(|| zipcrypto.decrypt_chunk_into(chunk, out));
+        } else {
+            zipcrypto.decrypt_chunk_into(chunk, out);
+        }
+    }
+}
+
 #[pymethods]
 impl StreamUnzipZipCryptoDecryptor {
     #[new]
@@ -73,11 +138,198 @@ impl StreamUnzipZipCryptoDecryptor {
         StreamUnzipZipCryptoDecryptor { zipcrypto }
     }
 
-    // Decrypts a single chunk and returns the decrypted result
-    fn __call__<'py>(&mut self, py: Python<'py>, chunk: Vec<u8>) -> PyResult<Bound<'py, PyBytes>> {
-        let result = self.zipcrypto.decrypt_chunk(&chunk);
-        // Return the decrypted result as a Python bytes object so it can be used in Python code
-        Ok(PyBytes::new(py, &result))
+    // Decrypts a chunk of any object supporting the buffer protocol, for example bytes or a
+    // memoryview, into a new bytes object
+    fn __call__<'py>(&mut self, py: Python<'py>, chunk: PyBuffer<u8>) -> PyResult<Bound<'py, PyBytes>> {
+        let chunk_slice = buffer_as_slice(&chunk)?;
+        PyBytes::new_with(py, chunk_slice.len(), |out: &mut [u8]| {
+            self.decrypt_slice_into(py, chunk_slice, out);
+            Ok(())
+        })
+    }
+}
+
+type HmacSha1 = Hmac<sha1::Sha1>;
+
+enum AesCtr {
+    Aes128(Ctr128LE<Aes128>),
+    Aes192(Ctr128LE<Aes192>),
+    Aes256(Ctr128LE<Aes256>),
+}
+
+impl AesCtr {
+    fn new(key: &[u8]) -> Option<Self> {
+        // WinZip AES uses a little-endian counter that starts at 1
+        let mut iv = [0u8; 16];
+        iv[0] = 1;
+        match key.len() {
+            16 => Ctr128LE::<Aes128>::new_from_slices(key, &iv).ok().map(AesCtr::Aes128),
+            24 => Ctr128LE::<Aes192>::new_from_slices(key, &iv).ok().map(AesCtr::Aes192),
+            32 => Ctr128LE::<Aes256>::new_from_slices(key, &iv).ok().map(AesCtr::Aes256),
+            _ => None,
+        }
+    }
+
+    #[inline(always)]
+    fn apply_keystream_b2b(&mut self, chunk: &[u8], out: &mut [u8]) {
+        // Only fails if the lengths differ or the counter wraps, and neither can happen
+        match self {
+            AesCtr::Aes128(cipher) => cipher.apply_keystream_b2b(chunk, out).unwrap(),
+            AesCtr::Aes192(cipher) => cipher.apply_keystream_b2b(chunk, out).unwrap(),
+            AesCtr::Aes256(cipher) => cipher.apply_keystream_b2b(chunk, out).unwrap(),
+        }
+    }
+}
+
+// The HMAC is of the encrypted data, so it's updated with each block before it's decrypted
+fn decrypt_and_authenticate_into(cipher: &mut AesCtr, hmac: &mut HmacSha1, chunk: &[u8], out: &mut [u8]) {
+    for (chunk_block, out_block) in chunk.chunks(AES_BLOCK_LEN_FOR_ONE_PASS).zip(out.chunks_mut(AES_BLOCK_LEN_FOR_ONE_PASS)) {
+        hmac.update(chunk_block);
+        cipher.apply_keystream_b2b(chunk_block, out_block);
+    }
+}
+
+#[pyclass(name = "aes_decryptor")]
+struct StreamUnzipAesDecryptor {
+    cipher: AesCtr,
+    hmac: HmacSha1,
+    // The state of the HMAC before the most recent chunk, so if the chunk turns out to extend past
+    // the end of the member, the bytes after the end can be taken out of the HMAC
+    hmac_before_last_chunk: HmacSha1,
+    password_verification: [u8; AES_PASSWORD_VERIFICATION_LENGTH],
+}
+
+#[pymethods]
+impl StreamUnzipAesDecryptor {
+    #[new]
+    fn new(py: Python<'_>, password: &[u8], salt: &[u8], key_length: usize) -> PyResult<Self> {
+        let mut keys = vec![0u8; 2 * key_length + AES_PASSWORD_VERIFICATION_LENGTH];
+        py.detach(|| pbkdf2::pbkdf2_hmac::<sha1::Sha1>(password, salt, AES_PBKDF2_ITERATIONS, &mut keys));
+
+        let cipher = AesCtr::new(&keys[..key_length])
+            .ok_or_else(|| PyValueError::new_err("key_length must be 16, 24 or 32"))?;
+        let hmac = HmacSha1::new_from_slice(&keys[key_length..2 * key_length])
+            .map_err(|_| PyValueError::new_err("invalid HMAC key length"))?;
+        let mut password_verification = [0u8; AES_PASSWORD_VERIFICATION_LENGTH];
+        password_verification.copy_from_slice(&keys[2 * key_length..]);
+
+        Ok(StreamUnzipAesDecryptor {
+            cipher,
+            hmac_before_last_chunk: hmac.clone(),
+            hmac,
+            password_verification,
+        })
+    }
+
+    #[getter]
+    fn password_verification<'py>(&self, py: Python<'py>) -> Bound<'py, PyBytes> {
+        PyBytes::new(py, &self.password_verification)
+    }
+
+    // Decrypts a chunk of any object supporting the buffer protocol into a new bytes object, and
+    // updates the HMAC with the chunk in the same pass
+    fn __call__<'py>(&mut self, py: Python<'py>, chunk: PyBuffer<u8>) -> PyResult<Bound<'py, PyBytes>> {
+        let chunk_slice = buffer_as_slice(&chunk)?;
+        self.hmac_before_last_chunk = self.hmac.clone();
+        let cipher = &mut self.cipher;
+        let hmac = &mut self.hmac;
+        PyBytes::new_with(py, chunk_slice.len(), |out: &mut [u8]| {
+            if chunk_slice.len() >= MIN_LEN_TO_RELEASE_GIL {
+                py.detach(|| decrypt_and_authenticate_into(cipher, hmac, chunk_slice, out));
+            } else {
+                decrypt_and_authenticate_into(cipher, hmac, chunk_slice, out);
+            }
+            Ok(())
+        })
+    }
+
+    // Returns the HMAC-SHA1 of the encrypted data. The last chunk passed to the decryptor must be
+    // passed again, along with the number of bytes at its end that are not part of the member
+    fn hmac_digest<'py>(&mut self, py: Python<'py>, last_chunk: PyBuffer<u8>, num_unused: usize) -> PyResult<Bound<'py, PyBytes>> {
+        if num_unused != 0 {
+            let last_chunk_slice = buffer_as_slice(&last_chunk)?;
+            if num_unused > last_chunk_slice.len() {
+                return Err(PyValueError::new_err("num_unused is longer than the last chunk"));
+            }
+            self.hmac = self.hmac_before_last_chunk.clone();
+            self.hmac.update(&last_chunk_slice[..last_chunk_slice.len() - num_unused]);
+        }
+        Ok(PyBytes::new(py, &self.hmac.clone().finalize().into_bytes()))
+    }
+}
+
+// Updates a CRC-32 with the bytes of any object supporting the buffer protocol, taking and returning
+// it as an int in the same way as zlib.crc32. crc32fast uses carry-less multiplication instructions
+// where the CPU has them, and for large enough chunks the GIL is released so other threads, for
+// example one that fetches the next input, run at the same time
+#[pyfunction]
+#[pyo3(signature = (data, value=0))]
+fn crc32(py: Python<'_>, data: PyBuffer<u8>, value: u32) -> PyResult<u32> {
+    let data_slice = buffer_as_slice(&data)?;
+    let update = || {
+        let mut hasher = crc32fast::Hasher::new_with_initial(value);
+        hasher.update(data_slice);
+        hasher.finalize()
+    };
+    Ok(if data_slice.len() >= MIN_LEN_TO_RELEASE_GIL {
+        py.detach(update)
+    } else {
+        update()
+    })
+}
+
+#[pyclass(name = "deflate64_decompressor")]
+struct StreamUnzipDeflate64Decompressor {
+    inflater: deflate64::Inflater,
+    out: Vec<u8>,
+    needs_input: bool,
+}
+
+#[pymethods]
+impl StreamUnzipDeflate64Decompressor {
+    #[new]
+    fn new() -> Self {
+        StreamUnzipDeflate64Decompressor {
+            inflater: deflate64::Inflater::new(),
+            out: Vec::new(),
+            needs_input: true,
+        }
+    }
+
+    // Decompresses as much of the input passed so far as possible, but returns at most max_length
+    // bytes, in the same way as bz2.BZ2Decompressor.decompress. If needs_input is false afterwards,
+    // there is more output available without passing more input
+    fn decompress<'py>(&mut self, py: Python<'py>, data: PyBuffer<u8>, max_length: usize) -> PyResult<Bound<'py, PyBytes>> {
+        let data_slice = buffer_as_slice(&data)?;
+        let inflater = &mut self.inflater;
+        let out = &mut self.out;
+        out.clear();
+        let mut inflate = || {
+            inflater.push(data_slice);
+            inflater.inflate(out, max_length)
+        };
+        let status = if max_length >= MIN_LEN_TO_RELEASE_GIL {
+            py.detach(inflate)
+        } else {
+            inflate()
+        }.map_err(PyValueError::new_err)?;
+        self.needs_input = status == deflate64::Status::NeedsInput;
+        Ok(PyBytes::new(py, &self.out))
+    }
+
+    #[getter]
+    fn eof(&self) -> bool {
+        self.inflater.is_done()
+    }
+
+    #[getter]
+    fn needs_input(&self) -> bool {
+        self.needs_input
+    }
+
+    #[getter]
+    fn unused_data<'py>(&self, py: Python<'py>) -> Bound<'py, PyBytes> {
+        PyBytes::new(py, self.inflater.unused_data())
     }
 }
 
@@ -85,5 +337,8 @@ impl StreamUnzipZipCryptoDecryptor {
 #[pyo3(name="_zipcrypto")]
 fn zipcrypto(m: &Bound<'_, PyModule>) -> PyResult<()> {
     m.add_class::<StreamUnzipZipCryptoDecryptor>()?;
+    m.add_class::<StreamUnzipAesDecryptor>()?;
+    m.add_class::<StreamUnzipDeflate64Decompressor>()?;
+    m.add_function(wrap_pyfunction!(crc32, m)?)?;
     Ok(())
 }
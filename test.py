@@ -1,13 +1,37 @@
 import asyncio
+import contextlib
+import http.server
 import itertools
 import io
+import json
+import lzma
+import os
+import mmap
 import platform
 import unittest
+import unittest.mock
 import uuid
 import random
+import tempfile
+import struct
+import subprocess
+import sys
+import threading
 import zipfile
-
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from compression import zstd
+except ImportError:
+    try:
+        from backports import zstd
+    except ImportError:
+        zstd = None
+
+import stream_unzip as stream_unzip_module
 from stream_unzip import (
+    Checkpoint,
     NO_ENCRYPTION,
     ZIP_CRYPTO,
     AE_1,
@@ -15,9 +39,19 @@ from stream_unzip import (
     AES_128,
     AES_192,
     AES_256,
+    MemberFile,
+    async_http_range_chunks,
     async_stream_unzip,
+    chrome_trace_observer,
+    deflate_index,
+    http_range_chunks,
+    parallel_stream_unzip,
+    register_decompressor,
     stream_unzip,
+    unregister_decompressor,
+    unzip_from_deflate_index,
     UnfinishedIterationError,
+    NonBlockingReadError,
     TruncatedDataError,
     UnsupportedFlagsError,
     UnsupportedCompressionTypeError,
@@ -38,9 +72,186 @@ from stream_unzip import (
     AES192NotAllowed,
     AES256NotAllowed,
     DeflateError,
+    BZ2Error,
+    LZMAError,
+    ZstdError,
+    MissingEndOfCentralDirectoryError,
+    MissingMemberFileError,
+    RangeRequestError,
 )
 
 
+class CountingThreadPoolExecutor(ThreadPoolExecutor):
+    def __init__(self, max_workers=None):
+        super().__init__(max_workers=max_workers)
+        self.num_submitted = 0
+
+    def submit(self, *args, **kwargs):
+        self.num_submitted += 1
+        return super().submit(*args, **kwargs)
+
+
+def get_zip_bytes_compressed(files, compression, compress, flags=0):
+    # For compression methods that Python's zipfile module can't write. If bit 3 of the flags is
+    # set, the CRC and sizes are in a data descriptor rather than the local header
+    has_data_descriptor = flags & 0x08
+    local_files = []
+    central_directory = []
+    offset = 0
+    for name, contents in files:
+        compressed = compress(contents)
+        crc_32_and_sizes = struct.pack('<III', zlib.crc32(contents), len(compressed), len(contents))
+        local_file = \
+            struct.pack('<4sHHHHH', b'PK\x03\x04', 63, flags, compression, 0, 0) + \
+            (bytes(12) if has_data_descriptor else crc_32_and_sizes) + \
+            struct.pack('<HH', len(name), 0) + name + compressed + \
+            (b'PK\x07\x08' + crc_32_and_sizes if has_data_descriptor else b'')
+        central_directory.append(
+            struct.pack('<4sHHHHHH', b'PK\x01\x02', 63, 63, flags, compression, 0, 0) + crc_32_and_sizes + \
+            struct.pack('<HHHHHII', len(name), 0, 0, 0, 0, 0, offset) + name
+        )
+        local_files.append(local_file)
+        offset += len(local_file)
+
+    central_directory_bytes = b''.join(central_directory)
+    return b''.join(local_files) + central_directory_bytes + \
+        struct.pack('<4sHHHHIIH', b'PK\x05\x06', 0, 0, len(files), len(files), len(central_directory_bytes), offset, 0)
+
+
+def lzma_compress(contents):
+    # The version of the LZMA SDK and the size of the properties, and then the properties: lc=3,
+    # lp=0 and pb=2 packed into one byte, then the dictionary size
+    filters = [{'id': lzma.FILTER_LZMA1, 'lc': 3, 'lp': 0, 'pb': 2, 'dict_size': 1048576}]
+    return b'\x09\x14\x05\x00\x5d\x00\x00\x10\x00' + lzma.compress(contents, lzma.FORMAT_RAW, filters=filters)
+
+
+def lzma_compress_without_end_marker(contents):
+    # lzma.compress always ends LZMA data with an end of stream marker, so this encodes each byte
+    # as a literal with a minimal range encoder, as in the LZMA SDK, and ends without the marker.
+    # Only literals are encoded, so the state is always 0, and with lc=3, lp=0 and pb=2 the
+    # probabilities of each literal depend on the top 3 bits of the byte before it
+    is_match_probs = [1024] * 4
+    literal_probs = [[1024] * 0x300 for _ in range(0, 8)]
+    low, range_, cache, cache_size = 0, 0xFFFFFFFF, 0, 1
+    output = bytearray()
+
+    def shift_low():
+        nonlocal low, cache, cache_size
+        if low < 0xFF000000 or low >= 0x100000000:
+            carry = low >> 32
+            temp = cache
+            for _ in range(0, cache_size):
+                output.append((temp + carry) & 0xFF)
+                temp = 0xFF
+            cache_size = 0
+            cache = (low >> 24) & 0xFF
+        cache_size += 1
+        low = (low & 0x00FFFFFF) << 8
+
+    def encode_bit(probs, i, bit):
+        nonlocal low, range_
+        bound = (range_ >> 11) * probs[i]
+        if bit:
+            low += bound
+            range_ -= bound
+            probs[i] -= probs[i] >> 5
+        else:
+            range_ = bound
+            probs[i] += (2048 - probs[i]) >> 5
+        while range_ < 0x1000000:
+            range_ = (range_ << 8) & 0xFFFFFFFF
+            shift_low()
+
+    previous_byte = 0
+    for position, byte in enumerate(contents):
+        encode_bit(is_match_probs, position & 3, 0)
+        probs = literal_probs[previous_byte >> 5]
+        symbol = 1
+        for i in range(7, -1, -1):
+            bit = (byte >> i) & 1
+            encode_bit(probs, symbol, bit)
+            symbol = (symbol << 1) | bit
+        previous_byte = byte
+
+    for _ in range(0, 5):
+        shift_low()
+
+    return b'\x09\x14\x05\x00\x5d\x00\x00\x10\x00' + bytes(output)
+
+
+def get_native_or_skip(test, name):
+    # Returns an optional part of the native extension. If the extension was built without it the
+    # test is skipped, unless STREAM_UNZIP_REQUIRE_NATIVE is set, as it is in CI, when it fails
+    native = getattr(stream_unzip_module, name)
+    if native is None:
+        if os.environ.get('STREAM_UNZIP_REQUIRE_NATIVE'):
+            test.fail(f'The native extension was built without {name}')
+        test.skipTest(f'The native extension was built without {name}')
+    return native
+
+
+class UnseekableBytesIO(io.BytesIO):
+    # Python's zipfile module writes data descriptors when it can't seek the file
+    def seek(self, *args):
+        raise OSError()
+
+
+@contextlib.contextmanager
+def serve_http(body, supports_ranges=True, range_offset=0, num_requests_before_stall=None, size='{}'):
+    # A local stand-in for an HTTP server that supports range requests. Each response is delayed
+    # so that requests made at the same time overlap. range_offset shifts the ranges returned to
+    # test what happens if a server returns the wrong range, and requests after the first
+    # num_requests_before_stall get no response until the server is shut down. size is formatted
+    # with the length of the body for the end of the Content-Range header
+    stats = {'num_requests': 0, 'num_concurrent': 0, 'max_concurrent': 0}
+    lock = threading.Lock()
+    stalled = threading.Event()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            with lock:
+                stats['num_requests'] += 1
+                stats['num_concurrent'] += 1
+                stats['max_concurrent'] = max(stats['max_concurrent'], stats['num_concurrent'])
+                should_stall = num_requests_before_stall is not None and stats['num_requests'] > num_requests_before_stall
+            try:
+                if should_stall:
+                    stalled.wait()
+                    return
+                threading.Event().wait(0.01)
+                range_header = self.headers.get('Range')
+                if supports_ranges and range_header:
+                    start, end = (int(value) for value in range_header[len('bytes='):].split('-'))
+                    start += range_offset
+                    end = min(end + range_offset, len(body) - 1)
+                    self.send_response(206)
+                    self.send_header('Content-Range', 'bytes {}-{}/'.format(start, end) + size.format(len(body)))
+                    data = body[start:end + 1]
+                else:
+                    self.send_response(200)
+                    data = body
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+            finally:
+                with lock:
+                    stats['num_concurrent'] -= 1
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{}/archive.zip'.format(server.server_address[1]), stats
+    finally:
+        stalled.set()
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
 class TestStreamUnzip(unittest.TestCase):
 
     def test_methods_and_chunk_sizes(self):
@@ -81,6 +292,716 @@ class TestStreamUnzip(unittest.TestCase):
                 self.assertEqual(files[1][1], len(content))
                 self.assertEqual(files[1][2], content)
 
+    def test_lzma_zstd_xz(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        input_sizes = [1, 7, 65536]
+        output_sizes = [1, 7, 65536]
+        contents = [
+            b'short',
+            b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 1000)])
+        ]
+        compressions = [
+            # Bit 1 of the flags means the LZMA data ends with an end of stream marker. Without it
+            # the end is found from the compressed size, which isn't possible with a data descriptor
+            (14, lzma_compress, 0x02, 0x0A),
+            (14, lzma_compress, 0x00, None),
+            (14, lzma_compress_without_end_marker, 0x00, None),
+            (95, lzma.compress, 0x00, 0x08),
+        ] + ([
+            (93, zstd.compress, 0x00, 0x08),
+        ] if zstd is not None else [])
+
+        # Without the end of stream marker, the LZMA decompressor alone never reaches the end
+        for content in contents:
+            decompressor = lzma.LZMADecompressor(lzma.FORMAT_RAW, filters=[{'id': lzma.FILTER_LZMA1, 'lc': 3, 'lp': 0, 'pb': 2, 'dict_size': 1048576}])
+            self.assertEqual(decompressor.decompress(lzma_compress_without_end_marker(content)[9:]), content)
+            self.assertFalse(decompressor.eof)
+
+        for content, (compression, compress, flags, flags_with_data_descriptor), input_size, output_size in itertools.product(contents, compressions, input_sizes, output_sizes):
+            for member_flags in (flags, flags_with_data_descriptor):
+                if member_flags is None:
+                    continue
+                with self.subTest(content=content[:5], compression=compression, flags=member_flags, input_size=input_size, output_size=output_size):
+                    zip_bytes = get_zip_bytes_compressed([(b'first.txt', content), (b'second.txt', content)], compression, compress, member_flags)
+                    size = None if member_flags & 0x08 else len(content)
+                    files = [
+                        (name, size, b''.join(chunks))
+                        for name, size, chunks in stream_unzip((zip_bytes[i:i + input_size] for i in range(0, len(zip_bytes), input_size)), chunk_size=output_size)
+                    ]
+                    self.assertEqual(files, [
+                        (b'first.txt', size, content),
+                        (b'second.txt', size, content),
+                    ])
+
+    def test_lzma_zstd_xz_errors(self):
+        compressions = [
+            (14, lzma_compress, 0x02, LZMAError),
+            (95, lzma.compress, 0x00, LZMAError),
+        ] + ([
+            (93, zstd.compress, 0x00, ZstdError),
+        ] if zstd is not None else [])
+
+        for compression, compress, flags, exception_type in compressions:
+            with self.subTest(compression=compression):
+                zip_bytes = get_zip_bytes_compressed([(b'first.txt', b'-' * 100000)], compression, compress, flags)
+                with self.assertRaises(exception_type):
+                    for name, size, chunks in stream_unzip((zip_bytes[:50] + b'-' * 10 + zip_bytes[60:],)):
+                        for chunk in chunks:
+                            pass
+
+    def test_import_does_not_import_http_or_json(self):
+        # These are only needed by http_range_chunks and chrome_trace_observer
+        script = 'import sys, stream_unzip; print("urllib.request" in sys.modules, "json" in sys.modules)'
+        result = subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, check=True)
+        self.assertEqual(result.stdout, b'False False\n')
+
+    def test_lzma_module_missing(self):
+        # Python can be built without the lzma module. stream_unzip must still import and unzip
+        # other member files, and LZMA and XZ member files are then unsupported
+        script = '\n'.join((
+            'import io, sys, zipfile',
+            'sys.modules["lzma"] = None',
+            'from stream_unzip import stream_unzip',
+            'file = io.BytesIO()',
+            'with zipfile.ZipFile(file, "w", zipfile.ZIP_DEFLATED) as zf:',
+            '    zf.writestr("first.txt", b"-" * 1000)',
+            'print([(name, len(b"".join(chunks))) for name, size, chunks in stream_unzip((file.getvalue(),))])',
+        ))
+        result = subprocess.run([sys.executable, '-c', script], stdout=subprocess.PIPE, check=True)
+        self.assertEqual(result.stdout, b"[(b'first.txt', 1000)]\n")
+
+        for compression, compress, flags in ((14, lzma_compress, 0x02), (95, lzma.compress, 0x00)):
+            with self.subTest(compression=compression):
+                zip_bytes = get_zip_bytes_compressed([(b'first.txt', b'-' * 1000)], compression, compress, flags)
+                with unittest.mock.patch.dict(sys.modules, {'lzma': None}):
+                    with self.assertRaises(UnsupportedCompressionTypeError):
+                        for name, size, chunks in stream_unzip((zip_bytes,)):
+                            for chunk in chunks:
+                                pass
+
+    @unittest.skipIf(zstd is not None, 'Zstandard is supported')
+    def test_zstd_unsupported(self):
+        zip_bytes = get_zip_bytes_compressed([(b'first.txt', b'-')], 93, lambda contents: b'')
+        with self.assertRaises(UnsupportedCompressionTypeError):
+            for name, size, chunks in stream_unzip((zip_bytes,)):
+                for chunk in chunks:
+                    pass
+
+    def test_register_decompressor(self):
+        # Deflate, but with a compression method number that isn't otherwise supported
+        def compress(contents):
+            compress_obj = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+            return compress_obj.compress(contents) + compress_obj.flush()
+
+        chunk_sizes = []
+
+        def get_decompressor(chunk_size):
+            chunk_sizes.append(chunk_size)
+            dobj = zlib.decompressobj(wbits=-zlib.MAX_WBITS)
+
+            def _decompress(compressed_chunk):
+                yield dobj.decompress(compressed_chunk)
+
+            def _is_done():
+                return dobj.eof
+
+            def _num_unused():
+                return len(dobj.unused_data)
+
+            return _decompress, _is_done, _num_unused
+
+        content = b'0123456789' * 1000
+        zip_bytes = get_zip_bytes_compressed([(b'first.txt', content), (b'second.txt', content)], 64000, compress, 0x08)
+
+        with self.assertRaises(UnsupportedCompressionTypeError):
+            for name, size, chunks in stream_unzip((zip_bytes,)):
+                for chunk in chunks:
+                    pass
+
+        register_decompressor(64000, get_decompressor)
+        self.addCleanup(unregister_decompressor, 64000)
+        files = [
+            (name, size, b''.join(chunks))
+            for name, size, chunks in stream_unzip((zip_bytes[i:i + 100] for i in range(0, len(zip_bytes), 100)), chunk_size=1000)
+        ]
+        self.assertEqual(files, [
+            (b'first.txt', None, content),
+            (b'second.txt', None, content),
+        ])
+        self.assertEqual(chunk_sizes, [1000, 1000])
+
+        unregister_decompressor(64000)
+        with self.assertRaises(UnsupportedCompressionTypeError):
+            for name, size, chunks in stream_unzip((zip_bytes,)):
+                for chunk in chunks:
+                    pass
+
+        # A registered decompressor replaces a built-in one until it's unregistered
+        zip_bytes = get_zip_bytes_compressed([(b'first.txt', content)], 8, compress)
+        register_decompressor(8, get_decompressor)
+        self.addCleanup(unregister_decompressor, 8)
+        chunk_sizes.clear()
+        self.assertEqual([(name, b''.join(chunks)) for name, size, chunks in stream_unzip((zip_bytes,))], [(b'first.txt', content)])
+        self.assertEqual(len(chunk_sizes), 1)
+
+        unregister_decompressor(8)
+        chunk_sizes.clear()
+        self.assertEqual([(name, b''.join(chunks)) for name, size, chunks in stream_unzip((zip_bytes,))], [(b'first.txt', content)])
+        self.assertEqual(chunk_sizes, [])
+
+    def test_highly_compressible(self):
+        methods = [zipfile.ZIP_BZIP2, zipfile.ZIP_DEFLATED, zipfile.ZIP_LZMA]
+        input_sizes = [7, 65536, 10000000]
+        output_sizes = [100, 65536]
+        content = b'\0' * 5000000 + b'0123456789' * 100000
+
+        def yield_input(method, input_size):
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', method) as zf:
+                zf.writestr('first.txt', content)
+                zf.writestr('second.txt', content)
+
+            zip_bytes = file.getvalue()
+
+            for i in range(0, len(zip_bytes), input_size):
+                yield zip_bytes[i:i + input_size]
+
+        for method, input_size, output_size in itertools.product(methods, input_sizes, output_sizes):
+            with self.subTest(method=method, input_size=input_size, output_size=output_size):
+                files = [
+                    (name, size, b''.join(chunks))
+                    for name, size, chunks in stream_unzip(yield_input(method, input_size), chunk_size=output_size)
+                ]
+                self.assertEqual(files, [
+                    (b'first.txt', len(content), content),
+                    (b'second.txt', len(content), content),
+                ])
+
+    def test_bz2_executor(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        input_sizes = [1000, 65536, 10000000]
+        output_sizes = [100, 65536]
+
+        # Several bzip2 blocks, followed by a member with none
+        content = b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 100000)])
+
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_BZIP2) as zf:
+            zf.writestr('first.txt', content)
+            zf.writestr('second.txt', b'')
+        zip_bytes = file.getvalue()
+
+        def yield_input(input_size):
+            for i in range(0, len(zip_bytes), input_size):
+                yield zip_bytes[i:i + input_size]
+
+        executor = CountingThreadPoolExecutor()
+        for input_size, output_size in itertools.product(input_sizes, output_sizes):
+            with self.subTest(input_size=input_size, output_size=output_size):
+                files = [
+                    (name, size, b''.join(chunks))
+                    for name, size, chunks in stream_unzip(yield_input(input_size), chunk_size=output_size, bz2_executor=executor)
+                ]
+                self.assertEqual(files, [
+                    (b'first.txt', len(content), content),
+                    (b'second.txt', 0, b''),
+                ])
+        executor.shutdown()
+        self.assertEqual(executor.num_submitted, len(input_sizes) * len(output_sizes) * 4)
+
+        corrupt_zip_bytes = zip_bytes[:100000] + bytes(100) + zip_bytes[100100:]
+        with ThreadPoolExecutor() as executor:
+            with self.assertRaises(BZ2Error):
+                for name, size, chunks in stream_unzip((corrupt_zip_bytes,), bz2_executor=executor):
+                    for chunk in chunks:
+                        pass
+
+    def test_bz2_executor_single_worker(self):
+        # The executor that's passed is used even if its blocks can't run at the same time
+        rnd = random.Random()
+        rnd.seed(1)
+        content = b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 100000)])
+
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_BZIP2) as zf:
+            zf.writestr('first.txt', content)
+        zip_bytes = file.getvalue()
+
+        executor = CountingThreadPoolExecutor(max_workers=1)
+        files = [
+            (name, size, b''.join(chunks))
+            for name, size, chunks in stream_unzip((zip_bytes,), bz2_executor=executor)
+        ]
+        executor.shutdown()
+        self.assertEqual(files, [(b'first.txt', len(content), content)])
+        # One for each of the 900k blocks of the 3.2MB of content
+        self.assertEqual(executor.num_submitted, 4)
+
+    def test_pipelined(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        content = b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 2000)])
+        files = []
+        for method in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED, zipfile.ZIP_BZIP2):
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', method) as zf:
+                zf.writestr('first.txt', content)
+                zf.writestr('second.txt', b'')
+                zf.writestr('third.txt', content[:1000])
+            files.append(file.getvalue())
+
+        def yield_input(zip_bytes, input_size):
+            for i in range(0, len(zip_bytes), input_size):
+                yield zip_bytes[i:i + input_size]
+
+        num_threads = threading.active_count()
+        for zip_bytes, input_size, chunk_size in itertools.product(files, (7, 65536), (7, 65536)):
+            with self.subTest(input_size=input_size, chunk_size=chunk_size):
+                for zip_source in (yield_input(zip_bytes, input_size), io.BytesIO(zip_bytes), zip_bytes):
+                    unzipped = [
+                        (name, size, b''.join(chunks))
+                        for name, size, chunks in stream_unzip(zip_source, chunk_size=chunk_size, pipelined=True)
+                    ]
+                    self.assertEqual(unzipped, [
+                        (b'first.txt', len(content), content),
+                        (b'second.txt', 0, b''),
+                        (b'third.txt', 1000, content[:1000]),
+                    ])
+
+        # The rest of members whose chunks are closed early are discarded
+        unzipped = []
+        for name, size, chunks in stream_unzip(yield_input(files[1], 100), chunk_size=100, pipelined=True):
+            if name == b'first.txt':
+                next(chunks)
+                chunks.close()
+            else:
+                unzipped.append((name, b''.join(chunks)))
+        self.assertEqual(unzipped, [(b'second.txt', b''), (b'third.txt', content[:1000])])
+
+        with self.assertRaises(UnfinishedIterationError):
+            for name, size, chunks in stream_unzip(yield_input(files[1], 100), pipelined=True):
+                pass
+
+        # Stopping early stops the threads
+        for name, size, chunks in stream_unzip(yield_input(files[1], 100), chunk_size=100, pipelined=True):
+            next(chunks)
+            break
+        del chunks
+        for _ in range(0, 100):
+            if threading.active_count() == num_threads:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(threading.active_count(), num_threads)
+
+        # Errors are raised after the chunks before them
+        corrupt_zip_bytes = files[1][:16] + bytes([(files[1][16] + 1) % 256]) + files[1][17:]
+        unzipped_chunks = []
+        with self.assertRaises(CRC32IntegrityError):
+            for name, size, chunks in stream_unzip(yield_input(corrupt_zip_bytes, 100), pipelined=True):
+                for chunk in chunks:
+                    unzipped_chunks.append(chunk)
+        self.assertEqual(b''.join(unzipped_chunks), content)
+
+        with self.assertRaises(TruncatedDataError):
+            for name, size, chunks in stream_unzip(yield_input(files[1][:1000], 100), pipelined=True):
+                for chunk in chunks:
+                    pass
+
+    def test_read_ahead(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        content = b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 2000)])
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('first.txt', content)
+            zf.writestr('second.txt', content[:1000])
+        zip_bytes = file.getvalue()
+
+        def yield_input():
+            for i in range(0, len(zip_bytes), 1000):
+                yield zip_bytes[i:i + 1000]
+
+        num_threads = threading.active_count()
+        for source, pipelined in itertools.product((yield_input, lambda: io.BytesIO(zip_bytes)), (False, True)):
+            with self.subTest(pipelined=pipelined):
+                events = []
+                unzipped = [
+                    (name, size, b''.join(chunks))
+                    for name, size, chunks in stream_unzip(
+                        source(), chunk_size=1000, read_ahead_bytes=5000, pipelined=pipelined,
+                        observer=lambda event, details: events.append(details) if event == 'read_ahead' else None,
+                    )
+                ]
+                self.assertEqual(unzipped, [
+                    (b'first.txt', len(content), content),
+                    (b'second.txt', 1000, content[:1000]),
+                ])
+                self.assertEqual(len(events), (len(zip_bytes) + 999) // 1000)
+                for event in events:
+                    self.assertTrue(1 <= event['buffered_chunks'] <= 6)
+                    self.assertTrue(1 <= event['buffered_bytes'] < 6000)
+                    self.assertTrue(event['wait_seconds'] >= 0)
+
+        # Errors from the source are raised after the chunks before them
+        def yield_input_then_error():
+            yield from itertools.islice(yield_input(), 0, len(zip_bytes) // 2000)
+            raise ValueError('source')
+
+        unzipped_chunks = []
+        with self.assertRaisesRegex(ValueError, 'source'):
+            for name, size, chunks in stream_unzip(yield_input_then_error(), chunk_size=1000, read_ahead_bytes=5000):
+                for chunk in chunks:
+                    unzipped_chunks.append(chunk)
+        self.assertEqual(content.startswith(b''.join(unzipped_chunks)), True)
+        self.assertTrue(len(unzipped_chunks) > 0)
+
+        # Stopping early stops the thread
+        for name, size, chunks in stream_unzip(yield_input(), chunk_size=1000, read_ahead_bytes=5000):
+            next(chunks)
+            break
+        del chunks
+        for _ in range(0, 100):
+            if threading.active_count() == num_threads:
+                break
+            threading.Event().wait(0.01)
+        self.assertEqual(threading.active_count(), num_threads)
+
+    def test_http_range_chunks(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        content = b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 2000)])
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_STORED) as zf:
+            zf.writestr('first.txt', content)
+            zf.writestr('second.txt', content[:1000])
+        zip_bytes = file.getvalue()
+        expected = [
+            (b'first.txt', len(content), content),
+            (b'second.txt', 1000, content[:1000]),
+        ]
+
+        with serve_http(zip_bytes) as (url, stats):
+            self.assertEqual(b''.join(http_range_chunks(url, range_size=5000, max_connections=4)), zip_bytes)
+            self.assertEqual(stats['num_requests'], (len(zip_bytes) + 4999) // 5000)
+            self.assertTrue(1 < stats['max_concurrent'] <= 4)
+
+        with serve_http(zip_bytes) as (url, stats):
+            unzipped = [
+                (name, size, b''.join(chunks))
+                for name, size, chunks in stream_unzip(http_range_chunks(url, range_size=5000, max_connections=4, max_bytes_ahead=10000))
+            ]
+            self.assertEqual(unzipped, expected)
+            self.assertTrue(stats['max_concurrent'] <= 2)
+
+        with serve_http(zip_bytes) as (url, stats):
+            async def test():
+                return [
+                    (name, size, b''.join([chunk async for chunk in chunks]))
+                    async for name, size, chunks in async_stream_unzip(async_http_range_chunks(url, range_size=5000))
+                ]
+            self.assertEqual(asyncio.run(test()), expected)
+
+        # A server that doesn't support ranges is read from over a single connection
+        with serve_http(zip_bytes, supports_ranges=False) as (url, stats):
+            self.assertEqual(b''.join(http_range_chunks(url, range_size=5000)), zip_bytes)
+            self.assertEqual(stats['num_requests'], 1)
+
+        with serve_http(zip_bytes, range_offset=1) as (url, stats):
+            with self.assertRaises(RangeRequestError):
+                b''.join(http_range_chunks(url, range_size=5000))
+
+        # The size of the whole of the URL is needed to know which ranges to request
+        for size in ('*', 'x', ''):
+            with self.subTest(size=size), serve_http(zip_bytes, size=size) as (url, stats):
+                with self.assertRaises(RangeRequestError):
+                    b''.join(http_range_chunks(url, range_size=5000))
+
+    def test_http_range_chunks_timeout(self):
+        zip_bytes = bytes(range(0, 256)) * 100
+        num_shutdowns = []
+
+        class ShutdownRecordingThreadPoolExecutor(ThreadPoolExecutor):
+            def shutdown(self, *args, **kwargs):
+                num_shutdowns.append(1)
+                super().shutdown(*args, **kwargs)
+
+        # A range request that stalls after the first raises once the timeout has passed, rather
+        # than blocking forever, and the thread pool that was created for the ranges is shut down
+        for num_requests_before_stall in (0, 1):
+            with self.subTest(num_requests_before_stall=num_requests_before_stall):
+                num_shutdowns.clear()
+                chunks = []
+                with \
+                        serve_http(zip_bytes, num_requests_before_stall=num_requests_before_stall) as (url, stats), \
+                        unittest.mock.patch.object(stream_unzip_module, 'ThreadPoolExecutor', ShutdownRecordingThreadPoolExecutor):
+                    with self.assertRaises(OSError):
+                        for chunk in http_range_chunks(url, range_size=5000, max_connections=2, timeout=0.2):
+                            chunks.append(chunk)
+                self.assertEqual(chunks, [zip_bytes[:5000]] * num_requests_before_stall)
+                self.assertEqual(num_shutdowns, [1] * num_requests_before_stall)
+
+        with serve_http(zip_bytes, num_requests_before_stall=1) as (url, stats):
+            async def test():
+                async for chunk in async_http_range_chunks(url, range_size=5000, timeout=0.2):
+                    pass
+            with self.assertRaises(OSError):
+                asyncio.run(test())
+
+    def test_checkpoints(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        content = b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 2000)])
+
+        for file in (io.BytesIO(), UnseekableBytesIO()):
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', content)
+                zf.writestr('second.txt', content[:1000])
+                zf.writestr('third.txt', content[:2000])
+                header_offsets = [info.header_offset for info in zf.infolist()]
+                central_directory_offset = file.tell()
+            zip_bytes = file.getvalue()
+            expected_checkpoints = [
+                Checkpoint(offset, member_index)
+                for member_index, offset in enumerate(header_offsets + [central_directory_offset])
+            ]
+
+            def yield_input(zip_bytes, fail_at=None):
+                for i in range(0, len(zip_bytes), 1000):
+                    if fail_at is not None and i >= fail_at:
+                        raise ConnectionError()
+                    yield zip_bytes[i:i + 1000]
+
+            for pipelined in (False, True):
+                with self.subTest(pipelined=pipelined):
+                    checkpoints = []
+                    unzipped = [
+                        (name, b''.join(chunks))
+                        for name, size, chunks in stream_unzip(yield_input(zip_bytes), pipelined=pipelined, on_checkpoint=checkpoints.append)
+                    ]
+                    self.assertEqual(checkpoints, expected_checkpoints)
+
+                    # A checkpoint is only reached once the member before it has been iterated
+                    checkpoints = []
+                    for name, size, chunks in stream_unzip(yield_input(zip_bytes), pipelined=pipelined, on_checkpoint=checkpoints.append):
+                        self.assertEqual(len(checkpoints), [b'first.txt', b'second.txt', b'third.txt'].index(name) + 1)
+                        for chunk in chunks:
+                            pass
+
+                    # After a failure part way through the second member, unzipping resumes from
+                    # the start of the second member
+                    checkpoints = []
+                    unzipped_before_failure = []
+                    with self.assertRaises(ConnectionError):
+                        for name, size, chunks in stream_unzip(yield_input(zip_bytes, fail_at=header_offsets[1] + 10), pipelined=pipelined, on_checkpoint=checkpoints.append):
+                            unzipped_before_failure.append((name, b''.join(chunks)))
+                    self.assertEqual(checkpoints[-1], expected_checkpoints[1])
+
+                    checkpoint = checkpoints[-1]
+                    checkpoints = []
+                    unzipped_after_failure = [
+                        (name, b''.join(chunks))
+                        for name, size, chunks in stream_unzip(yield_input(zip_bytes[checkpoint.offset:]), pipelined=pipelined, checkpoint=checkpoint, on_checkpoint=checkpoints.append)
+                    ]
+                    self.assertEqual(checkpoints, expected_checkpoints[1:])
+                    self.assertEqual(unzipped_before_failure + unzipped_after_failure, unzipped)
+
+            with serve_http(zip_bytes) as (url, stats):
+                resumed = [
+                    (name, b''.join(chunks))
+                    for name, size, chunks in stream_unzip(http_range_chunks(url, range_size=1000, offset=header_offsets[2]), checkpoint=expected_checkpoints[2])
+                ]
+            self.assertEqual(resumed, [(b'third.txt', content[:2000])])
+
+            async def async_bytes():
+                yield zip_bytes[header_offsets[2]:]
+
+            async def test():
+                checkpoints = []
+                resumed = [
+                    (name, b''.join([chunk async for chunk in chunks]))
+                    async for name, size, chunks in async_stream_unzip(async_bytes(), checkpoint=expected_checkpoints[2], on_checkpoint=checkpoints.append)
+                ]
+                return resumed, checkpoints
+
+            self.assertEqual(asyncio.run(test()), ([(b'third.txt', content[:2000])], expected_checkpoints[2:]))
+
+    def test_shards(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        contents = [
+            b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, num)])
+            for num in (100, 0, 2000, 10, 500)
+        ]
+        expected = [('{}.txt'.format(i).encode(), content) for i, content in enumerate(contents)]
+
+        for file in (io.BytesIO(), UnseekableBytesIO()):
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                for name, content in expected:
+                    zf.writestr(name.decode(), content)
+                header_offsets = [info.header_offset for info in zf.infolist()]
+            zip_bytes = file.getvalue()
+
+            # Each shard is given the bytes up to the start of the next, plus enough for the parser
+            # to tell where a data descriptor ends
+            shards = [(0, 2), (2, 3), (3, 5)]
+            unzipped = []
+            stopped_at = []
+            for start, end in shards:
+                end_offset = header_offsets[end] if end < len(header_offsets) else None
+                checkpoints = []
+                unzipped += [
+                    (name, b''.join(chunks))
+                    for name, size, chunks in stream_unzip(
+                        (zip_bytes[header_offsets[start]:(end_offset + 16 if end_offset is not None else None)],),
+                        checkpoint=Checkpoint(header_offsets[start], start), on_checkpoint=checkpoints.append, end_offset=end_offset,
+                    )
+                ]
+                stopped_at.append(checkpoints[-1])
+            self.assertEqual(unzipped, expected)
+            self.assertEqual(stopped_at, [
+                Checkpoint(header_offsets[2], 2),
+                Checkpoint(header_offsets[3], 3),
+                Checkpoint(len(zip_bytes) - len(zip_bytes.partition(b'PK\x01\x02')[2]) - 4, 5),
+            ])
+
+            for pipelined in (False, True):
+                with self.subTest(pipelined=pipelined):
+                    checkpoints = []
+                    unzipped = [
+                        (name, b''.join(chunks))
+                        for name, size, chunks in stream_unzip(
+                            (zip_bytes[header_offsets[1]:],),
+                            checkpoint=Checkpoint(header_offsets[1], 1), on_checkpoint=checkpoints.append, max_members=3, pipelined=pipelined,
+                        )
+                    ]
+                    self.assertEqual(unzipped, expected[1:4])
+                    self.assertEqual(checkpoints[-1], Checkpoint(header_offsets[4], 4))
+
+            # Without data descriptors, the bytes can end at end_offset
+            if isinstance(file, UnseekableBytesIO):
+                continue
+            unzipped = [
+                (name, b''.join(chunks))
+                for name, size, chunks in stream_unzip((zip_bytes[:header_offsets[2]],), end_offset=header_offsets[2])
+            ]
+            self.assertEqual(unzipped, expected[:2])
+
+    def test_member_files(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        content = b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 2000)])
+
+        for file in (io.BytesIO(), UnseekableBytesIO()):
+            # Stored member files with data descriptors are not stream unzippable
+            is_seekable = not isinstance(file, UnseekableBytesIO)
+            with zipfile.ZipFile(file, 'w') as zf:
+                zf.writestr(zipfile.ZipInfo('first.txt', (2021, 3, 4, 5, 6, 8)), content, zipfile.ZIP_DEFLATED)
+                zf.writestr(zipfile.ZipInfo('second.txt', (1999, 12, 31, 23, 59, 58)), content[:1000], zipfile.ZIP_STORED if is_seekable else zipfile.ZIP_DEFLATED)
+                zf.writestr(zipfile.ZipInfo('third.txt', (1980, 1, 1, 0, 0, 0)), content[:2000], zipfile.ZIP_BZIP2)
+                infos = zf.infolist()
+            zip_bytes = file.getvalue()
+
+            def assert_member_files(member_files, member_filter=lambda info: True):
+                infos_filtered = [(i, info) for i, info in enumerate(infos) if member_filter(info)]
+                self.assertEqual(len(member_files), len(infos_filtered))
+                for member_file, (i, info) in zip(member_files, infos_filtered):
+                    self.assertIsInstance(member_file, MemberFile)
+                    self.assertEqual(member_file.file_name, info.filename.encode())
+                    self.assertEqual(member_file.member_index, i)
+                    self.assertEqual(member_file.local_header_offset, info.header_offset)
+                    self.assertEqual(member_file.data_offset, info.header_offset + 30 + len(info.filename) + len(info.extra))
+                    self.assertEqual(member_file.compression, info.compress_type)
+                    self.assertEqual(member_file.date_time, info.date_time)
+                    self.assertEqual(member_file.has_data_descriptor, not is_seekable)
+                    self.assertEqual(member_file.crc_32, info.CRC if is_seekable else None)
+                    self.assertEqual(member_file.uncompressed_size, info.file_size if is_seekable else None)
+                    self.assertEqual(member_file.compressed_size, info.compress_size if is_seekable else None)
+                    self.assertIs(member_file.is_zip64, False)
+                    self.assertIs(member_file.encryption, NO_ENCRYPTION)
+                    self.assertIsNone(member_file.aes_key_strength)
+                    self.assertEqual(member_file.extra, {})
+                    with self.assertRaises(AttributeError):
+                        member_file.other = 1  # type: ignore [attr-defined]
+
+            for pipelined in (False, True):
+                with self.subTest(pipelined=pipelined):
+                    # Each member file is passed just before it's yielded
+                    member_files = []
+                    for name, size, chunks in stream_unzip((zip_bytes,), pipelined=pipelined, on_member=member_files.append):
+                        self.assertEqual(member_files[-1].file_name, name)
+                        self.assertEqual(member_files[-1].uncompressed_size, size)
+                        for chunk in chunks:
+                            pass
+                    assert_member_files(member_files)
+
+            member_files = []
+            for name, size, chunks in stream_unzip((zip_bytes,), member_filter=lambda name, size, compression: name != b'second.txt', on_member=member_files.append):
+                for chunk in chunks:
+                    pass
+            assert_member_files(member_files, lambda info: info.filename != 'second.txt')
+
+            # A member file can be unzipped on its own from a checkpoint made from its MemberFile
+            member_file = member_files[-1]
+            resumed = [
+                (name, b''.join(chunks))
+                for name, size, chunks in stream_unzip((zip_bytes[member_file.local_header_offset:],), checkpoint=Checkpoint(member_file.local_header_offset, member_file.member_index))
+            ]
+            self.assertEqual(resumed, [(b'third.txt', content[:2000])])
+
+            async def async_bytes():
+                yield zip_bytes
+
+            async def test():
+                member_files = []
+                async for name, size, chunks in async_stream_unzip(async_bytes(), on_member=member_files.append):
+                    self.assertEqual(member_files[-1].file_name, name)
+                    async for chunk in chunks:
+                        pass
+                return member_files
+
+            assert_member_files(asyncio.run(test()))
+
+            if is_seekable:
+                for ordered in (True, False):
+                    with self.subTest(ordered=ordered):
+                        member_files = []
+                        for name, size, chunks in parallel_stream_unzip(zip_bytes, ordered=ordered, on_member=member_files.append):
+                            self.assertEqual(member_files[-1].file_name, name)
+                            for chunk in chunks:
+                                pass
+                        assert_member_files(sorted(member_files, key=lambda member_file: member_file.member_index))
+
+        with open('fixtures/7za_17_4_aes.zip', 'rb') as f:
+            member_files = []
+            for name, size, chunks in stream_unzip(f, password=b'password', on_member=member_files.append):
+                for chunk in chunks:
+                    pass
+        self.assertEqual([(member_file.encryption, member_file.aes_key_strength, member_file.compression) for member_file in member_files], [(AE_2, AES_256, 8)])
+
+        with open('fixtures/macos_10_14_5_multiple_files.zip', 'rb') as f:
+            member_files = []
+            for name, size, chunks in stream_unzip(f, on_member=member_files.append):
+                for chunk in chunks:
+                    pass
+        self.assertEqual([(member_file.file_name, member_file.has_data_descriptor, member_file.crc_32) for member_file in member_files], [
+            (b'first.txt', True, None),
+            (b'__MACOSX/', False, 0),
+            (b'__MACOSX/._first.txt', True, None),
+            (b'second.txt', True, None),
+            (b'__MACOSX/._second.txt', True, None),
+        ])
+        self.assertEqual(member_files[0].extra.keys(), {b'UX'})
+
     def test_skipping_wrapper(self):
         rnd = random.Random()
         rnd.seed(1)
@@ -155,17 +1076,347 @@ class TestStreamUnzip(unittest.TestCase):
         combinations_iter = itertools.product(contents, methods, input_sizes, output_sizes)
         for content, method, input_size, output_size in combinations_iter:
             with self.subTest(content=content[:5], method=method, input_size=input_size, output_size=output_size):
-                with self.assertRaises(UnfinishedIterationError):
-                    for name, size, chunks in stream_unzip(yield_input(content, method, input_size), chunk_size=output_size):
-                        if name == b'first.txt':
-                            continue
+                with self.assertRaises(UnfinishedIterationError):
+                    for name, size, chunks in stream_unzip(yield_input(content, method, input_size), chunk_size=output_size):
+                        if name == b'first.txt':
+                            continue
+
+    def test_member_filter(self):
+        methods = [zipfile.ZIP_BZIP2, zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
+        input_sizes = [1, 7, 65536]
+
+        def yield_input(method, input_size):
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', method) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+                zf.writestr('third.txt', b'+' * 100000)
+
+            zip_bytes = file.getvalue()
+
+            for i in range(0, len(zip_bytes), input_size):
+                yield zip_bytes[i:i + input_size]
+
+        for method, input_size in itertools.product(methods, input_sizes):
+            with self.subTest(method=method, input_size=input_size):
+                filtered = []
+
+                def member_filter(name, size, compression):
+                    filtered.append((name, size, compression))
+                    return name == b'second.txt'
+
+                files = [
+                    (name, size, b''.join(chunks))
+                    for name, size, chunks in stream_unzip(yield_input(method, input_size), member_filter=member_filter)
+                ]
+                self.assertEqual(files, [(b'second.txt', 100000, b'*' * 100000)])
+                self.assertEqual(filtered, [
+                    (b'first.txt', 100000, method),
+                    (b'second.txt', 100000, method),
+                    (b'third.txt', 100000, method),
+                ])
+
+    def test_member_filter_does_not_decompress_when_size_known(self):
+        def yield_input():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+
+            zip_bytes = file.getvalue()
+            yield zip_bytes[0:50] + b'-' * 10 + zip_bytes[60:]
+
+        files = [
+            (name, size, b''.join(chunks))
+            for name, size, chunks in stream_unzip(yield_input(), member_filter=lambda name, size, compression: name == b'second.txt')
+        ]
+        self.assertEqual(files, [(b'second.txt', 100000, b'*' * 100000)])
+
+        with self.assertRaises(DeflateError):
+            for name, size, chunks in stream_unzip(yield_input()):
+                for chunk in chunks:
+                    pass
+
+    def test_member_filter_encrypted_without_password(self):
+        def yield_input():
+            with open('fixtures/7za_17_4_aes.zip', 'rb') as f:
+                yield f.read()
+
+        files = list(stream_unzip(yield_input(), member_filter=lambda name, size, compression: False))
+        self.assertEqual(files, [])
+
+    def test_member_filter_data_descriptor(self):
+        for input_size in (1, 7, 65536):
+            with self.subTest(input_size=input_size):
+                def yield_input():
+                    with open('fixtures/macos_10_14_5_multiple_files.zip', 'rb') as f:
+                        yield from iter(lambda: f.read(input_size), b'')
+
+                files = [
+                    (name, size, b''.join(chunks))
+                    for name, size, chunks in stream_unzip(yield_input(), member_filter=lambda name, size, compression: not name.startswith(b'__MACOSX/'))
+                ]
+                self.assertEqual(files, [
+                    (b'first.txt', None, b'Contents of the first file'),
+                    (b'second.txt', None, b'Contents of the second file'),
+                ])
+
+    def test_abandon_member(self):
+        methods = [zipfile.ZIP_BZIP2, zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
+        input_sizes = [7, 65536]
+        output_sizes = [7, 1000]
+        num_chunks_before_abandoning = [0, 1, 2]
+
+        rnd = random.Random()
+        rnd.seed(1)
+        content = b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 1000)])
+
+        def yield_input(method, input_size):
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', method) as zf:
+                zf.writestr('first.txt', content)
+                zf.writestr('second.txt', content)
+
+            zip_bytes = file.getvalue()
+
+            for i in range(0, len(zip_bytes), input_size):
+                yield zip_bytes[i:i + input_size]
+
+        combinations_iter = itertools.product(methods, input_sizes, output_sizes, num_chunks_before_abandoning, (False, True))
+        for method, input_size, output_size, num_chunks, check_abandoned_members in combinations_iter:
+            with self.subTest(method=method, input_size=input_size, output_size=output_size, num_chunks=num_chunks, check_abandoned_members=check_abandoned_members):
+                files = []
+                for name, size, chunks in stream_unzip(yield_input(method, input_size), chunk_size=output_size, check_abandoned_members=check_abandoned_members):
+                    if name == b'first.txt':
+                        for _ in range(0, num_chunks):
+                            next(chunks)
+                        chunks.close()
+                    else:
+                        files.append((name, size, b''.join(chunks)))
+
+                self.assertEqual(files, [(b'second.txt', len(content), content)])
+
+    def test_abandon_member_data_descriptor(self):
+        def yield_input():
+            with open('fixtures/macos_10_14_5_multiple_files.zip', 'rb') as f:
+                yield from iter(lambda: f.read(7), b'')
+
+        files = []
+        for name, size, chunks in stream_unzip(yield_input()):
+            if name == b'first.txt':
+                chunks.close()
+            else:
+                files.append((name, size, b''.join(chunks)))
+
+        self.assertEqual(len(files), 4)
+        self.assertEqual(files[2], (b'second.txt', None, b'Contents of the second file'))
+
+    def test_abandon_member_integrity_check(self):
+        def yield_input():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+
+            zip_bytes = file.getvalue()
+            yield zip_bytes[0:16] + bytes([(zip_bytes[16] + 1) % 256]) + zip_bytes[17:]
+
+        files = []
+        for name, size, chunks in stream_unzip(yield_input(), chunk_size=1000):
+            if name == b'first.txt':
+                next(chunks)
+                chunks.close()
+            else:
+                files.append((name, size, b''.join(chunks)))
+        self.assertEqual(files, [(b'second.txt', 100000, b'*' * 100000)])
+
+        with self.assertRaises(CRC32IntegrityError):
+            for name, size, chunks in stream_unzip(yield_input(), chunk_size=1000, check_abandoned_members=True):
+                next(chunks)
+                chunks.close()
+
+    def test_observer(self):
+        methods = [zipfile.ZIP_BZIP2, zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
+        input_sizes = [7, 65536]
+
+        def yield_input(method, input_size):
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', method) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+                zf.writestr('third.txt', b'+' * 100000)
+
+            zip_bytes = file.getvalue()
+
+            for i in range(0, len(zip_bytes), input_size):
+                yield zip_bytes[i:i + input_size]
+
+        for method, input_size in itertools.product(methods, input_sizes):
+            with self.subTest(method=method, input_size=input_size):
+                events = []
+                for name, size, chunks in stream_unzip(
+                    yield_input(method, input_size),
+                    member_filter=lambda name, size, compression: name != b'second.txt',
+                    observer=lambda event, details: events.append((event, details)),
+                ):
+                    if name == b'third.txt':
+                        next(chunks)
+                        chunks.close()
+                    else:
+                        b''.join(chunks)
+
+                spans = [details for event, details in events if event == 'span']
+                events = [(event, details) for event, details in events if event != 'span']
+                self.assertEqual([event for event, _ in events], [
+                    'member_start', 'member_end',
+                    'member_start', 'member_end',
+                    'member_start', 'member_end',
+                    'stream_end',
+                ])
+
+                _, first_start = events[0]
+                self.assertEqual(first_start['name'], b'first.txt')
+                self.assertEqual(first_start['compression'], method)
+                self.assertIs(first_start['encryption'], NO_ENCRYPTION)
+                self.assertEqual(first_start['uncompressed_size'], 100000)
+                self.assertEqual(first_start['is_wanted'], True)
+                self.assertEqual(events[2][1]['is_wanted'], False)
+
+                _, first_end = events[1]
+                self.assertEqual(first_end['name'], b'first.txt')
+                self.assertEqual(first_end['compressed_bytes'], first_start['compressed_size'])
+                self.assertEqual(first_end['uncompressed_bytes'], 100000)
+                self.assertTrue({'decompress', 'crc32', 'consumer'} <= set(first_end['seconds']))
+                self.assertEqual(events[3][1]['uncompressed_bytes'], 0)
+                self.assertLess(events[5][1]['uncompressed_bytes'], 100000)
+
+                _, stream_end = events[6]
+                self.assertEqual(stream_end['members'], 3)
+                self.assertEqual(stream_end['compressed_bytes'], sum(events[i][1]['compressed_bytes'] for i in (1, 3, 5)))
+                self.assertEqual(stream_end['uncompressed_bytes'], sum(events[i][1]['uncompressed_bytes'] for i in (1, 3, 5)))
+                self.assertEqual(stream_end['input_bytes'], sum(len(chunk) for chunk in yield_input(method, input_size)))
+                self.assertEqual(set(stream_end['seconds']), {'source', 'decompress', 'crc32', 'consumer'})
+
+                self.assertEqual([span['name'] for span in spans if span['stage'] == 'header'], [b'first.txt', b'second.txt', b'third.txt'])
+                for span in spans:
+                    self.assertLessEqual(span['start'], span['end'])
+                    self.assertEqual(span['thread_id'], threading.get_ident())
+                self.assertAlmostEqual(
+                    sum(span['end'] - span['start'] for span in spans if span['stage'] == 'decompress'),
+                    stream_end['seconds']['decompress'],
+                )
+
+    def test_observer_encrypted_data_descriptor(self):
+        def yield_input():
+            with open('fixtures/infozip_3_0_password_data_descriptor.zip', 'rb') as f:
+                yield f.read()
+
+        events = []
+        for _, _, chunks in stream_unzip(yield_input(), password=b'password', observer=lambda event, details: events.append((event, details))):
+            b''.join(chunks)
+
+        events = [(event, details) for event, details in events if event != 'span']
+        self.assertIs(events[0][1]['encryption'], ZIP_CRYPTO)
+        self.assertEqual(events[0][1]['has_data_descriptor'], True)
+        self.assertTrue({'decrypt', 'data_descriptor'} <= set(events[1][1]['seconds']))
+
+    def test_chrome_trace_observer(self):
+        def yield_input():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+            zip_bytes = file.getvalue()
+
+            for i in range(0, len(zip_bytes), 1000):
+                yield zip_bytes[i:i + 1000]
+
+        trace = io.StringIO()
+        for _, _, chunks in stream_unzip(yield_input(), observer=chrome_trace_observer(trace)):
+            b''.join(chunks)
+
+        events = json.loads(trace.getvalue())
+        self.assertEqual(events[0], {
+            'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': threading.get_ident(),
+            'args': {'name': threading.current_thread().name},
+        })
+        self.assertEqual([(event['name'], event['ph']) for event in events if event.get('cat') == 'member'], [
+            ('first.txt', 'b'), ('first.txt', 'e'), ('second.txt', 'b'), ('second.txt', 'e'),
+        ])
+        self.assertEqual(
+            {event['name'] for event in events if event['ph'] == 'X'},
+            {'header', 'source', 'decompress', 'crc32', 'consumer'},
+        )
+        self.assertEqual(events[-1]['name'], 'stream_end')
+        self.assertEqual(events[-1]['args']['uncompressed_bytes'], 200000)
+
+    def test_output_size(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        methods = [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
+        input_sizes = [1, 7, 65536]
+        output_sizes = [1, 7, 65536]
+
+        contents = [
+            b'short',
+            b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 10000)])
+        ]
+
+        def yield_input(content, method, input_size):
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', method) as zf:
+                zf.writestr('first.txt', content)
+                zf.writestr('second.txt', content)
+
+            zip_bytes = file.getvalue()
+
+            for i in range(0, len(zip_bytes), input_size):
+                yield zip_bytes[i:i + input_size]
+
+        all_smaller = True
+        combinations_iter = itertools.product(contents, methods, input_sizes, output_sizes)
+        for content, method, input_size, output_size in combinations_iter:
+            with self.subTest(content=content[:5], method=method, input_size=input_size, output_size=output_size):
+                for _, _, chunks in stream_unzip(yield_input(content, method, input_size), chunk_size=output_size):
+                    for chunk in chunks:
+                        all_smaller = all_smaller and len(chunk) <= output_size
+        self.assertTrue(all_smaller)
 
-    def test_output_size(self):
+    def test_output_is_bytes_from_bytes_like_input(self):
+        methods = [zipfile.ZIP_BZIP2, zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
+        input_types = [bytes, bytearray, memoryview]
+        content = b'-' * 100000
+
+        def yield_input(method, input_type):
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', method) as zf:
+                zf.writestr('first.txt', content)
+                zf.writestr('second.txt', content)
+
+            zip_bytes = file.getvalue()
+
+            for i in range(0, len(zip_bytes), 7):
+                yield input_type(zip_bytes[i:i + 7])
+
+        for method, input_type in itertools.product(methods, input_types):
+            with self.subTest(method=method, input_type=input_type):
+                files = [
+                    (name, size, list(chunks))
+                    for name, size, chunks in stream_unzip(yield_input(method, input_type))
+                ]
+                self.assertEqual([(name, size, b''.join(chunks)) for name, size, chunks in files], [
+                    (b'first.txt', 100000, content),
+                    (b'second.txt', 100000, content),
+                ])
+                self.assertTrue(all(type(name) is bytes for name, _, _ in files))
+                self.assertTrue(all(type(chunk) is bytes for _, _, chunks in files for chunk in chunks))
+
+    def test_readinto(self):
         rnd = random.Random()
         rnd.seed(1)
 
-        methods = [zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
-        input_sizes = [1, 7, 65536]
+        methods = [zipfile.ZIP_BZIP2, zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
         output_sizes = [1, 7, 65536]
 
         contents = [
@@ -173,25 +1424,239 @@ class TestStreamUnzip(unittest.TestCase):
             b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 10000)])
         ]
 
-        def yield_input(content, method, input_size):
+        class OnlyReadinto():
+            def __init__(self, f):
+                self.f = f
+                self.num_calls = 0
+
+            def readinto(self, b):
+                self.num_calls += 1
+                return self.f.readinto(b)
+
+        def get_input(content, method):
             file = io.BytesIO()
             with zipfile.ZipFile(file, 'w', method) as zf:
                 zf.writestr('first.txt', content)
                 zf.writestr('second.txt', content)
+            file.seek(0)
+            return OnlyReadinto(file)
 
-            zip_bytes = file.getvalue()
+        combinations_iter = itertools.product(contents, methods, output_sizes)
+        for content, method, output_size in combinations_iter:
+            with self.subTest(content=content[:5], method=method, output_size=output_size):
+                readable = get_input(content, method)
+                files = [
+                    (name, size, b''.join(chunks))
+                    for name, size, chunks in stream_unzip(readable, chunk_size=output_size)
+                ]
+                self.assertEqual(files, [
+                    (b'first.txt', len(content), content),
+                    (b'second.txt', len(content), content),
+                ])
+                self.assertGreater(readable.num_calls, 1)
+
+    def test_readinto_non_blocking(self):
+        # A non-blocking stream returns None from readinto when no data is available yet, which
+        # must raise rather than end the ZIP early
+        class NonBlocking():
+            def __init__(self, f):
+                self.f = f
+                self.num_calls = 0
+
+            def readinto(self, b):
+                self.num_calls += 1
+                return self.f.readinto(b) if self.num_calls % 2 else None
+
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_STORED) as zf:
+            zf.writestr('first.txt', b'-' * 10000)
+
+        for read_ahead_bytes in (0, 5000):
+            with self.subTest(read_ahead_bytes=read_ahead_bytes):
+                file.seek(0)
+                with self.assertRaises(NonBlockingReadError):
+                    for name, size, chunks in stream_unzip(NonBlocking(file), chunk_size=1000, read_ahead_bytes=read_ahead_bytes):
+                        for chunk in chunks:
+                            pass
 
-            for i in range(0, len(zip_bytes), input_size):
-                yield zip_bytes[i:i + input_size]
+    def test_buffer(self):
+        methods = [zipfile.ZIP_BZIP2, zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
+        input_types = [bytes, bytearray, memoryview]
+        output_sizes = [7, 65536]
+        content = b'-' * 100000
 
-        all_smaller = True
-        combinations_iter = itertools.product(contents, methods, input_sizes, output_sizes)
-        for content, method, input_size, output_size in combinations_iter:
-            with self.subTest(content=content[:5], method=method, input_size=input_size, output_size=output_size):
-                for _, _, chunks in stream_unzip(yield_input(content, method, input_size), chunk_size=output_size):
-                    for chunk in chunks:
-                        all_smaller = all_smaller and len(chunk) <= output_size
-        self.assertTrue(all_smaller)
+        def get_zip_bytes(method):
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', method) as zf:
+                zf.writestr('first.txt', content)
+                zf.writestr('second.txt', content)
+            return file.getvalue()
+
+        for method, input_type, output_size, stored_as_views in itertools.product(methods, input_types, output_sizes, (False, True)):
+            with self.subTest(method=method, input_type=input_type, output_size=output_size, stored_as_views=stored_as_views):
+                files = [
+                    (name, size, list(chunks))
+                    for name, size, chunks in stream_unzip(input_type(get_zip_bytes(method)), chunk_size=output_size, stored_as_views=stored_as_views)
+                ]
+                self.assertEqual([(name, size, b''.join(chunks)) for name, size, chunks in files], [
+                    (b'first.txt', 100000, content),
+                    (b'second.txt', 100000, content),
+                ])
+                self.assertTrue(all(
+                    type(chunk) is (memoryview if method == zipfile.ZIP_STORED and stored_as_views else bytes)
+                    for _, _, chunks in files for chunk in chunks
+                ))
+
+    def test_mmap(self):
+        # Big enough for pages of the mmap to be released as the parser moves forward
+        rnd = random.Random()
+        rnd.seed(1)
+        contents = [rnd.getrandbits(8 * 10000000).to_bytes(10000000, 'little') for _ in range(0, 3)]
+
+        for method in (zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED):
+            with self.subTest(method=method), tempfile.TemporaryFile() as f:
+                with zipfile.ZipFile(f, 'w', method) as zf:
+                    for i, content in enumerate(contents):
+                        zf.writestr(f'{i}.bin', content)
+                f.flush()
+
+                # By default the chunks are bytes, so the mmap can be closed while they're still used
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                    files = [
+                        (name, size, list(chunks))
+                        for name, size, chunks in stream_unzip(m)
+                    ]
+                self.assertEqual(
+                    [(name, size, b''.join(chunks)) for name, size, chunks in files],
+                    [(f'{i}.bin'.encode(), len(content), content) for i, content in enumerate(contents)],
+                )
+                self.assertTrue(all(type(chunk) is bytes for _, _, chunks in files for chunk in chunks))
+
+                # Pages of ACCESS_COPY maps are not released, since that would lose writes to them
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY) as m:
+                    m[30:31] = b'X'
+                    files = [
+                        (name, size, b''.join(chunks))
+                        for name, size, chunks in stream_unzip(m)
+                    ]
+                    self.assertEqual(m[30:31], b'X')
+                self.assertEqual(files, [(f'{i}.bin'.encode() if i else b'X.bin', len(content), content) for i, content in enumerate(contents)])
+
+    def test_anonymous_mmap(self):
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('first.txt', b'-' * 100000)
+        zip_bytes = file.getvalue()
+
+        with mmap.mmap(-1, len(zip_bytes)) as m:
+            m.write(zip_bytes)
+            files = [
+                (name, size, b''.join(chunks))
+                for name, size, chunks in stream_unzip(m)
+            ]
+        self.assertEqual(files, [(b'first.txt', 100000, b'-' * 100000)])
+
+    def test_readinto_file_with_data_descriptor_and_password(self):
+        for chunk_size in (1, 7, 65536):
+            with self.subTest(chunk_size=chunk_size):
+                with open('fixtures/7za_17_4_aes_data_descriptor.zip', 'rb') as f:
+                    files = [
+                        (name, size, b''.join(chunks))
+                        for name, size, chunks in stream_unzip(f, password=b'password', chunk_size=chunk_size)
+                    ]
+                self.assertEqual(files, [
+                    (b'', None, b'Some content to be compressed and AES-encrypted\n' * 1000),
+                ])
+
+                with open('fixtures/infozip_3_0_password_data_descriptor.zip', 'rb') as f:
+                    files = [
+                        (name, size, b''.join(chunks))
+                        for name, size, chunks in stream_unzip(f, password=b'password', chunk_size=chunk_size)
+                    ]
+                self.assertEqual(files, [
+                    (b'-', None, b'Some encrypted content to be compressed. Yes, compressed.'),
+                ])
+
+    def test_native_extension(self):
+        for name in ('_native_aes_decryptor', '_native_deflate64_decompressor'):
+            with self.subTest(name=name):
+                get_native_or_skip(self, name)
+
+        with self.subTest(name='_crc32'):
+            if stream_unzip_module._crc32 is stream_unzip_module._zlib.crc32 and os.environ.get('STREAM_UNZIP_REQUIRE_NATIVE'):
+                self.fail('The native extension was built without crc32')
+
+    def test_aes_decryptor_native_parity(self):
+        # The native AES decryptor must decrypt and authenticate exactly as the pure Python one,
+        # including when each chunk is a view into a buffer that's then reused for the next chunk
+        get_native_or_skip(self, '_native_aes_decryptor')
+
+        rnd = random.Random()
+        rnd.seed(1)
+        data = rnd.getrandbits(8 * 10000).to_bytes(10000, 'little')
+        salt = rnd.getrandbits(8 * 16).to_bytes(16, 'little')
+
+        def decrypt_all(get_decryptor, key_length, chunk_size, num_unused):
+            password_verification, decrypt, hmac_digest = get_decryptor(b'password', salt[:key_length // 2], key_length)
+            buffer = bytearray(chunk_size)
+            decrypted = []
+            for i in range(0, len(data), chunk_size):
+                chunk = memoryview(buffer)[:len(data[i:i + chunk_size])]
+                chunk[:] = data[i:i + chunk_size]
+                decrypted.append(decrypt(chunk))
+            digest = hmac_digest(chunk, min(num_unused, len(chunk)))
+            buffer[:] = bytes(chunk_size)
+            return password_verification, b''.join(decrypted), digest
+
+        for key_length, chunk_size, num_unused in itertools.product((16, 24, 32), (1, 3, 7, 4096, 65536), (0, 5)):
+            with self.subTest(key_length=key_length, chunk_size=chunk_size, num_unused=num_unused):
+                self.assertEqual(
+                    decrypt_all(stream_unzip_module._get_aes_decryptor, key_length, chunk_size, num_unused),
+                    decrypt_all(stream_unzip_module._get_python_aes_decryptor, key_length, chunk_size, num_unused),
+                )
+
+        # Whole AES-encrypted member files, read into reused buffers and with short reads
+        for fixture, chunk_size in itertools.product(('fixtures/7za_17_4_aes.zip', 'fixtures/7za_17_4_aes_data_descriptor.zip'), range(2, 10)):
+            with self.subTest(fixture=fixture, chunk_size=chunk_size):
+                with open(fixture, 'rb') as f:
+                    native = [(name, size, b''.join(chunks)) for name, size, chunks in stream_unzip(f, password=b'password', chunk_size=chunk_size)]
+                with unittest.mock.patch.object(stream_unzip_module, '_native_aes_decryptor', None), open(fixture, 'rb') as f:
+                    python = [(name, size, b''.join(chunks)) for name, size, chunks in stream_unzip(f, password=b'password', chunk_size=chunk_size)]
+                self.assertEqual(native, python)
+
+    def test_readinto_encrypted_small_chunks(self):
+        # The input buffers are reused, so anything needed from the last chunk of a member, such as
+        # for the AES HMAC, must be taken before more input is read
+        class ShortReads():
+            def __init__(self, f, max_read):
+                self.f = f
+                self.max_read = max_read
+
+            def readinto(self, b):
+                return self.f.readinto(memoryview(b)[:self.max_read])
+
+        fixtures = (
+            ('fixtures/7za_17_4_aes.zip', [(b'content.txt', 384, b'Some content to be compressed and AES-encrypted\n' * 8)]),
+            ('fixtures/7za_17_4_aes_data_descriptor.zip', [(b'', None, b'Some content to be compressed and AES-encrypted\n' * 1000)]),
+            ('fixtures/infozip_3_0_password_data_descriptor.zip', [(b'-', None, b'Some encrypted content to be compressed. Yes, compressed.')]),
+        )
+
+        for (fixture, expected), chunk_size in itertools.product(fixtures, range(2, 10)):
+            with self.subTest(fixture=fixture, chunk_size=chunk_size):
+                with open(fixture, 'rb') as f:
+                    files = [
+                        (name, size, b''.join(chunks))
+                        for name, size, chunks in stream_unzip(f, password=b'password', chunk_size=chunk_size)
+                    ]
+                self.assertEqual(files, expected)
+
+                for max_read in (1, chunk_size - 1):
+                    with open(fixture, 'rb') as f:
+                        files = [
+                            (name, size, b''.join(chunks))
+                            for name, size, chunks in stream_unzip(ShortReads(f, max_read), password=b'password', chunk_size=chunk_size)
+                        ]
+                    self.assertEqual(files, expected)
 
     def test_exception_propagates(self):
         rnd = random.Random()
@@ -739,6 +2204,26 @@ class TestStreamUnzip(unittest.TestCase):
 
         self.assertEqual(content, b'Some content to be compressed and AES-encrypted\n' * 1000)
 
+    def test_7za_deflate64_native(self):
+        # The native decompressor must be the one used, and give the same output as the pure Python
+        # one for any size of input chunk, including memoryviews of reused buffers
+        get_native_or_skip(self, '_native_deflate64_decompressor')
+
+        def unzip(chunk_size):
+            with open('fixtures/7za_17_4_deflate64.zip', 'rb') as f:
+                return [
+                    (name, size, b''.join(chunks))
+                    for name, size, chunks in stream_unzip(f, chunk_size=chunk_size)
+                ]
+
+        for chunk_size in (1, 7, 100, 65536):
+            with self.subTest(chunk_size=chunk_size):
+                with unittest.mock.patch.object(stream_unzip_module, '_native_deflate64_decompressor', None):
+                    expected = unzip(chunk_size)
+                with unittest.mock.patch.object(stream_unzip_module, 'stream_inflate64', side_effect=AssertionError('Not native')):
+                    self.assertEqual(unzip(chunk_size), expected)
+                self.assertEqual(expected[0][2], b'Some content to be compressed and AES-encrypted\n' * 1000)
+
     def test_7z_password_data_descriptor(self):
         def yield_input():
             with open('fixtures/7z_17_4_password_data_descriptor.zip', 'rb') as f:
@@ -843,6 +2328,86 @@ class TestStreamUnzip(unittest.TestCase):
             (b'second.txt', 100000, b'*' * 100000),
         ])
 
+    def test_async_stream_unzip_member_filter(self):
+        async def async_bytes():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+            zip_bytes = file.getvalue()
+
+            yield zip_bytes
+
+        results = []
+
+        async def test():
+            async for name, size, chunks in async_stream_unzip(async_bytes(), member_filter=lambda name, size, compression: name == b'second.txt'):
+                b = b''
+                async for chunk in chunks:
+                    b += chunk
+                results.append((name, size, b))
+
+        asyncio.run(test())
+        self.assertEqual(results, [
+            (b'second.txt', 100000, b'*' * 100000),
+        ])
+
+    def test_async_stream_unzip_observer(self):
+        async def async_bytes():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+            zip_bytes = file.getvalue()
+
+            yield zip_bytes
+
+        events = []
+
+        async def test():
+            async for name, size, chunks in async_stream_unzip(async_bytes(), observer=lambda event, details: events.append((event, details))):
+                async for chunk in chunks:
+                    pass
+
+        asyncio.run(test())
+        events = [(event, details) for event, details in events if event != 'span']
+        self.assertEqual([event for event, _ in events], [
+            'member_start', 'member_end',
+            'member_start', 'member_end',
+            'stream_end',
+        ])
+        self.assertEqual(events[4][1]['members'], 2)
+        self.assertEqual(events[4][1]['uncompressed_bytes'], 200000)
+        self.assertEqual(set(events[4][1]['seconds']), {'source', 'decompress', 'crc32', 'consumer'})
+
+    def test_async_stream_unzip_abandon_member(self):
+        async def async_bytes():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+            zip_bytes = file.getvalue()
+
+            yield zip_bytes
+
+        results = []
+
+        async def test():
+            async for name, size, chunks in async_stream_unzip(async_bytes(), chunk_size=1000):
+                if name == b'first.txt':
+                    await chunks.__anext__()
+                    await chunks.aclose()
+                    continue
+                b = b''
+                async for chunk in chunks:
+                    b += chunk
+                results.append((name, size, b))
+
+        asyncio.run(test())
+        self.assertEqual(results, [
+            (b'second.txt', 100000, b'*' * 100000),
+        ])
+
     @unittest.skipIf(
         tuple(int(v) for v in platform.python_version().split('.')) == (3,7,1),
         "trio appears not compatible with Python 3.7.1",
@@ -875,6 +2440,124 @@ class TestStreamUnzip(unittest.TestCase):
         ])
 
 
+    def test_async_stream_unzip_does_not_use_threads_for_small_chunks(self):
+        input_threads = set()
+        executor = CountingThreadPoolExecutor()
+
+        async def async_bytes():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+            zip_bytes = file.getvalue()
+
+            for i in range(0, len(zip_bytes), 100):
+                input_threads.add(threading.get_ident())
+                yield zip_bytes[i:i + 100]
+
+        results = []
+
+        async def test():
+            async for name, size, chunks in async_stream_unzip(async_bytes(), executor=executor):
+                b = b''
+                async for chunk in chunks:
+                    b += chunk
+                results.append((name, size, b))
+
+        asyncio.run(test())
+        self.assertEqual(results, [
+            (b'first.txt', 100000, b'-' * 100000),
+            (b'second.txt', 100000, b'*' * 100000),
+        ])
+        self.assertEqual(input_threads, {threading.get_ident()})
+        self.assertEqual(executor.num_submitted, 0)
+
+    def test_async_stream_unzip_offloads_large_chunks_in_batches(self):
+        rnd = random.Random()
+        rnd.seed(1)
+        content = b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 10000)])
+        executor = CountingThreadPoolExecutor()
+
+        async def async_bytes():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', content)
+                zf.writestr('second.txt', content)
+            yield file.getvalue()
+
+        results = []
+        num_chunks = 0
+
+        async def test():
+            nonlocal num_chunks
+            async for name, size, chunks in async_stream_unzip(async_bytes(), chunk_size=1000, executor=executor, offload_threshold=65536):
+                b = b''
+                async for chunk in chunks:
+                    b += chunk
+                    num_chunks += 1
+                results.append((name, size, b))
+
+        asyncio.run(test())
+        self.assertEqual(results, [
+            (b'first.txt', len(content), content),
+            (b'second.txt', len(content), content),
+        ])
+        self.assertGreater(executor.num_submitted, 0)
+        self.assertLess(executor.num_submitted, num_chunks / 10)
+
+    def test_async_stream_unzip_offloaded_exception_after_chunks(self):
+        content = b'-' * 1000000
+
+        async def async_bytes():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_STORED) as zf:
+                zf.writestr('first.txt', content)
+            zip_bytes = file.getvalue()
+            yield zip_bytes[:-500000] + b'*' + zip_bytes[-499999:]
+
+        num_received = 0
+
+        async def test():
+            nonlocal num_received
+            async for name, size, chunks in async_stream_unzip(async_bytes(), offload_threshold=0):
+                async for chunk in chunks:
+                    num_received += len(chunk)
+
+        with self.assertRaises(CRC32IntegrityError):
+            asyncio.run(test())
+        self.assertEqual(num_received, len(content))
+
+    @unittest.skipIf(
+        tuple(int(v) for v in platform.python_version().split('.')) == (3,7,1),
+        "trio appears not compatible with Python 3.7.1",
+    )
+    def test_async_stream_unzip_offloaded_with_trio(self):
+        import trio
+
+        async def async_bytes():
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+                zf.writestr('first.txt', b'-' * 100000)
+                zf.writestr('second.txt', b'*' * 100000)
+            zip_bytes = file.getvalue()
+
+            yield zip_bytes
+
+        results = []
+
+        async def test():
+            async for name, size, chunks in async_stream_unzip(async_bytes(), offload_threshold=0):
+                b = b''
+                async for chunk in chunks:
+                    b += chunk
+                results.append((name, size, b))
+
+        trio.run(test)
+        self.assertEqual(results, [
+            (b'first.txt', 100000, b'-' * 100000),
+            (b'second.txt', 100000, b'*' * 100000),
+        ])
+
     def test_async_exception_from_bytes_propagates(self):
         async def async_bytes():
             yield b'P'
@@ -952,3 +2635,189 @@ class TestStreamUnzip(unittest.TestCase):
         self.assertEqual(var.get(), 'set-from-outer')
         self.assertEqual(inner, 'set-from-outer')
         self.assertEqual(d.get()['key'], 'set-from-inner')
+
+    def test_parallel_stream_unzip(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        methods = [zipfile.ZIP_BZIP2, zipfile.ZIP_DEFLATED, zipfile.ZIP_STORED]
+        output_sizes = [7, 65536]
+        contents = [
+            b''.join([uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode() for _ in range(0, 1000)]),
+            b'',
+            b'short',
+        ] * 3
+
+        def get_zip_bytes(method):
+            file = io.BytesIO()
+            with zipfile.ZipFile(file, 'w', method) as zf:
+                for i, content in enumerate(contents):
+                    zf.writestr(f'{i}.txt', content)
+            return file.getvalue()
+
+        def get_inputs(zip_bytes):
+            yield zip_bytes
+            yield io.BytesIO(zip_bytes)
+
+        expected = [(f'{i}.txt'.encode(), len(content), content) for i, content in enumerate(contents)]
+
+        for method, output_size, ordered in itertools.product(methods, output_sizes, (True, False)):
+            for zip_input in get_inputs(get_zip_bytes(method)):
+                with self.subTest(method=method, output_size=output_size, ordered=ordered, zip_input=type(zip_input)):
+                    files = [
+                        (name, size, b''.join(chunks))
+                        for name, size, chunks in parallel_stream_unzip(zip_input, chunk_size=output_size, ordered=ordered)
+                    ]
+                    self.assertEqual(files if ordered else sorted(files), expected if ordered else sorted(expected))
+
+    def test_parallel_stream_unzip_unordered_streams(self):
+        # Each member file is much bigger than the chunks that can be queued for it, so if it was
+        # only yielded once it had been fully unzipped, most of the ZIP would have been read by the
+        # time its first chunk was
+        contents = [bytes([i]) * 1000000 for i in range(0, 4)]
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_STORED) as zf:
+            for i, content in enumerate(contents):
+                zf.writestr(f'{i}.bin', content)
+        zip_bytes = file.getvalue()
+
+        class CountingBytesIO(io.BytesIO):
+            num_read = 0
+
+            def read(self, size=-1):
+                chunk = super().read(size)
+                self.num_read += len(chunk)
+                return chunk
+
+        zip_file = CountingBytesIO(zip_bytes)
+        files = []
+        num_read_at_first_chunk = None
+        for name, size, chunks in parallel_stream_unzip(zip_file, chunk_size=1000, ordered=False):
+            content = []
+            for chunk in chunks:
+                if num_read_at_first_chunk is None:
+                    num_read_at_first_chunk = zip_file.num_read
+                content.append(chunk)
+            files.append((name, b''.join(content)))
+
+        self.assertEqual(sorted(files), [(f'{i}.bin'.encode(), content) for i, content in enumerate(contents)])
+        self.assertLess(num_read_at_first_chunk, len(zip_bytes) // 4)
+
+    def test_parallel_stream_unzip_file_with_data_descriptors_and_password(self):
+        with open('fixtures/macos_10_14_5_multiple_files.zip', 'rb') as f:
+            self.assertEqual(
+                [(name, size, b''.join(chunks)) for name, size, chunks in parallel_stream_unzip(f)],
+                [(name, size, b''.join(chunks)) for name, size, chunks in stream_unzip(f)],
+            )
+
+        with open('fixtures/7za_17_4_aes_data_descriptor.zip', 'rb') as f:
+            files = [(name, size, b''.join(chunks)) for name, size, chunks in parallel_stream_unzip(f, password=b'password')]
+        self.assertEqual(files, [
+            (b'', None, b'Some content to be compressed and AES-encrypted\n' * 1000),
+        ])
+
+    def test_parallel_stream_unzip_zip64_central_directory(self):
+        filtered = []
+
+        def member_filter(name, size, compression):
+            filtered.append((name, size, compression))
+            return False
+
+        with open('fixtures/java_19_0_1_zip64_limit_plus_one.zip', 'rb') as f:
+            self.assertEqual(list(parallel_stream_unzip(f, member_filter=member_filter)), [])
+        self.assertEqual([size for name, size, compression in filtered], [4294967296])
+
+    def test_parallel_stream_unzip_member_filter_and_abandon(self):
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for i in range(0, 8):
+                zf.writestr(f'{i}.txt', bytes([i]) * 1000000)
+        zip_bytes = file.getvalue()
+
+        files = []
+        for name, size, chunks in parallel_stream_unzip(zip_bytes, chunk_size=1000, member_filter=lambda name, size, compression: name != b'3.txt'):
+            if name == b'1.txt':
+                next(chunks)
+                chunks.close()
+                continue
+            files.append((name, b''.join(chunks)))
+
+        self.assertEqual(files, [
+            (f'{i}.txt'.encode(), bytes([i]) * 1000000)
+            for i in (0, 2, 4, 5, 6, 7)
+        ])
+
+        with self.assertRaises(UnfinishedIterationError):
+            for name, size, chunks in parallel_stream_unzip(zip_bytes, chunk_size=1000):
+                pass
+
+    def test_parallel_stream_unzip_bad_crc_32(self):
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr('first.txt', b'-' * 100000)
+            zf.writestr('second.txt', b'*' * 100000)
+        zip_bytes = file.getvalue()
+        zip_bytes = zip_bytes[0:16] + bytes([(zip_bytes[16] + 1) % 256]) + zip_bytes[17:]
+
+        with self.assertRaises(CRC32IntegrityError):
+            for name, size, chunks in parallel_stream_unzip(zip_bytes):
+                for chunk in chunks:
+                    pass
+
+    def test_parallel_stream_unzip_not_zip(self):
+        with self.assertRaises(MissingEndOfCentralDirectoryError):
+            next(parallel_stream_unzip(b'This is not a zip file'))
+
+    def test_deflate_index(self):
+        rnd = random.Random()
+        rnd.seed(1)
+
+        # Text, incompressible bytes that are in stored blocks, and a long run of one byte
+        content = b''.join((
+            b''.join(b'%d,%s\n' % (i, uuid.UUID(int=rnd.getrandbits(128), version=4).hex.encode()) for i in range(0, 20000)),
+            bytes(rnd.getrandbits(8) for _ in range(0, 100000)),
+            b'-' * 1000000,
+            b''.join(b'%d\n' % (rnd.getrandbits(16),) for _ in range(0, 20000)),
+        ))
+        offsets = [0, 1, 65535, 65536, 700000, 1500000, len(content) - 1, len(content), len(content) + 1] + \
+            [rnd.randrange(0, len(content)) for _ in range(0, 10)]
+
+        def get_zip_bytes(file, compresslevel):
+            with zipfile.ZipFile(file, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as zf:
+                zf.writestr('first.txt', b'Some content')
+                zf.writestr('second.csv', content)
+            return file.getvalue()
+
+        for compresslevel, file_class in itertools.product((0, 1, 9), (io.BytesIO, UnseekableBytesIO)):
+            zip_bytes = get_zip_bytes(file_class(), compresslevel)
+            index = deflate_index(zip_bytes, b'second.csv', spacing=65536)
+            self.assertLess(len(deflate_index(zip_bytes, b'second.csv')), len(index))
+
+            for offset, zip_input in itertools.product(offsets, (zip_bytes, io.BytesIO(zip_bytes))):
+                with self.subTest(compresslevel=compresslevel, file_class=file_class, offset=offset, zip_input=type(zip_input)):
+                    self.assertEqual(b''.join(unzip_from_deflate_index(zip_input, index, offset, chunk_size=10000)), content[offset:])
+
+        with open('fixtures/macos_10_14_5_multiple_files.zip', 'rb') as f:
+            index = deflate_index(f, b'second.txt', spacing=1)
+            self.assertEqual(b''.join(unzip_from_deflate_index(f, index, 7)), b'Contents of the second file'[7:])
+
+    def test_deflate_index_errors(self):
+        file = io.BytesIO()
+        with zipfile.ZipFile(file, 'w') as zf:
+            zf.writestr('stored.txt', b'-' * 100000, compress_type=zipfile.ZIP_STORED)
+            zf.writestr('deflated.txt', b'*' * 100000, compress_type=zipfile.ZIP_DEFLATED)
+        zip_bytes = file.getvalue()
+
+        with self.assertRaises(MissingMemberFileError):
+            deflate_index(zip_bytes, b'missing.txt')
+
+        with self.assertRaises(UnsupportedCompressionTypeError):
+            deflate_index(zip_bytes, b'stored.txt')
+
+        with self.assertRaises(UnexpectedSignatureError):
+            next(unzip_from_deflate_index(zip_bytes, b'Not an index' * 4))
+
+        crc_32_offset = zip_bytes.rindex(b'PK\x01\x02') + 16
+        bad_zip_bytes = zip_bytes[:crc_32_offset] + bytes([(zip_bytes[crc_32_offset] + 1) % 256]) + zip_bytes[crc_32_offset + 1:]
+        with self.assertRaises(CRC32IntegrityError):
+            deflate_index(bad_zip_bytes, b'deflated.txt')